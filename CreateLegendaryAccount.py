@@ -5,7 +5,10 @@ from datetime import datetime
 project_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, project_dir)
 
-from app import app, db, User, OwnedBird
+from app import (
+    app, db, User, OwnedBird, open_ledger, record_ledger,
+    bump_ownership_count, ownership_bit, ownership_bits_for,
+)
 from werkzeug.security import generate_password_hash
 
 USERNAME = "ShinyBird"
@@ -33,13 +36,23 @@ def create_god_account():
             db.session.commit()
             print(f"Created new user: {USERNAME}")
 
+        # Record the grant so the ledger still matches the balance; an
+        # account from before the ledger gets its opening balance first
+        open_ledger(db.session, user)
+        record_ledger(
+            db.session,
+            user,
+            "admin_adjust",
+            xp=999_999 - (user.xp or 0),
+            levels=LEVEL - (user.level or 1),
+            seeds=SEEDS - (user.seeds or 0),
+        )
+
         user.seeds = SEEDS
-        user.total_seeds_earned = SEEDS + 999_999
         user.level = LEVEL
         user.xp = 999_999
-        user.current_streak = 9999
-        user.longest_streak = 9999
-        user.last_activity_date = datetime.utcnow().date()
+        user.streak = 9999
+        user.last_streak_date = datetime.utcnow().date()
 
         from app import AVAILABLE_BIRDS
         legendary = next((b for b in AVAILABLE_BIRDS if b["rarity"] == "legendary"), None)
@@ -51,6 +64,11 @@ def create_god_account():
 
         print(f"Chosen legendary bird: {bird_name} (ID {bird_id})")
 
+        # Keep the ownership bitmap and per-bird counters in step with OwnedBird
+        bits = user.owned_bits
+        if bits is None:
+            bits = ownership_bits_for(db.session, user)
+
         owned = OwnedBird.query.filter_by(user_id=user.id, bird_id=bird_id).first()
         if not owned:
             owned = OwnedBird(
@@ -59,10 +77,16 @@ def create_god_account():
                 is_shiny=True
             )
             db.session.add(owned)
+            bump_ownership_count(db.session, bird_id, True, 1)
             print("Gave shiny legendary bird!")
         else:
-            owned.is_shiny = True
+            if not owned.is_shiny:
+                owned.is_shiny = True
+                bits &= ~ownership_bit(bird_id, False)
+                bump_ownership_count(db.session, bird_id, False, -1)
+                bump_ownership_count(db.session, bird_id, True, 1)
             print("Upgraded existing bird > SHINY!")
+        user.owned_bits = bits | ownership_bit(bird_id, True)
 
         # Equip it
         user.current_bird_id = bird_id
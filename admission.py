@@ -0,0 +1,176 @@
+"""
+BirdQuest - Admission control
+Tracks requests in flight, queue wait and service time per route class and
+turns low-priority requests away (503 + Retry-After) when the worker is
+under pressure, so a slow database doesn't starve habit completions or the
+healthcheck.
+
+Pressure is the largest of three signals, each 1.0 at saturation:
+
+    in flight     other requests running in this worker / its threads
+    queue wait    time since the proxy's X-Request-Start / max_wait
+    service time  recent request duration (decaying) / max_wait
+
+The last one is what a sync worker sees: with one request at a time, long
+requests mean a growing backlog at the socket.
+"""
+
+import math
+import threading
+import time
+
+# Route classes and the pressure at which each starts being shed
+# (None: never shed). Writes (API calls and form posts such as logging in)
+# are what users are waiting on, pages other than the few the app marks
+# optional are how they get to them, and static files don't touch the
+# database.
+SHED_AT = {
+    "write": None,
+    "page": None,
+    "static": None,
+    "optional_page": 0.75,
+    "api_read": 0.5,
+}
+
+# Classes whose duration says something about the database
+_DB_BOUND = {"write", "page", "optional_page", "api_read"}
+
+# How quickly the service-time signal fades once slow requests stop
+_DECAY_SECONDS = 5.0
+_SMOOTHING = 0.2
+
+
+def parse_request_start(value, now=None):
+    """Seconds a request waited since X-Request-Start, or None.
+
+    Accepts "t=<value>" or a bare number in seconds, milliseconds or
+    microseconds since the epoch (nginx, Heroku and HAProxy styles).
+    """
+    if not value:
+        return None
+    try:
+        started = float(value.strip().removeprefix("t="))
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    wait = (time.time() if now is None else now) - started
+    # Clock skew between proxy and worker can make it negative
+    return max(wait, 0.0)
+
+
+class AdmissionController:
+    """Decides per request whether to admit it, and keeps the numbers."""
+
+    def __init__(self, capacity=1, max_wait=0.5, retry_after=5):
+        self.capacity = max(int(capacity), 1)
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._service = 0.0
+        self._service_at = time.monotonic()
+        self._classes = {
+            name: {
+                "in_flight": 0,
+                "peak_in_flight": 0,
+                "admitted": 0,
+                "completed": 0,
+                "shed": 0,
+                "queue_wait_total": 0.0,
+                "queue_wait_count": 0,
+                "service_total": 0.0,
+            }
+            for name in SHED_AT
+        }
+        self._shed_reasons = {"in_flight": 0, "queue_wait": 0, "service_time": 0}
+
+    def _service_time(self, now):
+        # Exponential decay, so the signal clears without new requests
+        elapsed = now - self._service_at
+        return self._service * math.exp(-elapsed / _DECAY_SECONDS)
+
+    def _signals(self, queue_wait, now):
+        return {
+            "in_flight": self._in_flight / self.capacity,
+            "queue_wait": (queue_wait or 0.0) / self.max_wait,
+            "service_time": self._service_time(now) / self.max_wait,
+        }
+
+    def admit(self, route_class, queue_wait=None, exempt=False):
+        """Returns True to run the request; release() must follow.
+
+        False means it was shed and the caller should answer 503 with
+        Retry-After: self.retry_after.
+        """
+        now = time.monotonic()
+        with self._lock:
+            counters = self._classes[route_class]
+            if queue_wait is not None:
+                counters["queue_wait_total"] += queue_wait
+                counters["queue_wait_count"] += 1
+
+            threshold = SHED_AT[route_class]
+            if threshold is not None and not exempt:
+                signals = self._signals(queue_wait, now)
+                reason = max(signals, key=signals.get)
+                if signals[reason] >= threshold:
+                    counters["shed"] += 1
+                    self._shed_reasons[reason] += 1
+                    return False
+
+            self._in_flight += 1
+            counters["admitted"] += 1
+            counters["in_flight"] += 1
+            counters["peak_in_flight"] = max(
+                counters["peak_in_flight"], counters["in_flight"]
+            )
+            return True
+
+    def release(self, route_class, duration, timed=True):
+        """timed=False keeps requests that are long by design (streams,
+        exports) out of the service-time signal."""
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight -= 1
+            counters = self._classes[route_class]
+            counters["in_flight"] -= 1
+            counters["completed"] += 1
+            counters["service_total"] += duration
+            if timed and route_class in _DB_BOUND:
+                current = self._service_time(now)
+                self._service = current + _SMOOTHING * (duration - current)
+                self._service_at = now
+
+    def metrics(self):
+        """Admitted/shed counts and timings per route class, for this worker."""
+        now = time.monotonic()
+        with self._lock:
+            signals = self._signals(None, now)
+            classes = {}
+            for name, c in self._classes.items():
+                classes[name] = {
+                    "in_flight": c["in_flight"],
+                    "peak_in_flight": c["peak_in_flight"],
+                    "admitted": c["admitted"],
+                    "shed": c["shed"],
+                    "mean_queue_wait_ms": (
+                        round(c["queue_wait_total"] / c["queue_wait_count"] * 1000, 1)
+                        if c["queue_wait_count"]
+                        else None
+                    ),
+                    "mean_service_ms": (
+                        round(c["service_total"] / c["completed"] * 1000, 1)
+                        if c["completed"]
+                        else None
+                    ),
+                }
+            shed_reasons = dict(self._shed_reasons)
+        return {
+            "capacity": self.capacity,
+            "pressure": {name: round(value, 3) for name, value in signals.items()},
+            "shed_reasons": shed_reasons,
+            "classes": classes,
+        }
@@ -1,21 +1,39 @@
+import hashlib
+import heapq
+import hmac
+import itertools
+import json
+import mimetypes
 import os
 import random
-from datetime import datetime, timedelta
+import secrets
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from functools import partial, wraps
 
+import click
 from flask import (
     Flask,
+    Response,
+    abort,
     flash,
+    g,
+    get_flashed_messages,
     jsonify,
     redirect,
     render_template,
     request,
+    send_from_directory,
     session,
+    stream_with_context,
     url_for,
 )
 from flask_login import (
     LoginManager,
     UserMixin,
     login_required,
+    login_url,
     login_user,
     logout_user,
 )
@@ -23,32 +41,180 @@ from flask_login import (
     current_user as _current_user,
 )
 from flask_sqlalchemy import SQLAlchemy
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup, escape
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from admission import AdmissionController, parse_request_start
+from cache import Cache
+from compression import ENCODINGS, CompressionStats, compress, minify_html
+from export import EXPORT_BATCH_SIZE, buffered, csv_lines, ndjson_lines
+from group_commit import GroupCommitter
+from live import Broker, create_broker, format_sse
+from purger import Purger
+from sharding import (
+    GLOBAL,
+    RoutingSession,
+    activate,
+    all_shards,
+    shard_for,
+    shard_names,
+    use_shard,
+)
+
 app = Flask(__name__)
 
+# "single" runs one worker; "scale" and "live" run several workers or
+# replicas and need shared secret and state (see gunicorn.conf.py)
+DEPLOY_PROFILE = os.environ.get("DEPLOY_PROFILE", "single")
+
+
+def load_secret_key():
+    """Return SECRET_KEY, or the contents of SECRET_KEY_FILE, if either is set."""
+    if os.environ.get("SECRET_KEY"):
+        return os.environ["SECRET_KEY"]
+    key_file = os.environ.get("SECRET_KEY_FILE")
+    if key_file:
+        with open(key_file) as f:
+            return f.read().strip() or None
+    return None
+
+
 # Configuration for Railway deployment
-app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", os.urandom(24).hex())
+shared_secret_key = load_secret_key()
+if shared_secret_key is None and DEPLOY_PROFILE != "single":
+    raise RuntimeError(
+        f"DEPLOY_PROFILE={DEPLOY_PROFILE} needs SECRET_KEY or SECRET_KEY_FILE so "
+        "every worker signs sessions with the same key"
+    )
+app.config["SECRET_KEY"] = shared_secret_key or os.urandom(24).hex()
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
     "DATABASE_URL", "sqlite:///birdquest.db"
 )
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Sharding: SHARDS=N spreads the per-user tables over N databases, named by
+# SHARD_URL_TEMPLATE; DATABASE_URL then holds only the global tables (see
+# sharding.py). 0 keeps everything in DATABASE_URL.
+SHARDS = int(os.environ.get("SHARDS", 0))
+SHARD_URL_TEMPLATE = os.environ.get(
+    "SHARD_URL_TEMPLATE", "sqlite:///birdquest-{shard}.db"
+)
+SHARD_NAMES = shard_names(SHARDS)
+app.config["SQLALCHEMY_BINDS"] = {
+    name: SHARD_URL_TEMPLATE.format(shard=name) for name in SHARD_NAMES
+}
+
+# Compiled templates persist across restarts and are shared by all workers;
+# Jinja recompiles any template whose source has changed
+TEMPLATE_CACHE_DIR = os.environ.get(
+    "TEMPLATE_CACHE_DIR", os.path.join(app.instance_path, "jinja_cache")
+)
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+app.jinja_options = {
+    **app.jinja_options,
+    "bytecode_cache": FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+}
+app.config["ADMIN_TOKEN"] = os.environ.get("ADMIN_TOKEN")
+# Server-Sent Events hold a connection open, so only enable them on
+# servers with threaded or async workers (see gunicorn.conf.py)
+app.config["LIVE_UPDATES"] = os.environ.get("LIVE_UPDATES", "0") == "1"
+
 # Fix for Railway PostgreSQL URL (if using postgres)
 if app.config["SQLALCHEMY_DATABASE_URI"].startswith("postgres://"):
     app.config["SQLALCHEMY_DATABASE_URI"] = app.config[
         "SQLALCHEMY_DATABASE_URI"
     ].replace("postgres://", "postgresql://", 1)
 
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={"class_": RoutingSession} if SHARDS else {})
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = "login"
 
+# Shared cache (in-process unless CACHE_URL points at Redis)
+cache = Cache.from_url(os.environ.get("CACHE_URL"))
+CACHE_TTL = int(os.environ.get("CACHE_TTL", 300))
+
+# Pub/sub for live updates (in-process unless LIVE_BROKER_URL points at Redis)
+broker = create_broker(os.environ.get("LIVE_BROKER_URL"))
+LIVE_STREAM_MAX_SECONDS = int(os.environ.get("LIVE_STREAM_MAX_SECONDS", 300))
+LIVE_KEEPALIVE_SECONDS = 15
+
+# Group commit: batch concurrent habit completions in a worker into shared
+# transactions (needs threaded workers to have anything to batch)
+GROUP_COMMIT = os.environ.get("GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", 64))
+GROUP_COMMIT_MAX_DELAY_MS = float(os.environ.get("GROUP_COMMIT_MAX_DELAY_MS", 5))
+GROUP_COMMIT_TIMEOUT = 10
+
+# Admission control: shed low-priority requests with a 503 when the worker
+# is busy or requests are slow, before writes and the healthcheck suffer
+ADMISSION_CONTROL = os.environ.get("ADMISSION_CONTROL", "0") == "1"
+ADMISSION_MAX_WAIT_MS = float(os.environ.get("ADMISSION_MAX_WAIT_MS", 500))
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", 5))
+# Never shed: the healthcheck, the data behind the dashboard, and /metrics
+ADMISSION_EXEMPT = {"home", "dashboard_state", "metrics"}
+# Pages that can wait; every other page, and every form post, is never shed
+ADMISSION_OPTIONAL_PAGES = {"leaderboard"}
+# Long by design, so their duration says nothing about load
+ADMISSION_UNTIMED = {"live_events", "export_data", "export_database"}
+# gunicorn.conf.py sets the capacity of threaded workers after forking
+admission = AdmissionController(
+    max_wait=ADMISSION_MAX_WAIT_MS / 1000,
+    retry_after=ADMISSION_RETRY_AFTER,
+)
+
+# Compression of rendered responses (static files are precompressed instead)
+COMPRESS_RESPONSES = os.environ.get("COMPRESS_RESPONSES", "1") == "1"
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 500))
+COMPRESSIBLE_TYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+}
+MINIFY_HTML = os.environ.get("MINIFY_HTML", "0") == "1"
+compression_stats = CompressionStats()
+
 # Constants
 XP_PER_LEVEL = 50
 SEEDS_PER_LEVEL = 15
 SHINY_CHANCE = 0.01
+# A balance snapshot is written every this many ledger entries per user
+LEDGER_SNAPSHOT_INTERVAL = 50
+
+# CompletedHabit rows older than this many days can be compacted into
+# CompletionArchive bitmaps (flask compact-completions)
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 90))
+
+# Completions of deleted habits are purged in chunks of this many rows,
+# pausing between chunks so other writers get the lock
+PURGE_CHUNK_SIZE = int(os.environ.get("PURGE_CHUNK_SIZE", 500))
+PURGE_PAUSE_MS = int(os.environ.get("PURGE_PAUSE_MS", 50))
+# Seconds between passes that sweep up deletes no running worker was woken for
+PURGE_INTERVAL = int(os.environ.get("PURGE_INTERVAL", 3600))
+
+# Leaderboard
+LEADERBOARD_SIZE = 50
+LEADERBOARD_CACHE_TTL = int(os.environ.get("LEADERBOARD_CACHE_TTL", 30))
+# Periods with a leaderboard of their own, ranked by XP earned in them
+LEADERBOARD_WINDOWS = ("week", "month")
+
+# Groups (classrooms) are capped at this many members; boards only ever
+# read a group's top rows and the viewer's rank, so the cap is about
+# group size, not query cost
+GROUP_MAX_MEMBERS = int(os.environ.get("GROUP_MAX_MEMBERS", 500))
+GROUP_CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # no 0/O, 1/I
+GROUP_CODE_LENGTH = 8
+
+# Seconds the global "players owning each bird" numbers are reused
+COLLECTION_STATS_TTL = int(os.environ.get("COLLECTION_STATS_TTL", 60))
+
+# How long browsers and CDNs may reuse the dashboard shell without revalidating
+DASHBOARD_SHELL_MAX_AGE = int(os.environ.get("DASHBOARD_SHELL_MAX_AGE", 300))
 
 # Rarity multipliers for seeds
 RARITY_MULTIPLIERS = {
@@ -152,7 +318,11 @@ STUDENT_HABITS = [
 
 
 # Database Models
+# When sharded (SHARDS), every model lives in its users' shards unless it
+# sets __sharded__ = False; a row's user is its user_id, or __shard_key__.
 class User(UserMixin, db.Model):
+    __shard_key__ = "id"
+
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -168,11 +338,41 @@ class User(UserMixin, db.Model):
         db.Date, nullable=True
     )  # Date when streak was last incremented
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Denormalized copy of the user's OwnedBird rows as a hex bitmap (see
+    # ownership_bit); NULL until backfilled. `flask check-ownership` verifies it.
+    owned_birds_bitmap = db.Column(db.String(32), nullable=True)
+    # Sequence number of the user's latest LedgerEntry; NULL until backfilled
+    ledger_seq = db.Column(db.Integer, nullable=True)
 
     owned_birds = db.relationship("OwnedBird", backref="owner", lazy=True)
     completed_habits = db.relationship("CompletedHabit", backref="user", lazy=True)
     custom_habits = db.relationship("CustomHabit", backref="user", lazy=True)
 
+    @property
+    def owned_bits(self):
+        if self.owned_birds_bitmap is None:
+            return None
+        return int(self.owned_birds_bitmap, 16)
+
+    @owned_bits.setter
+    def owned_bits(self, bits):
+        self.owned_birds_bitmap = None if bits is None else format(bits, "x")
+
+
+class UserDirectory(db.Model):
+    """Every username and email, in the global database when sharded.
+
+    Registration allocates user ids here, so ids are unique across shards
+    and a login finds the user's shard from their username. Unused (and
+    empty) when not sharded.
+    """
+
+    __sharded__ = False
+
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+
 
 # Type alias for current_user to help IDE recognize User model attributes
 current_user: User = _current_user  # type: ignore[assignment]
@@ -194,6 +394,12 @@ class CompletedHabit(db.Model):
     completed_at = db.Column(db.DateTime, default=datetime.utcnow)
     date = db.Column(db.Date, default=datetime.utcnow().date)
 
+    __table_args__ = (
+        db.Index(
+            "ix_completed_habit_user_habit", "user_id", "habit_id", "is_custom", "date"
+        ),
+    )
+
 
 class CustomHabit(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -202,6 +408,9 @@ class CustomHabit(db.Model):
     xp = db.Column(db.Integer, default=10)
     category = db.Column(db.String(50), default="custom")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set when the user deletes the habit; the purger then removes its
+    # completions and finally the row itself
+    deleted_at = db.Column(db.DateTime, nullable=True)
 
 
 class HiddenHabit(db.Model):
@@ -209,13 +418,201 @@ class HiddenHabit(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     habit_id = db.Column(db.Integer, nullable=False)
     hidden_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set once the purger has removed the habit's completions
+    purged_at = db.Column(db.DateTime, nullable=True)
+
+
+class CompletionArchive(db.Model):
+    """One habit's completions in one year, compacted into a day bitmap.
+
+    Bit n of `days_bitmap` (hex) is set when the habit was done on day n of
+    the year (0 = January 1st). `flask compact-completions` moves old
+    CompletedHabit rows here; completions_by_day() reads both.
+    """
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    habit_id = db.Column(db.Integer, primary_key=True)
+    is_custom = db.Column(db.Boolean, primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    days_bitmap = db.Column(db.String(92), nullable=False, default="0")
+
+    @property
+    def days(self):
+        return int(self.days_bitmap, 16)
+
+    @days.setter
+    def days(self, bits):
+        self.days_bitmap = format(bits, "x")
+
+
+class HabitStreak(db.Model):
+    """Consecutive days one habit was done, kept current by complete_habit.
+
+    `current` is the run ending on `last_date`, so it has lapsed once
+    last_date is before yesterday (see live_streak). `flask
+    rebuild-habit-streaks` recomputes every row from the history.
+    """
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    habit_id = db.Column(db.Integer, primary_key=True)
+    is_custom = db.Column(db.Boolean, primary_key=True)
+    current = db.Column(db.Integer, nullable=False, default=0)
+    longest = db.Column(db.Integer, nullable=False, default=0)
+    last_date = db.Column(db.Date, nullable=True)
+
+
+class XpBucket(db.Model):
+    """XP a user earned in one leaderboard period, kept by complete_habit.
+
+    period_start is the Monday of the week or the 1st of the month. A new
+    period simply starts new rows; `flask prune-xp-buckets` drops old ones.
+    """
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    period = db.Column(db.String(10), primary_key=True)  # "week" or "month"
+    period_start = db.Column(db.Date, primary_key=True)
+    xp = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index("ix_xp_bucket_period_xp", "period", "period_start", "xp"),
+    )
+
+
+class Group(db.Model):
+    """A classroom or circle of friends with a leaderboard of its own.
+
+    Groups are global; memberships live in their user's shard.
+    """
+
+    __sharded__ = False
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    # Shared with students so they can join
+    join_code = db.Column(db.String(16), unique=True, nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class GroupMember(db.Model):
+    """Membership of a user in a group.
+
+    The primary key serves a group's member list (and so its leaderboard);
+    the second index serves a user's groups.
+    """
+
+    group_id = db.Column(db.Integer, db.ForeignKey("group.id"), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index("ix_group_member_user", "user_id", "group_id"),)
+
+
+class BirdOwnershipCount(db.Model):
+    """Players owning each bird, kept current by buy_bird and registration.
+
+    Counts follow OwnedBird rows; `flask reconcile-collection-stats` corrects
+    any drift. When sharded, each shard counts its own players.
+    """
+
+    bird_id = db.Column(db.Integer, primary_key=True)
+    is_shiny = db.Column(db.Boolean, primary_key=True)
+    owners = db.Column(db.Integer, nullable=False, default=0)
+
+
+class LedgerEntry(db.Model):
+    """Append-only record of every change to a user's XP, level and seeds.
+
+    Summing a user's deltas from level 1 with no XP or seeds gives their
+    current balance. Entries are never updated or deleted.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # 1, 2, ... per user
+    kind = db.Column(db.String(20), nullable=False)
+    xp_delta = db.Column(db.Integer, nullable=False, default=0)
+    level_delta = db.Column(db.Integer, nullable=False, default=0)
+    seeds_delta = db.Column(db.Integer, nullable=False, default=0)
+    ref = db.Column(db.String(40), nullable=True)  # habit or bird involved
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index("ix_ledger_entry_user_seq", "user_id", "seq"),)
+
+
+class BalanceSnapshot(db.Model):
+    """A user's balance after their first `seq` ledger entries."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    xp = db.Column(db.Integer, nullable=False)
+    level = db.Column(db.Integer, nullable=False)
+    seeds = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index("ix_balance_snapshot_user_seq", "user_id", "seq"),)
+
+
+GLOBAL_TABLES = {Group.__table__, UserDirectory.__table__}
+
+
+def shard_of(user_id):
+    """The shard holding a user's rows, or None when not sharded."""
+    return shard_for(user_id, SHARDS) if SHARDS else None
+
+
+def each_shard():
+    """Shards for maintenance to work through one at a time."""
+    return SHARD_NAMES or [None]
+
+
+def databases():
+    """(shard, engine, tables) for each database, the global one first."""
+    tables = db.metadata.sorted_tables
+    if not SHARDS:
+        return [(None, db.engine, tables)]
+    return [(GLOBAL, db.engine, [t for t in tables if t in GLOBAL_TABLES])] + [
+        (shard, db.engines[shard], [t for t in tables if t not in GLOBAL_TABLES])
+        for shard in SHARD_NAMES
+    ]
+
+
+def count_rows(query):
+    """query.count(), summed over the shards when it reads all of them."""
+    counted = db.select(db.func.count()).select_from(query.order_by(None).subquery())
+    return sum(query.session.execute(counted).scalars())
+
+
+def find_user(**by):
+    """The User with this username or email (via the directory when sharded)."""
+    if not SHARDS:
+        return User.query.filter_by(**by).first()
+    entry = UserDirectory.query.filter_by(**by).first()
+    return db.session.get(User, entry.id) if entry else None
 
 
 @login_manager.user_loader
 def load_user(user_id):
+    # The rest of the request reads and writes this user's shard
+    activate(shard_of(user_id))
     return User.query.get(int(user_id))
 
 
+@app.teardown_request
+def leave_shard(exc):
+    activate(None)
+
+
+@login_manager.unauthorized_handler
+def unauthorized():
+    # API callers get JSON they can act on instead of a login page redirect
+    if request.path.startswith("/api/"):
+        return jsonify({"success": False, "message": "Login required"}), 401
+    flash(login_manager.login_message, login_manager.login_message_category)
+    return redirect(login_url(login_manager.login_view, request.url))
+
+
 # Helper Functions
 def get_bird_by_id(bird_id):
     for bird in AVAILABLE_BIRDS:
@@ -224,6 +621,15 @@ def get_bird_by_id(bird_id):
     return AVAILABLE_BIRDS[0]
 
 
+def is_bird_id(bird_id):
+    """Whether a client-sent bird_id names a bird in the shop."""
+    return (
+        isinstance(bird_id, int)
+        and not isinstance(bird_id, bool)
+        and any(bird["id"] == bird_id for bird in AVAILABLE_BIRDS)
+    )
+
+
 def calculate_xp_for_level(level):
     return XP_PER_LEVEL * level
 
@@ -241,15 +647,21 @@ def check_and_update_streak(user):
     today = datetime.utcnow().date()
 
     # If user has a last_streak_date, check if they missed a day
+    streak_reset = False
     if user.last_streak_date:
         diff = (today - user.last_streak_date).days
         # If more than 1 day has passed since last task completion, reset streak
-        if diff > 1:
+        if diff > 1 and user.streak:
             user.streak = 0
+            streak_reset = True
 
     user.last_login_date = today
     db.session.commit()
 
+    if streak_reset:
+        invalidate_leaderboard(db.session, user)
+        publish_user_state(db.session, user)
+
 
 def update_streak_on_task(user):
     """Update streak when user completes their first task of the day."""
@@ -278,305 +690,1928 @@ def update_streak_on_task(user):
     return True  # Streak was updated
 
 
+def get_hidden_habit_ids(user):
+    def compute():
+        return {h.habit_id for h in HiddenHabit.query.filter_by(user_id=user.id).all()}
+
+    return cache.get_or_compute("hidden", "ids", compute, ttl=CACHE_TTL, scope=user.id)
+
+
 def get_all_habits(user):
-    # Get hidden habit IDs for this user
-    hidden_ids = {
-        h.habit_id for h in HiddenHabit.query.filter_by(user_id=user.id).all()
+    def compute():
+        # Filter out hidden built-in habits
+        hidden_ids = get_hidden_habit_ids(user)
+        habits = [h for h in STUDENT_HABITS if h["id"] not in hidden_ids]
+
+        custom = CustomHabit.query.filter_by(user_id=user.id, deleted_at=None).all()
+        for h in custom:
+            habits.append(
+                {
+                    "id": f"custom_{h.id}",
+                    "name": h.name,
+                    "xp": h.xp,
+                    "category": h.category,
+                    "is_custom": True,
+                }
+            )
+        return habits
+
+    habits = cache.get_or_compute(
+        "habits", "all", compute, ttl=CACHE_TTL, scope=user.id
+    )
+    return with_streaks(habits, get_habit_streaks(user))
+
+
+def get_habit_streaks(user):
+    """{(is_custom, habit_id): HabitStreak} for the user (not cached: one
+    primary-key range read, and the counters change with every completion)."""
+    return {
+        (streak.is_custom, streak.habit_id): streak
+        for streak in HabitStreak.query.filter_by(user_id=user.id)
     }
 
-    # Filter out hidden built-in habits
-    habits = [h for h in STUDENT_HABITS if h["id"] not in hidden_ids]
 
-    custom = CustomHabit.query.filter_by(user_id=user.id).all()
-    for h in custom:
-        habits.append(
-            {
-                "id": f"custom_{h.id}",
-                "name": h.name,
-                "xp": h.xp,
-                "category": h.category,
-                "is_custom": True,
-            }
-        )
-    return habits
+def habit_key(habit):
+    """(is_custom, numeric id) of a habit dict from get_all_habits."""
+    if habit.get("is_custom"):
+        return True, int(str(habit["id"]).replace("custom_", ""))
+    return False, habit["id"]
 
 
-def get_completed_today(user):
+def with_streaks(habits, streaks):
+    """Copies of habits with their "streak" and "longest_streak"."""
     today = datetime.utcnow().date()
-    completed = CompletedHabit.query.filter_by(user_id=user.id, date=today).all()
-    return [{"habit_id": c.habit_id, "is_custom": c.is_custom} for c in completed]
-
+    marked = []
+    for habit in habits:
+        streak = streaks.get(habit_key(habit))
+        if streak is None:
+            marked.append(dict(habit, streak=0, longest_streak=0))
+        else:
+            marked.append(
+                dict(
+                    habit,
+                    streak=live_streak(streak.current, streak.last_date, today),
+                    longest_streak=streak.longest,
+                )
+            )
+    return marked
 
-# Routes
-@app.route("/")
-def home():
-    return render_template("home.html")
 
+def ownership_bit(bird_id, is_shiny):
+    """Bit 2*id marks the normal bird, bit 2*id+1 the shiny one."""
+    return 1 << (2 * bird_id + (1 if is_shiny else 0))
 
-@app.route("/register", methods=["GET", "POST"])
-def register():
-    if current_user.is_authenticated:
-        return redirect(url_for("dashboard"))
 
-    if request.method == "POST":
-        username = request.form.get("username")
-        email = request.form.get("email")
-        password = request.form.get("password")
-        confirm_password = request.form.get("confirm_password")
+def ownership_bits_for(session, user):
+    """Rebuild the ownership bitmap from the user's OwnedBird rows."""
+    bits = 0
+    rows = session.query(OwnedBird.bird_id, OwnedBird.is_shiny).filter_by(
+        user_id=user.id
+    )
+    for bird_id, is_shiny in rows:
+        bits |= ownership_bit(bird_id, is_shiny)
+    return bits
 
-        if not username or not email or not password:
-            flash("All fields are required.", "error")
-            return redirect(url_for("register"))
 
-        if password != confirm_password:
-            flash("Passwords do not match.", "error")
-            return redirect(url_for("register"))
+def get_owned_birds_map(user):
+    """Map bird_id -> {"normal": bool, "shiny": bool} for the user's birds."""
+    bits = user.owned_bits
+    if bits is None:
+        # Not backfilled yet (see init_db)
+        bits = ownership_bits_for(db.session, user)
 
-        if User.query.filter_by(username=username).first():
-            flash("Username already exists.", "error")
-            return redirect(url_for("register"))
+    owned_dict = {}
+    for bird in AVAILABLE_BIRDS:
+        normal = bool(bits & ownership_bit(bird["id"], False))
+        shiny = bool(bits & ownership_bit(bird["id"], True))
+        if normal or shiny:
+            owned_dict[bird["id"]] = {"normal": normal, "shiny": shiny}
+    return owned_dict
+
+
+def open_ledger(session, user):
+    """Start the ledger of a user who has none (ledger_seq is None).
+
+    Existing balances go in as an opening_balance entry, so entries added
+    after it still sum to the user's balances.
+    """
+    if user.ledger_seq is not None:
+        return
+    if user.xp or user.level != 1 or user.seeds:
+        record_ledger(
+            session,
+            user,
+            "opening_balance",
+            xp=user.xp,
+            levels=user.level - 1,
+            seeds=user.seeds,
+        )
+    else:
+        user.ledger_seq = 0
+
+
+def record_ledger(session, user, kind, xp=0, levels=0, seeds=0, ref=None):
+    """Add a LedgerEntry to the caller's transaction (it commits).
+
+    Every LEDGER_SNAPSHOT_INTERVAL entries a BalanceSnapshot computed from
+    the ledger itself is added too, so no balance needs more than that many
+    entries on top of a snapshot.
+    """
+    user.ledger_seq = (user.ledger_seq or 0) + 1
+    session.add(
+        LedgerEntry(
+            user_id=user.id,
+            seq=user.ledger_seq,
+            kind=kind,
+            xp_delta=xp,
+            level_delta=levels,
+            seeds_delta=seeds,
+            ref=None if ref is None else str(ref),
+        )
+    )
+    if user.ledger_seq % LEDGER_SNAPSHOT_INTERVAL == 0:
+        session.flush()
+        balance_xp, balance_level, balance_seeds = ledger_balances(session, [user.id])[
+            user.id
+        ]
+        session.add(
+            BalanceSnapshot(
+                user_id=user.id,
+                seq=user.ledger_seq,
+                xp=balance_xp,
+                level=balance_level,
+                seeds=balance_seeds,
+            )
+        )
 
-        if User.query.filter_by(email=email).first():
-            flash("Email already registered.", "error")
-            return redirect(url_for("register"))
 
-        user = User(
-            username=username,
-            email=email,
-            password_hash=generate_password_hash(password),
+def ledger_balances(session, user_ids, use_snapshots=True):
+    """user_id -> (xp, level, seeds) according to the ledger.
+
+    Starts from each user's latest snapshot and adds the entries after it;
+    with use_snapshots=False, sums every entry from the start.
+    """
+    balances = {user_id: (0, 1, 0) for user_id in user_ids}
+    tail = session.query(
+        LedgerEntry.user_id,
+        db.func.sum(LedgerEntry.xp_delta),
+        db.func.sum(LedgerEntry.level_delta),
+        db.func.sum(LedgerEntry.seeds_delta),
+    ).filter(LedgerEntry.user_id.in_(user_ids))
+
+    if use_snapshots:
+        latest = (
+            session.query(
+                BalanceSnapshot.user_id, db.func.max(BalanceSnapshot.seq).label("seq")
+            )
+            .filter(BalanceSnapshot.user_id.in_(user_ids))
+            .group_by(BalanceSnapshot.user_id)
+            .subquery()
+        )
+        snapshots = session.query(BalanceSnapshot).join(
+            latest,
+            (BalanceSnapshot.user_id == latest.c.user_id)
+            & (BalanceSnapshot.seq == latest.c.seq),
+        )
+        for snapshot in snapshots:
+            balances[snapshot.user_id] = (snapshot.xp, snapshot.level, snapshot.seeds)
+        tail = tail.outerjoin(latest, LedgerEntry.user_id == latest.c.user_id).filter(
+            LedgerEntry.seq > db.func.coalesce(latest.c.seq, 0)
         )
-        db.session.add(user)
-        db.session.commit()
 
-        # Give user the starter sparrow
-        starter_bird = OwnedBird(user_id=user.id, bird_id=1, is_shiny=False)
-        db.session.add(starter_bird)
-        db.session.commit()
+    for user_id, xp, levels, seeds in tail.group_by(LedgerEntry.user_id):
+        base_xp, base_level, base_seeds = balances[user_id]
+        balances[user_id] = (base_xp + xp, base_level + levels, base_seeds + seeds)
+    return balances
 
-        flash("Registration successful! Please login.", "success")
-        return redirect(url_for("login"))
 
-    return render_template("register.html")
+def bump_ownership_count(session, bird_id, is_shiny, delta):
+    """Adjust a BirdOwnershipCount in the caller's transaction."""
+    session.query(BirdOwnershipCount).filter_by(
+        bird_id=bird_id, is_shiny=is_shiny
+    ).update(
+        {BirdOwnershipCount.owners: BirdOwnershipCount.owners + delta},
+        synchronize_session=False,
+    )
 
 
-@app.route("/login", methods=["GET", "POST"])
-def login():
-    if current_user.is_authenticated:
-        return redirect(url_for("dashboard"))
+def count_owners_by_bird(session):
+    """(bird_id, is_shiny) -> players owning it, straight from OwnedBird."""
+    rows = session.query(
+        OwnedBird.bird_id,
+        OwnedBird.is_shiny,
+        db.func.count(db.distinct(OwnedBird.user_id)),
+    ).group_by(OwnedBird.bird_id, OwnedBird.is_shiny)
+    return {(bird_id, bool(is_shiny)): owners for bird_id, is_shiny, owners in rows}
+
+
+def seed_ownership_counts():
+    """Create missing BirdOwnershipCount rows, counted from OwnedBird."""
+    existing = {(row.bird_id, row.is_shiny) for row in BirdOwnershipCount.query.all()}
+    missing = [
+        (bird["id"], is_shiny)
+        for bird in AVAILABLE_BIRDS
+        for is_shiny in (False, True)
+        if (bird["id"], is_shiny) not in existing
+    ]
+    if not missing:
+        return
+    counts = count_owners_by_bird(db.session)
+    for bird_id, is_shiny in missing:
+        db.session.add(
+            BirdOwnershipCount(
+                bird_id=bird_id,
+                is_shiny=is_shiny,
+                owners=counts.get((bird_id, is_shiny), 0),
+            )
+        )
+    db.session.commit()
 
-    if request.method == "POST":
-        username = request.form.get("username")
-        password = request.form.get("password")
 
-        user = User.query.filter_by(username=username).first()
+def get_collection_stats():
+    """Owners per bird as counts and shares of all players (cached)."""
+
+    def compute():
+        # Each shard counts its own players; add them up
+        with all_shards():
+            players = count_rows(User.query)
+            counts = {}
+            for row in BirdOwnershipCount.query:
+                key = (row.bird_id, row.is_shiny)
+                counts[key] = counts.get(key, 0) + row.owners
+        birds = []
+        for bird in AVAILABLE_BIRDS:
+            owners = counts.get((bird["id"], False), 0)
+            shiny_owners = counts.get((bird["id"], True), 0)
+            birds.append(
+                {
+                    "bird_id": bird["id"],
+                    "name": bird["name"],
+                    "rarity": bird["rarity"],
+                    "owners": owners,
+                    "shiny_owners": shiny_owners,
+                    "owners_pct": round(100 * owners / players, 1) if players else 0,
+                    "shiny_pct": (
+                        round(100 * shiny_owners / players, 1) if players else 0
+                    ),
+                }
+            )
+        return {"players": players, "birds": birds}
 
-        if user and check_password_hash(user.password_hash, password):
-            login_user(user)
-            check_and_update_streak(user)
-            flash(f"Welcome back, {username}! 🐦", "success")
-            return redirect(url_for("dashboard"))
-        else:
-            flash("Invalid username or password.", "error")
+    return cache.get_or_compute(
+        "collection", "global", compute, ttl=COLLECTION_STATS_TTL
+    )
 
-    return render_template("login.html")
 
+def get_collection_score(user):
+    """The user's collection progress, overall and per rarity, from the bitmap."""
+    bits = user.owned_bits
+    if bits is None:
+        bits = ownership_bits_for(db.session, user)
 
-@app.route("/logout")
-@login_required
-def logout():
-    logout_user()
-    flash("You have been logged out.", "info")
-    return redirect(url_for("home"))
+    by_rarity = {
+        rarity: {"owned": 0, "shiny": 0, "total": 0} for rarity in RARITY_PRICES
+    }
+    for bird in AVAILABLE_BIRDS:
+        progress = by_rarity[bird["rarity"]]
+        progress["total"] += 1
+        if bits & ownership_bit(bird["id"], False) or bits & ownership_bit(
+            bird["id"], True
+        ):
+            progress["owned"] += 1
+        if bits & ownership_bit(bird["id"], True):
+            progress["shiny"] += 1
+
+    owned = sum(p["owned"] for p in by_rarity.values())
+    return {
+        "species_owned": owned,
+        "species_total": len(AVAILABLE_BIRDS),
+        "shiny_owned": sum(p["shiny"] for p in by_rarity.values()),
+        "completion_pct": round(100 * owned / len(AVAILABLE_BIRDS), 1),
+        "by_rarity": by_rarity,
+    }
 
 
-@app.route("/leaderboard")
-def leaderboard():
-    # Get top 50 users by level, then by XP as tiebreaker
-    top_users = User.query.order_by(User.level.desc(), User.xp.desc()).limit(50).all()
+def deleted_habit_ids(session, user_id):
+    """(custom ids, built-in ids) of the user's deleted habits not yet purged."""
+    custom = session.query(CustomHabit.id).filter(
+        CustomHabit.user_id == user_id, CustomHabit.deleted_at.isnot(None)
+    )
+    builtin = session.query(HiddenHabit.habit_id).filter(
+        HiddenHabit.user_id == user_id, HiddenHabit.purged_at.is_(None)
+    )
+    return [i for (i,) in custom], [i for (i,) in builtin]
 
-    # Build leaderboard data with rank and bird info
-    leaderboard_data = []
-    for rank, user in enumerate(top_users, 1):
-        bird = get_bird_by_id(user.current_bird_id)
-        leaderboard_data.append(
-            {
-                "rank": rank,
-                "username": user.username,
-                "level": user.level,
-                "xp": user.xp,
-                "streak": user.streak,
-                "bird": bird,
-                "is_shiny": user.current_bird_shiny,
-                "is_current_user": current_user.is_authenticated
-                and user.id == current_user.id,
-            }
+
+def without_deleted_habits(query, model, deleted):
+    """Filter deleted_habit_ids() out of a completion or archive query."""
+    for is_custom, ids in zip((True, False), deleted):
+        if ids:
+            query = query.filter(
+                ~db.and_(model.is_custom == is_custom, model.habit_id.in_(ids))
+            )
+    return query
+
+
+def purge_habit_history(session, user_id, habit_id, is_custom, chunk_size, pause):
+    """Delete one habit's completions chunk_size rows at a time.
+
+    Commits after every chunk and sleeps `pause` seconds before the next;
+    yields the rows deleted per chunk. Archived history goes last, in one
+    statement (it is one row per year).
+    """
+    match = {"user_id": user_id, "habit_id": habit_id, "is_custom": is_custom}
+    while True:
+        ids = [
+            i
+            for (i,) in session.query(CompletedHabit.id)
+            .filter_by(**match)
+            .limit(chunk_size)
+        ]
+        if not ids:
+            break
+        session.query(CompletedHabit).filter(CompletedHabit.id.in_(ids)).delete(
+            synchronize_session=False
+        )
+        session.commit()
+        yield len(ids)
+        time.sleep(pause)
+    session.query(CompletionArchive).filter_by(**match).delete(
+        synchronize_session=False
+    )
+    session.query(HabitStreak).filter_by(**match).delete(synchronize_session=False)
+    session.commit()
+
+
+def purge_deleted_habits(session, progress, chunk_size=None, pause=None):
+    """Remove the history of every deleted habit, then its tombstone.
+
+    progress(rows) is called after each chunk, and progress(0,
+    habit_done=True) after each habit. Returns the number of habits purged.
+    """
+    chunk_size = chunk_size or PURGE_CHUNK_SIZE
+    pause = PURGE_PAUSE_MS / 1000 if pause is None else pause
+    pending = [
+        (user_id, habit_id, True)
+        for user_id, habit_id in session.query(CustomHabit.user_id, CustomHabit.id)
+        .filter(CustomHabit.deleted_at.isnot(None))
+        .order_by(CustomHabit.id)
+    ] + [
+        (user_id, habit_id, False)
+        for user_id, habit_id in session.query(
+            HiddenHabit.user_id, HiddenHabit.habit_id
         )
+        .filter(HiddenHabit.purged_at.is_(None))
+        .order_by(HiddenHabit.id)
+    ]
+    session.rollback()  # Don't hold the read transaction while purging
+
+    for user_id, habit_id, is_custom in pending:
+        for rows in purge_habit_history(
+            session, user_id, habit_id, is_custom, chunk_size, pause
+        ):
+            progress(rows)
+        if is_custom:
+            # Another worker may have finished it first
+            session.query(CustomHabit).filter(
+                CustomHabit.id == habit_id, CustomHabit.deleted_at.isnot(None)
+            ).delete(synchronize_session=False)
+        else:
+            session.query(HiddenHabit).filter_by(
+                user_id=user_id, habit_id=habit_id, purged_at=None
+            ).update({"purged_at": datetime.utcnow()}, synchronize_session=False)
+        session.commit()
+        progress(0, habit_done=True)
+    return len(pending)
 
-    # Get current user's rank if logged in
-    current_user_rank = None
-    if current_user.is_authenticated:
-        # Count users with higher level or same level but more XP
-        higher_count = User.query.filter(
-            (User.level > current_user.level)
-            | ((User.level == current_user.level) & (User.xp > current_user.xp))
-        ).count()
-        current_user_rank = higher_count + 1
 
-    return render_template(
-        "leaderboard.html",
-        leaderboard=leaderboard_data,
-        current_user_rank=current_user_rank,
-    )
+def _run_purge_pass(progress):
+    with app.app_context():
+        for shard in each_shard():
+            with use_shard(shard):
+                purge_deleted_habits(db.session, progress)
 
 
-@app.route("/dashboard")
-@login_required
-def dashboard():
-    check_and_update_streak(current_user)
-    bird = get_bird_by_id(current_user.current_bird_id)
-    xp_needed = calculate_xp_for_level(current_user.level)
-    multiplier = get_user_multiplier(current_user)
-    habits = get_all_habits(current_user)
-    completed_today = get_completed_today(current_user)
+purger = Purger(_run_purge_pass, interval=PURGE_INTERVAL)
 
-    return render_template(
-        "dashboard.html",
-        bird=bird,
-        xp_needed=xp_needed,
-        multiplier=multiplier,
-        habits=habits,
-        completed_today=completed_today,
-    )
 
+@app.before_request
+def start_purger():
+    # The first request starts this worker's purger, whose first pass picks
+    # up deletes left behind by a recycled or restarted worker
+    purger.start()
 
-@app.route("/shop")
-@login_required
-def shop():
-    owned_birds = OwnedBird.query.filter_by(user_id=current_user.id).all()
-    owned_dict = {}
-    for ob in owned_birds:
-        key = ob.bird_id
-        if key not in owned_dict:
-            owned_dict[key] = {"normal": False, "shiny": False}
-        if ob.is_shiny:
-            owned_dict[key]["shiny"] = True
-        else:
-            owned_dict[key]["normal"] = True
 
-    # Ensure current equipped bird is shown as owned
-    if current_user.current_bird_id and current_user.current_bird_id not in owned_dict:
-        owned_dict[current_user.current_bird_id] = {
-            "normal": not current_user.current_bird_shiny,
-            "shiny": current_user.current_bird_shiny,
-        }
-        # Also add to database if missing
-        new_owned = OwnedBird(
-            user_id=current_user.id,
-            bird_id=current_user.current_bird_id,
-            is_shiny=current_user.current_bird_shiny,
-        )
-        db.session.add(new_owned)
-        db.session.commit()
+def day_bit(day):
+    """The bit for `day` in its year's CompletionArchive bitmap."""
+    return 1 << (day.timetuple().tm_yday - 1)
 
-    birds_with_prices = []
-    for bird in AVAILABLE_BIRDS:
-        bird_copy = bird.copy()
-        bird_copy["price"] = RARITY_PRICES[bird["rarity"]]
-        bird_copy["owned"] = owned_dict.get(
-            bird["id"], {"normal": False, "shiny": False}
-        )
-        birds_with_prices.append(bird_copy)
 
-    return render_template(
-        "shop.html", birds=birds_with_prices, rarity_multipliers=RARITY_MULTIPLIERS
-    )
+def archived_days(archive):
+    """The dates set in a CompletionArchive row, in order."""
+    first = date(archive.year, 1, 1)
+    bits = archive.days
+    while bits:
+        lowest = bits & -bits
+        yield first + timedelta(days=lowest.bit_length() - 1)
+        bits ^= lowest
 
 
-@app.route("/api/complete-habit", methods=["POST"])
-@login_required
-def complete_habit():
-    data = request.get_json()
-    habit_id = data.get("habit_id")
-    is_custom = data.get("is_custom", False)
+def completions_by_day(session, user_id, start=None, end=None, habit=None):
+    """Habits completed per day, from the archive and recent rows combined.
 
+    Returns {date: count} for start <= date <= end (either bound optional),
+    optionally for a single (habit_id, is_custom) habit.
+    """
+    archived = session.query(CompletionArchive).filter(
+        CompletionArchive.user_id == user_id
+    )
+    recent = session.query(CompletedHabit.date, db.func.count(CompletedHabit.id))
+    recent = recent.filter(CompletedHabit.user_id == user_id)
+    if habit is not None:
+        habit_id, is_custom = habit
+        archived = archived.filter(
+            CompletionArchive.habit_id == habit_id,
+            CompletionArchive.is_custom == bool(is_custom),
+        )
+        recent = recent.filter(
+            CompletedHabit.habit_id == habit_id,
+            CompletedHabit.is_custom == bool(is_custom),
+        )
+    else:
+        # History of deleted habits doesn't count while it awaits the purger
+        deleted = deleted_habit_ids(session, user_id)
+        archived = without_deleted_habits(archived, CompletionArchive, deleted)
+        recent = without_deleted_habits(recent, CompletedHabit, deleted)
+    if start is not None:
+        archived = archived.filter(CompletionArchive.year >= start.year)
+        recent = recent.filter(CompletedHabit.date >= start)
+    if end is not None:
+        archived = archived.filter(CompletionArchive.year <= end.year)
+        recent = recent.filter(CompletedHabit.date <= end)
+
+    counts = {}
+    for archive in archived:
+        for day in archived_days(archive):
+            if (start is None or day >= start) and (end is None or day <= end):
+                counts[day] = counts.get(day, 0) + 1
+    for day, completed in recent.group_by(CompletedHabit.date):
+        if day is not None:
+            counts[day] = counts.get(day, 0) + completed
+    return counts
+
+
+def streaks_from_days(days, today):
+    """(current, longest) runs of consecutive days in sorted `days`.
+
+    The current run still counts if its last day was yesterday.
+    """
+    run = longest = 0
+    previous = None
+    for day in days:
+        run = run + 1 if previous and (day - previous).days == 1 else 1
+        longest = max(longest, run)
+        previous = day
+    current = run if previous and (today - previous).days <= 1 else 0
+    return current, longest
+
+
+def next_streak(current, longest, last_date, day):
+    """(current, longest, last_date) after also doing the habit on `day`.
+
+    Days must come in order; doing it again on last_date changes nothing.
+    """
+    if last_date == day:
+        return current, longest, last_date
+    if last_date is not None and (day - last_date).days == 1:
+        current += 1
+    else:
+        current = 1
+    return current, max(longest, current), day
+
+
+def live_streak(current, last_date, today):
+    """A stored streak as of today: it lapses once a whole day is missed."""
+    if last_date is None or (today - last_date).days > 1:
+        return 0
+    return current
+
+
+def completion_history(session, batch_size=1000):
+    """Every (user_id, habit_id, is_custom, day) done, in that order.
+
+    Merges the recent rows and the archive bitmaps, both read through
+    server-side cursors, so the whole history streams past once.
+    """
+    recent = (
+        session.query(
+            CompletedHabit.user_id,
+            CompletedHabit.habit_id,
+            CompletedHabit.is_custom,
+            CompletedHabit.date,
+        )
+        .filter(CompletedHabit.date.isnot(None))
+        .order_by(
+            CompletedHabit.user_id,
+            CompletedHabit.habit_id,
+            CompletedHabit.is_custom,
+            CompletedHabit.date,
+        )
+        .yield_per(batch_size)
+    )
+    archived = (
+        session.query(CompletionArchive)
+        .order_by(
+            CompletionArchive.user_id,
+            CompletionArchive.habit_id,
+            CompletionArchive.is_custom,
+            CompletionArchive.year,
+        )
+        .yield_per(batch_size)
+    )
+
+    def archived_rows():
+        for archive in archived:
+            for day in archived_days(archive):
+                yield archive.user_id, archive.habit_id, archive.is_custom, day
+
+    return heapq.merge(
+        (
+            (user_id, habit_id, bool(is_custom), day)
+            for user_id, habit_id, is_custom, day in recent
+        ),
+        archived_rows(),
+    )
+
+
+def rebuild_habit_streaks(session, batch_size=1000, missing_only=False):
+    """Recompute every HabitStreak from the completion history.
+
+    One pass over completion_history(); the table is replaced in a single
+    transaction, so readers see the old counters until it commits. With
+    missing_only the existing streaks are kept and only habits without one
+    get a row. Yields the number of streaks written per batch.
+    """
+    if not missing_only:
+        session.query(HabitStreak).delete(synchronize_session=False)
+
+    def write(rows):
+        if missing_only:
+            # History comes in user order, so a batch spans a range of users
+            existing = set(
+                session.query(
+                    HabitStreak.user_id, HabitStreak.habit_id, HabitStreak.is_custom
+                ).filter(
+                    HabitStreak.user_id.between(rows[0]["user_id"], rows[-1]["user_id"])
+                )
+            )
+            rows = [
+                row
+                for row in rows
+                if (row["user_id"], row["habit_id"], row["is_custom"]) not in existing
+            ]
+        if rows:
+            session.execute(db.insert(HabitStreak.__table__), rows)
+        return len(rows)
+
+    rows = []
+    for (user_id, habit_id, is_custom), days in itertools.groupby(
+        completion_history(session, batch_size), key=lambda row: row[:3]
+    ):
+        current = longest = 0
+        last_date = None
+        for *_, day in days:
+            current, longest, last_date = next_streak(current, longest, last_date, day)
+        rows.append(
+            {
+                "user_id": user_id,
+                "habit_id": habit_id,
+                "is_custom": is_custom,
+                "current": current,
+                "longest": longest,
+                "last_date": last_date,
+            }
+        )
+        if len(rows) >= batch_size:
+            yield write(rows)
+            rows = []
+    if rows:
+        yield write(rows)
+    session.commit()
+
+
+def compact_completions(session, before, batch_size=1000):
+    """Move CompletedHabit rows dated before `before` into CompletionArchive.
+
+    Works through the rows in id order, batch_size at a time, committing
+    each batch so memory use and lock time stay bounded. Yields the number
+    of rows moved per batch.
+    """
+    last_id = 0
+    while True:
+        rows = (
+            session.query(
+                CompletedHabit.id,
+                CompletedHabit.user_id,
+                CompletedHabit.habit_id,
+                CompletedHabit.is_custom,
+                CompletedHabit.date,
+                CompletedHabit.completed_at,
+            )
+            .filter(
+                CompletedHabit.id > last_id,
+                db.or_(
+                    CompletedHabit.date < before,
+                    db.and_(
+                        CompletedHabit.date.is_(None),
+                        CompletedHabit.completed_at < before,
+                    ),
+                ),
+            )
+            .order_by(CompletedHabit.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return
+
+        bits = {}
+        for row in rows:
+            day = row.date or row.completed_at.date()
+            key = (row.user_id, row.habit_id, bool(row.is_custom), day.year)
+            bits[key] = bits.get(key, 0) | day_bit(day)
+
+        existing = {
+            (a.user_id, a.habit_id, a.is_custom, a.year): a
+            for a in session.query(CompletionArchive).filter(
+                CompletionArchive.user_id.in_({key[0] for key in bits}),
+                CompletionArchive.year.in_({key[3] for key in bits}),
+            )
+        }
+        for key, days in bits.items():
+            archive = existing.get(key)
+            if archive is None:
+                user_id, habit_id, is_custom, year = key
+                archive = CompletionArchive(
+                    user_id=user_id, habit_id=habit_id, is_custom=is_custom, year=year
+                )
+                archive.days = days
+                session.add(archive)
+            else:
+                archive.days |= days
+
+        session.query(CompletedHabit).filter(
+            CompletedHabit.id.in_([row.id for row in rows])
+        ).delete(synchronize_session=False)
+        session.commit()
+        last_id = rows[-1].id
+        yield len(rows)
+
+
+# Columns of the per-user CSV export; each record type fills some of them
+USER_EXPORT_FIELDS = [
+    "type",
+    "habit_id",
+    "is_custom",
+    "name",
+    "category",
+    "xp",
+    "date",
+    "completed_at",
+    "archived",
+    "bird_id",
+    "is_shiny",
+    "acquired_at",
+]
+# Left out of the admin database export
+EXPORT_EXCLUDED_COLUMNS = {"password_hash"}
+
+
+def export_user_records(session, user):
+    """The user's habits, completions and birds as a stream of dicts.
+
+    Rows are read through server-side cursors EXPORT_BATCH_SIZE at a time,
+    so memory use stays flat however long the history is.
+    """
+    for habit in get_all_habits(user):
+        yield {
+            "type": "habit",
+            "habit_id": habit["id"],
+            "is_custom": habit.get("is_custom", False),
+            "name": habit["name"],
+            "category": habit["category"],
+            "xp": habit["xp"],
+        }
+
+    deleted = deleted_habit_ids(session, user.id)
+    archived = without_deleted_habits(
+        session.query(CompletionArchive).filter(CompletionArchive.user_id == user.id),
+        CompletionArchive,
+        deleted,
+    ).order_by(CompletionArchive.year, CompletionArchive.habit_id)
+    for archive in archived.yield_per(EXPORT_BATCH_SIZE):
+        for day in archived_days(archive):
+            yield {
+                "type": "completion",
+                "habit_id": archive.habit_id,
+                "is_custom": archive.is_custom,
+                "date": day,
+                "archived": True,
+            }
+
+    recent = without_deleted_habits(
+        session.query(
+            CompletedHabit.habit_id,
+            CompletedHabit.is_custom,
+            CompletedHabit.date,
+            CompletedHabit.completed_at,
+        ).filter(CompletedHabit.user_id == user.id),
+        CompletedHabit,
+        deleted,
+    ).order_by(CompletedHabit.id)
+    for row in recent.yield_per(EXPORT_BATCH_SIZE):
+        yield {
+            "type": "completion",
+            "habit_id": row.habit_id,
+            "is_custom": bool(row.is_custom),
+            "date": row.date,
+            "completed_at": row.completed_at,
+            "archived": False,
+        }
+
+    birds = (
+        session.query(OwnedBird.bird_id, OwnedBird.is_shiny, OwnedBird.acquired_at)
+        .filter(OwnedBird.user_id == user.id)
+        .order_by(OwnedBird.id)
+    )
+    for row in birds.yield_per(EXPORT_BATCH_SIZE):
+        yield {
+            "type": "bird",
+            "bird_id": row.bird_id,
+            "name": get_bird_by_id(row.bird_id)["name"],
+            "is_shiny": bool(row.is_shiny),
+            "acquired_at": row.acquired_at,
+        }
+
+
+def export_database_records(session):
+    """Every row of every table as {"table": name, ...columns}, streamed.
+
+    When sharded, the databases are exported in turn, so each sharded
+    table appears once per shard.
+    """
+    for shard, _, tables in databases():
+        for table in tables:
+            columns = [
+                c for c in table.columns if c.name not in EXPORT_EXCLUDED_COLUMNS
+            ]
+            query = (
+                db.select(*columns)
+                .order_by(*table.primary_key.columns)
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            with use_shard(shard):
+                rows = session.execute(query)
+            for row in rows:
+                yield {"table": table.name, **row._asdict()}
+
+
+def export_response(lines, filename, mimetype):
+    # stream_with_context keeps the session open while the body is sent
+    return Response(
+        stream_with_context(buffered(lines)),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "private, no-store",
+        },
+    )
+
+
+def period_start(period, day):
+    """First day of the week (Monday) or month containing `day`."""
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def add_bucket_xp(session, user_id, period, day, xp):
+    """Add XP to the user's bucket for the period containing `day`."""
+    key = (user_id, period, period_start(period, day))
+    bucket = session.get(XpBucket, key)
+    if bucket is None:
+        bucket = XpBucket(user_id=user_id, period=period, period_start=key[2], xp=0)
+        session.add(bucket)
+    bucket.xp += xp
+    return bucket
+
+
+def leaderboard_key(window=None):
+    """Cache key of a board; a window's key changes when its period rolls over."""
+    if window is None:
+        return "global"
+    return f"{window}:{period_start(window, datetime.utcnow().date())}"
+
+
+def leaderboard_score(session, user, window=None):
+    """What a board ranks the user by: (level, xp), or XP earned this period."""
+    if window is None:
+        return (user.level, user.xp)
+    start = period_start(window, datetime.utcnow().date())
+    bucket = session.get(XpBucket, (user.id, window, start))
+    return bucket.xp if bucket else 0
+
+
+def _build_leaderboard_fragment(window=None):
+    # Each shard sends its own top N (when sharded); (sort key, user, xp)
+    # rows let the best N of them all be picked after
+    with all_shards():
+        if window is None:
+            candidates = [
+                ((-user.level, -user.xp, user.id), user, user.xp)
+                for user in User.query.order_by(User.level.desc(), User.xp.desc())
+                .limit(LEADERBOARD_SIZE)
+                .all()
+            ]
+        else:
+            start = period_start(window, datetime.utcnow().date())
+            candidates = [
+                ((-xp, user.id), user, xp)
+                for user, xp in db.session.query(User, XpBucket.xp)
+                .join(XpBucket, XpBucket.user_id == User.id)
+                .filter(XpBucket.period == window, XpBucket.period_start == start)
+                .order_by(XpBucket.xp.desc(), User.id)
+                .limit(LEADERBOARD_SIZE)
+            ]
+    top_users = [
+        (user, xp) for _, user, xp in heapq.nsmallest(LEADERBOARD_SIZE, candidates)
+    ]
+
+    leaderboard_data = []
+    for rank, (user, xp) in enumerate(top_users, 1):
+        leaderboard_data.append(
+            {
+                "rank": rank,
+                "user_id": user.id,
+                "username": user.username,
+                "level": user.level,
+                "xp": xp,
+                "streak": user.streak,
+                "bird": get_bird_by_id(user.current_bird_id),
+                "is_shiny": user.current_bird_shiny,
+            }
+        )
+
+    # Lowest score still on the board; None while the board has room
+    cutoff = None
+    if len(top_users) == LEADERBOARD_SIZE:
+        last_user, last_xp = top_users[-1]
+        cutoff = (last_user.level, last_xp) if window is None else last_xp
+
+    return {
+        "html": render_template(
+            "leaderboard_table.html",
+            leaderboard=leaderboard_data,
+            xp_label="XP" if window is None else f"XP this {window}",
+        ),
+        "ranks": {row["user_id"]: row["rank"] for row in leaderboard_data},
+        "cutoff": cutoff,
+    }
+
+
+def get_leaderboard_fragment(window=None):
+    """Return the rendered top-N table shared by every viewer."""
+    return cache.get_or_compute(
+        "leaderboard",
+        leaderboard_key(window),
+        lambda: _build_leaderboard_fragment(window),
+        ttl=LEADERBOARD_CACHE_TTL,
+    )
+
+
+def invalidate_leaderboard(session, user=None):
+    """Drop the cached leaderboards if a change to ``user`` could show up in one."""
+    if user is not None:
+        for group_id in user_group_ids(session, user.id):
+            cache.bump("group_board", group_id)
+    for window in (None, *LEADERBOARD_WINDOWS):
+        entry = cache.peek("leaderboard", leaderboard_key(window))
+        if entry is None:
+            continue
+        if (
+            user is None
+            or user.id in entry["ranks"]
+            or entry["cutoff"] is None
+            or leaderboard_score(session, user, window) >= entry["cutoff"]
+        ):
+            cache.bump("leaderboard")
+            if is_listened_to("leaderboard"):
+                broker.publish("leaderboard", "leaderboard", {"changed": True})
+            return
+
+
+def get_user_rank(session, user, window=None):
+    if window is not None:
+        # Count users who earned more XP this period
+        start = period_start(window, datetime.utcnow().date())
+        score = leaderboard_score(session, user, window)
+        with all_shards():
+            higher_count = count_rows(
+                session.query(XpBucket).filter(
+                    XpBucket.period == window,
+                    XpBucket.period_start == start,
+                    XpBucket.xp > score,
+                )
+            )
+        return higher_count + 1
+
+    # Count users with higher level or same level but more XP
+    with all_shards():
+        higher_count = count_rows(
+            session.query(User).filter(
+                (User.level > user.level)
+                | ((User.level == user.level) & (User.xp > user.xp))
+            )
+        )
+    return higher_count + 1
+
+
+def user_group_ids(session, user_id):
+    return [
+        group_id
+        for (group_id,) in session.query(GroupMember.group_id).filter(
+            GroupMember.user_id == user_id
+        )
+    ]
+
+
+def group_members(session, group_id, window=None):
+    """A group's members as a query, and the board's order and XP column.
+
+    The membership primary key finds the members; a window's board ranks
+    them by this period's XP bucket (0 without one).
+    """
+    query = (
+        session.query(User)
+        .join(GroupMember, GroupMember.user_id == User.id)
+        .filter(GroupMember.group_id == group_id)
+    )
+    if window is None:
+        return query, (User.level.desc(), User.xp.desc()), User.xp
+    start = period_start(window, datetime.utcnow().date())
+    query = query.outerjoin(
+        XpBucket,
+        db.and_(
+            XpBucket.user_id == User.id,
+            XpBucket.period == window,
+            XpBucket.period_start == start,
+        ),
+    )
+    xp = db.func.coalesce(XpBucket.xp, 0)
+    return query, (xp.desc(),), xp
+
+
+def group_top(session, group_id, window=None, limit=LEADERBOARD_SIZE):
+    """A group's best `limit` members as (rank, row), best first.
+
+    rank() over the board's order is computed by the database, and only
+    the top `limit` rows come back. Sharded, each shard ranks its own
+    members, so the shards' top rows are ranked again here: a member ahead
+    of any of the overall top rows is in its own shard's top rows too.
+    """
+    query, order, xp = group_members(session, group_id, window)
+    with all_shards():
+        rows = (
+            query.with_entities(
+                db.func.rank().over(order_by=order).label("rank"),
+                User.id,
+                User.username,
+                User.level,
+                xp.label("xp"),
+                User.streak,
+                User.current_bird_id,
+                User.current_bird_shiny,
+            )
+            .order_by(*order, User.id)
+            .limit(limit)
+            .all()
+        )
+    if not SHARDS:
+        return [(row.rank, row) for row in rows]
+
+    def ranked_by(row):
+        return (row.level, row.xp) if window is None else row.xp
+
+    # Best first, ties by id (sort is stable), ranked the way rank() does
+    rows.sort(key=lambda row: row.id)
+    rows.sort(key=ranked_by, reverse=True)
+    ranked = []
+    for position, row in enumerate(rows[:limit], 1):
+        if ranked and ranked_by(row) == ranked_by(ranked[-1][1]):
+            ranked.append((ranked[-1][0], row))
+        else:
+            ranked.append((position, row))
+    return ranked
+
+
+def group_rank(session, group_id, user, window=None):
+    """The user's rank in a group: one more than the members ahead of them."""
+    query, _, xp = group_members(session, group_id, window)
+    if window is None:
+        ahead = (User.level > user.level) | (
+            (User.level == user.level) & (User.xp > user.xp)
+        )
+    else:
+        ahead = xp > leaderboard_score(session, user, window)
+    with all_shards():
+        return count_rows(query.filter(ahead)) + 1
+
+
+def get_group_board(group_id, window=None):
+    """A group's top LEADERBOARD_SIZE and member count (cached)."""
+
+    def compute():
+        with all_shards():
+            members = count_rows(GroupMember.query.filter_by(group_id=group_id))
+        return {
+            "top": [
+                {
+                    "rank": rank,
+                    "user_id": row.id,
+                    "username": row.username,
+                    "level": row.level,
+                    "xp": row.xp,
+                    "streak": row.streak,
+                    "bird": get_bird_by_id(row.current_bird_id)["name"],
+                    "is_shiny": row.current_bird_shiny,
+                }
+                for rank, row in group_top(db.session, group_id, window)
+            ],
+            "members": members,
+        }
+
+    return cache.get_or_compute(
+        "group_board",
+        leaderboard_key(window),
+        compute,
+        ttl=LEADERBOARD_CACHE_TTL,
+        scope=group_id,
+    )
+
+
+def get_group_rank(group_id, user, window=None):
+    """The user's rank in a group (cached with the group's board)."""
+    return cache.get_or_compute(
+        "group_board",
+        f"{leaderboard_key(window)}:rank:{user.id}",
+        lambda: group_rank(db.session, group_id, user, window),
+        ttl=LEADERBOARD_CACHE_TTL,
+        scope=group_id,
+    )
+
+
+def new_join_code():
+    while True:
+        code = "".join(
+            secrets.choice(GROUP_CODE_ALPHABET) for _ in range(GROUP_CODE_LENGTH)
+        )
+        if not Group.query.filter_by(join_code=code).first():
+            return code
+
+
+def get_user_state(user):
+    """The live-updated numbers shown on the dashboard and nav bar."""
+    return {
+        "xp": user.xp,
+        "xp_needed": calculate_xp_for_level(user.level),
+        "level": user.level,
+        "seeds": user.seeds,
+        "streak": user.streak,
+        "multiplier": get_user_multiplier(user),
+    }
+
+
+def is_listened_to(channel):
+    """Whether publishing to `channel` can reach anyone at all."""
+    return app.config["LIVE_UPDATES"] and broker.has_subscribers(channel)
+
+
+def publish_user_state(session, user, rank_changed=False):
+    """Push the user's current state (and rank, if it moved) to their tabs."""
+    channel = f"user:{user.id}"
+    if not is_listened_to(channel):
+        return
+    broker.publish(channel, "state", get_user_state(user))
+    if rank_changed:
+        broker.publish(channel, "rank", {"rank": get_user_rank(session, user)})
+
+
+def get_completed_today(user):
+    today = datetime.utcnow().date()
+    completed = CompletedHabit.query.filter_by(user_id=user.id, date=today).all()
+    return [{"habit_id": c.habit_id, "is_custom": c.is_custom} for c in completed]
+
+
+def get_dashboard_state(user):
+    """Everything the dashboard shows, for /api/dashboard."""
+    check_and_update_streak(user)
+    bird = get_bird_by_id(user.current_bird_id)
+    habits = with_completion(get_all_habits(user), get_completed_today(user))
+
+    state = get_user_state(user)
+    state["bird"] = {
+        "id": bird["id"],
+        "name": bird["name"],
+        "rarity": bird["rarity"],
+        "description": bird["description"],
+        "shiny": user.current_bird_shiny,
+        "image": image_sources(bird["image"]),
+    }
+    state["habits"] = habits
+    state["completed_count"] = sum(habit["completed"] for habit in habits)
+    return state
+
+
+class ShellUser(UserMixin):
+    """The stand-in user the dashboard shell is rendered for."""
+
+    id = None
+    seeds = "–"
+    level = "–"
+
+
+_dashboard_shell = None
+
+
+def get_dashboard_shell():
+    """The dashboard page without any user data, and its ETag.
+
+    Rendered once per process in a request context of its own, so nothing
+    from the current request (user, session, flashed messages) leaks in.
+    """
+    global _dashboard_shell
+    if _dashboard_shell is None:
+        with app.test_request_context("/dashboard"):
+            # Signed in as nobody in particular: the signed-in layout with
+            # placeholders where the user's numbers go
+            g._login_user = ShellUser()
+            html = render_template("dashboard.html")
+        etag = hashlib.sha256(html.encode()).hexdigest()[:16]
+        _dashboard_shell = (html, etag)
+    return _dashboard_shell
+
+
+def with_completion(habits, completed_today):
+    """Copies of habits with a "completed" flag, so templates needn't search."""
+    done = {(bool(c["is_custom"]), c["habit_id"]) for c in completed_today}
+    return [dict(habit, completed=habit_key(habit) in done) for habit in habits]
+
+
+# Resized bird images produced by build_images.py
+IMAGE_MANIFEST_PATH = os.path.join(
+    app.static_folder, "images", "derived", "manifest.json"
+)
+IMAGE_FORMATS = ["avif", "webp"]  # Most compact first
+_image_manifest = None
+
+
+def get_image_manifest():
+    global _image_manifest
+    if _image_manifest is None:
+        try:
+            with open(IMAGE_MANIFEST_PATH) as f:
+                _image_manifest = json.load(f)
+        except FileNotFoundError:
+            _image_manifest = {}
+    return _image_manifest
+
+
+def image_sources(image):
+    """URLs for a static image: the original plus WebP/AVIF srcsets.
+
+    width/height are None and sources empty when the image has no
+    derivatives (e.g. build_images.py hasn't been run).
+    """
+    entry = get_image_manifest().get(image)
+    sources = []
+    if entry:
+        stem = os.path.splitext(image)[0]
+        for fmt in IMAGE_FORMATS:
+            widths = entry["variants"].get(fmt)
+            if not widths:
+                continue
+            srcset = ", ".join(
+                "{} {}w".format(
+                    url_for("static", filename=f"images/derived/{stem}-{width}.{fmt}"),
+                    width,
+                )
+                for width in widths
+            )
+            sources.append({"type": f"image/{fmt}", "srcset": srcset})
+    return {
+        "src": url_for("static", filename="images/" + image),
+        "width": entry["width"] if entry else None,
+        "height": entry["height"] if entry else None,
+        "sources": sources,
+    }
+
+
+@app.template_global()
+def bird_image(image, alt, sizes, css_class="", lazy=True):
+    """Render a <picture> for a static image with WebP/AVIF srcsets.
+
+    Falls back to a plain <img> of the original PNG when the image has no
+    derivatives.
+    """
+    urls = image_sources(image)
+    attrs = {
+        "src": urls["src"],
+        "alt": alt,
+        "class": css_class or None,
+        "loading": "lazy" if lazy else None,
+        "decoding": "async",
+        "width": urls["width"],
+        "height": urls["height"],
+    }
+    img = "<img {}>".format(
+        " ".join(
+            f'{name}="{escape(value)}"'
+            for name, value in attrs.items()
+            if value is not None
+        )
+    )
+    if not urls["sources"]:
+        return Markup(img)
+
+    sources = "".join(
+        f'<source type="{source["type"]}" srcset="{escape(source["srcset"])}" '
+        f'sizes="{escape(sizes)}">'
+        for source in urls["sources"]
+    )
+    return Markup(f"<picture>{sources}{img}</picture>")
+
+
+# Fingerprinted copies of static/ produced by build_assets.py. When the
+# manifest exists, url_for("static", ...) points at them and they are served
+# with far-future caching and precompressed variants.
+ASSET_MANIFEST_PATH = os.path.join(app.static_folder, "dist", "manifest.json")
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+PRECOMPRESSED = [("br", ".br"), ("gzip", ".gz")]  # Preferred first
+
+
+def load_asset_manifest():
+    try:
+        with open(ASSET_MANIFEST_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+asset_manifest = load_asset_manifest()
+
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    if endpoint == "static" and asset_manifest:
+        filename = values.get("filename")
+        if filename in asset_manifest:
+            values["filename"] = asset_manifest[filename]
+
+
+def serve_static(filename):
+    if not filename.startswith("dist/"):
+        return app.send_static_file(filename)
+
+    # The content hash is in the name, so the file can be cached forever
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    for encoding, suffix in PRECOMPRESSED:
+        if not request.accept_encodings[encoding]:
+            continue
+        path = os.path.join(app.static_folder, filename + suffix)
+        if not os.path.isfile(path):
+            continue
+        response = send_from_directory(
+            app.static_folder,
+            filename + suffix,
+            mimetype=mimetype,
+            max_age=ASSET_MAX_AGE,
+        )
+        response.headers["Content-Encoding"] = encoding
+        break
+    else:
+        response = send_from_directory(
+            app.static_folder, filename, max_age=ASSET_MAX_AGE
+        )
+    response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+app.view_functions["static"] = serve_static
+
+
+def route_class(req):
+    """The admission-control class of a request (see admission.py)."""
+    if req.endpoint == "static":
+        return "static"
+    if req.method not in ("GET", "HEAD"):
+        # Form posts (login, registration) as much as API writes
+        return "write"
+    if req.path.startswith("/api/"):
+        return "api_read"
+    if req.endpoint in ADMISSION_OPTIONAL_PAGES:
+        return "optional_page"
+    return "page"
+
+
+@app.before_request
+def admit_request():
+    if not ADMISSION_CONTROL:
+        return None
+    route = route_class(request)
+    queue_wait = parse_request_start(request.headers.get("X-Request-Start"))
+    if not admission.admit(
+        route, queue_wait, exempt=request.endpoint in ADMISSION_EXEMPT
+    ):
+        headers = {"Retry-After": str(admission.retry_after)}
+        if route.startswith("api_"):
+            body = {"success": False, "message": "Server busy, try again shortly"}
+            return jsonify(body), 503, headers
+        return "Server busy, try again shortly", 503, headers
+    g.admission = (route, time.perf_counter())
+    return None
+
+
+@app.teardown_request
+def release_request(exc):
+    admitted = g.pop("admission", None)
+    if admitted is not None:
+        route, started = admitted
+        admission.release(
+            route,
+            time.perf_counter() - started,
+            timed=request.endpoint not in ADMISSION_UNTIMED,
+        )
+
+
+@app.after_request
+def compress_response(response):
+    # Streams (SSE) and files are left alone; static files have their own
+    # precompressed variants
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_TYPES
+    ):
+        return response
+
+    body = data = response.get_data()
+    rendered = len(body)
+    if MINIFY_HTML and response.mimetype == "text/html":
+        data = minify_html(body.decode()).encode()
+    minified = len(data)
+
+    encoding = None
+    if COMPRESS_RESPONSES:
+        response.vary.add("Accept-Encoding")
+        if minified >= COMPRESS_MIN_SIZE:
+            encoding = next((e for e in ENCODINGS if request.accept_encodings[e]), None)
+    if encoding is not None:
+        data = compress(data, encoding)
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+    if data is not body:
+        response.set_data(data)
+
+    compression_stats.record(
+        request.endpoint or "<unmatched>", rendered, minified, len(data), encoding
+    )
+    return response
+
+
+# Services
+# The hot JSON API routes are implemented here against an explicit session,
+# so the same code runs under Flask (db.session) and under asgi.py (a sync
+# session over the async engine, via AsyncSession.run_sync).
+def complete_habit_for(session, user, habit_id, is_custom):
+    result = apply_habit_completion(session, user, habit_id, is_custom)
+    if result["success"]:
+        session.commit()
+        after_habit_completion(session, user, habit_id, is_custom, result)
+    return result
+
+
+def apply_habit_completion(session, user, habit_id, is_custom):
+    """Record a completion in the session without committing it."""
     today = datetime.utcnow().date()
 
     # Check if already completed today
     if is_custom:
         actual_id = int(str(habit_id).replace("custom_", ""))
-        existing = CompletedHabit.query.filter_by(
-            user_id=current_user.id, habit_id=actual_id, is_custom=True, date=today
-        ).first()
     else:
-        existing = CompletedHabit.query.filter_by(
-            user_id=current_user.id, habit_id=int(habit_id), is_custom=False, date=today
-        ).first()
+        actual_id = int(habit_id)
+    existing = (
+        session.query(CompletedHabit)
+        .filter_by(
+            user_id=user.id, habit_id=actual_id, is_custom=bool(is_custom), date=today
+        )
+        .first()
+    )
 
     if existing:
-        return jsonify({"success": False, "message": "Already completed today!"})
+        return {"success": False, "message": "Already completed today!"}
 
     # Get XP for the habit
     xp_earned = 10
     if is_custom:
-        actual_id = int(str(habit_id).replace("custom_", ""))
-        custom_habit = CustomHabit.query.get(actual_id)
-        if custom_habit:
-            xp_earned = custom_habit.xp
+        custom_habit = session.get(CustomHabit, actual_id)
+        if (
+            custom_habit is None
+            or custom_habit.user_id != user.id
+            or custom_habit.deleted_at is not None
+        ):
+            return {"success": False, "message": "Habit not found"}
+        xp_earned = custom_habit.xp
     else:
         for h in STUDENT_HABITS:
-            if h["id"] == int(habit_id):
+            if h["id"] == actual_id:
                 xp_earned = h["xp"]
                 break
 
     # Record completion
-    if is_custom:
-        actual_id = int(str(habit_id).replace("custom_", ""))
-        completion = CompletedHabit(
-            user_id=current_user.id, habit_id=actual_id, is_custom=True, date=today
-        )
-    else:
-        completion = CompletedHabit(
-            user_id=current_user.id, habit_id=int(habit_id), is_custom=False, date=today
+    completion = CompletedHabit(
+        user_id=user.id, habit_id=actual_id, is_custom=bool(is_custom), date=today
+    )
+    session.add(completion)
+
+    # This habit's own streak, looked up by primary key and updated in place
+    habit_streak = session.get(HabitStreak, (user.id, actual_id, bool(is_custom)))
+    if habit_streak is None:
+        habit_streak = HabitStreak(
+            user_id=user.id,
+            habit_id=actual_id,
+            is_custom=bool(is_custom),
+            current=0,
+            longest=0,
         )
-    db.session.add(completion)
+        session.add(habit_streak)
+    habit_streak.current, habit_streak.longest, habit_streak.last_date = next_streak(
+        habit_streak.current, habit_streak.longest, habit_streak.last_date, today
+    )
 
     # Update streak (only increments on first task of the day)
-    streak_updated = update_streak_on_task(current_user)
+    streak_updated = update_streak_on_task(user)
 
     # Add XP
-    current_user.xp += xp_earned
+    user.xp += xp_earned
+    record_ledger(session, user, "habit", xp=xp_earned, ref=habit_id)
+    for window in LEADERBOARD_WINDOWS:
+        add_bucket_xp(session, user.id, window, today, xp_earned)
 
     # Check for level up
-    xp_needed = calculate_xp_for_level(current_user.level)
+    xp_needed = calculate_xp_for_level(user.level)
     leveled_up = False
     seeds_earned = 0
 
-    if current_user.xp >= xp_needed:
-        current_user.xp -= xp_needed
-        current_user.level += 1
-        multiplier = get_user_multiplier(current_user)
-        seeds_earned = int((SEEDS_PER_LEVEL + current_user.level * 5) * multiplier)
-        current_user.seeds += seeds_earned
+    if user.xp >= xp_needed:
+        user.xp -= xp_needed
+        user.level += 1
+        multiplier = get_user_multiplier(user)
+        seeds_earned = int((SEEDS_PER_LEVEL + user.level * 5) * multiplier)
+        user.seeds += seeds_earned
         leveled_up = True
+        record_ledger(
+            session, user, "level_up", xp=-xp_needed, levels=1, seeds=seeds_earned
+        )
 
-    db.session.commit()
+    return {
+        "success": True,
+        "xp_earned": xp_earned,
+        "current_xp": user.xp,
+        "level": user.level,
+        "seeds": user.seeds,
+        "streak": user.streak,
+        "streak_updated": streak_updated,
+        "habit_streak": habit_streak.current,
+        "habit_longest_streak": habit_streak.longest,
+        "leveled_up": leveled_up,
+        "seeds_earned": seeds_earned,
+        "xp_needed": calculate_xp_for_level(user.level),
+    }
 
-    return jsonify(
+
+def after_habit_completion(session, user, habit_id, is_custom, result):
+    """Side effects of a committed completion."""
+    invalidate_leaderboard(session, user)
+    channel = f"user:{user.id}"
+    if not is_listened_to(channel):
+        return
+    broker.publish(
+        channel,
+        "habit",
         {
+            "habit_id": habit_id,
+            "is_custom": bool(is_custom),
+            "xp_earned": result["xp_earned"],
+            "streak": result["habit_streak"],
+        },
+    )
+    publish_user_state(session, user, rank_changed=True)
+
+
+def _complete_habit_job(session, user_id, habit_id, is_custom):
+    """complete_habit_for as a group-commit job (see group_commit.py)."""
+    user = session.get(User, user_id)
+    result = apply_habit_completion(session, user, habit_id, is_custom)
+    if not result["success"]:
+        return result, None
+    return result, lambda: after_habit_completion(
+        session, user, habit_id, is_custom, result
+    )
+
+
+def buy_bird_for(session, user, bird_id):
+    # Unknown ids would otherwise buy the fallback sparrow under a bogus id
+    if not is_bird_id(bird_id):
+        return {"success": False, "message": "Bird not found"}
+    bird = get_bird_by_id(bird_id)
+
+    price = RARITY_PRICES[bird["rarity"]]
+
+    if user.seeds < price:
+        return {"success": False, "message": "Not enough seeds!"}
+
+    # Check if already owned
+    existing = (
+        session.query(OwnedBird).filter_by(user_id=user.id, bird_id=bird_id).first()
+    )
+    if existing and not existing.is_shiny:
+        # Already have normal, try for shiny - deduct seeds and roll
+        user.seeds -= price
+        record_ledger(session, user, "shiny_roll", seeds=-price, ref=bird_id)
+        is_shiny = random.random() < SHINY_CHANCE
+        if is_shiny:
+            existing.is_shiny = True
+            bits = user.owned_bits
+            if bits is None:
+                bits = ownership_bits_for(session, user)
+            else:
+                # The row now records the shiny bird instead of the normal one
+                bits &= ~ownership_bit(bird_id, False)
+            user.owned_bits = bits | ownership_bit(bird_id, True)
+            bump_ownership_count(session, bird_id, False, -1)
+            bump_ownership_count(session, bird_id, True, 1)
+        session.commit()
+        publish_user_state(session, user)
+
+        if is_shiny:
+            return {
+                "success": True,
+                "is_shiny": True,
+                "message": "✨ WOW! You got a SHINY version!",
+                "seeds": user.seeds,
+            }
+        return {
+            "success": True,
+            "is_shiny": False,
+            "message": f"No shiny this time... Try again! (1% chance)",
+            "seeds": user.seeds,
+        }
+    elif existing and existing.is_shiny:
+        return {"success": False, "message": "You already own the shiny version!"}
+
+    # Roll for shiny
+    is_shiny = random.random() < SHINY_CHANCE
+
+    user.seeds -= price
+    record_ledger(session, user, "bird_purchase", seeds=-price, ref=bird_id)
+    new_bird = OwnedBird(user_id=user.id, bird_id=bird_id, is_shiny=is_shiny)
+    session.add(new_bird)
+    bits = user.owned_bits
+    if bits is None:
+        session.flush()
+        bits = ownership_bits_for(session, user)
+    user.owned_bits = bits | ownership_bit(bird_id, is_shiny)
+    bump_ownership_count(session, bird_id, is_shiny, 1)
+    session.commit()
+    publish_user_state(session, user)
+
+    if is_shiny:
+        return {
             "success": True,
-            "xp_earned": xp_earned,
-            "current_xp": current_user.xp,
-            "level": current_user.level,
-            "seeds": current_user.seeds,
-            "streak": current_user.streak,
-            "streak_updated": streak_updated,
-            "leveled_up": leveled_up,
-            "seeds_earned": seeds_earned,
-            "xp_needed": calculate_xp_for_level(current_user.level),
+            "is_shiny": True,
+            "message": "✨ WOW! You got a SHINY version!",
+            "seeds": user.seeds,
+        }
+
+    return {
+        "success": True,
+        "is_shiny": False,
+        "message": f"You got a {bird['name']}!",
+        "seeds": user.seeds,
+    }
+
+
+def equip_bird_for(session, user, bird_id, use_shiny):
+    if not is_bird_id(bird_id):
+        return {"success": False, "message": "Bird not found"}
+
+    # Check if user owns this bird
+    owned = session.query(OwnedBird).filter_by(user_id=user.id, bird_id=bird_id).first()
+    if not owned:
+        return {"success": False, "message": "You do not own this bird!"}
+
+    if use_shiny and not owned.is_shiny:
+        return {"success": False, "message": "You do not have the shiny version!"}
+
+    user.current_bird_id = bird_id
+    user.current_bird_shiny = use_shiny
+    session.commit()
+    invalidate_leaderboard(session, user)
+    publish_user_state(session, user)
+
+    bird = get_bird_by_id(bird_id)
+    return {
+        "success": True,
+        "message": f"{bird['name']} is now your active bird!",
+        "multiplier": get_user_multiplier(user),
+    }
+
+
+@contextmanager
+def group_commit_session(shard=None):
+    # Each batch gets its own app context, and so its own db.session
+    with app.app_context(), use_shard(shard):
+        session = db.session()
+        # after_commit hooks read the users again; don't reload each one
+        session.expire_on_commit = False
+        yield session
+
+
+# One committer per shard, so a batch commits to one database
+group_committers = (
+    {
+        shard: GroupCommitter(
+            partial(group_commit_session, shard),
+            max_batch=GROUP_COMMIT_MAX_BATCH,
+            max_delay=GROUP_COMMIT_MAX_DELAY_MS / 1000,
+        )
+        for shard in each_shard()
+    }
+    if GROUP_COMMIT
+    else None
+)
+
+
+def get_stats_for(session, user):
+    today = datetime.utcnow().date()
+    week_ago = today - timedelta(days=7)
+
+    # Completions per day for the past week
+    daily_counts = {
+        day.strftime("%Y-%m-%d"): count
+        for day, count in sorted(
+            completions_by_day(session, user.id, start=week_ago).items()
+        )
+    }
+
+    # Longest run of active days over the whole history
+    _, longest_streak = streaks_from_days(
+        sorted(completions_by_day(session, user.id)), today
+    )
+
+    # Count owned birds
+    owned_birds_count = session.query(OwnedBird).filter_by(user_id=user.id).count()
+
+    return {
+        "streak": user.streak,
+        "longest_streak": longest_streak,
+        "level": user.level,
+        "total_xp": user.xp + (user.level - 1) * XP_PER_LEVEL,
+        "seeds": user.seeds,
+        "birds": owned_birds_count,
+        "daily_completions": daily_counts,
+    }
+
+
+# Routes
+@app.route("/")
+def home():
+    return render_template("home.html")
+
+
+@app.route("/register", methods=["GET", "POST"])
+def register():
+    if current_user.is_authenticated:
+        return redirect(url_for("dashboard"))
+
+    if request.method == "POST":
+        username = request.form.get("username")
+        email = request.form.get("email")
+        password = request.form.get("password")
+        confirm_password = request.form.get("confirm_password")
+
+        if not username or not email or not password:
+            flash("All fields are required.", "error")
+            return redirect(url_for("register"))
+
+        if password != confirm_password:
+            flash("Passwords do not match.", "error")
+            return redirect(url_for("register"))
+
+        if find_user(username=username):
+            flash("Username already exists.", "error")
+            return redirect(url_for("register"))
+
+        if find_user(email=email):
+            flash("Email already registered.", "error")
+            return redirect(url_for("register"))
+
+        user = User(
+            username=username,
+            email=email,
+            password_hash=generate_password_hash(password),
+        )
+        if SHARDS:
+            # The directory hands out the id, which picks the user's shard
+            entry = UserDirectory(username=username, email=email)
+            db.session.add(entry)
+            db.session.flush()
+            user.id = entry.id
+            activate(shard_of(user.id))
+        # Give user the starter sparrow
+        user.owned_bits = ownership_bit(1, False)
+        user.ledger_seq = 0
+        db.session.add(user)
+        db.session.commit()
+
+        starter_bird = OwnedBird(user_id=user.id, bird_id=1, is_shiny=False)
+        db.session.add(starter_bird)
+        bump_ownership_count(db.session, 1, False, 1)
+        db.session.commit()
+        invalidate_leaderboard(db.session, user)
+
+        flash("Registration successful! Please login.", "success")
+        return redirect(url_for("login"))
+
+    return render_template("register.html")
+
+
+@app.route("/login", methods=["GET", "POST"])
+def login():
+    if current_user.is_authenticated:
+        return redirect(url_for("dashboard"))
+
+    if request.method == "POST":
+        username = request.form.get("username")
+        password = request.form.get("password")
+
+        user = find_user(username=username)
+
+        if user and check_password_hash(user.password_hash, password):
+            login_user(user)
+            check_and_update_streak(user)
+            flash(f"Welcome back, {username}! 🐦", "success")
+            return redirect(url_for("dashboard"))
+        else:
+            flash("Invalid username or password.", "error")
+
+    return render_template("login.html")
+
+
+@app.route("/logout")
+@login_required
+def logout():
+    logout_user()
+    flash("You have been logged out.", "info")
+    return redirect(url_for("home"))
+
+
+@app.route("/leaderboard")
+def leaderboard():
+    window = request.args.get("window")
+    if window not in LEADERBOARD_WINDOWS:
+        window = None
+    entry = get_leaderboard_fragment(window)
+    table_html = entry["html"]
+
+    # Get current user's rank if logged in
+    current_user_rank = None
+    window_xp = None
+    if current_user.is_authenticated:
+        current_user_rank = entry["ranks"].get(current_user.id)
+        if current_user_rank is not None:
+            # Highlight the viewer's row without re-rendering the shared table
+            marker = f'data-user-id="{current_user.id}"'
+            table_html = table_html.replace(
+                f'class="leaderboard-row" {marker}',
+                f'class="leaderboard-row current-user" {marker}',
+                1,
+            )
+        else:
+            current_user_rank = get_user_rank(db.session, current_user, window)
+        if window is not None:
+            window_xp = leaderboard_score(db.session, current_user, window)
+
+    return render_template(
+        "leaderboard.html",
+        leaderboard_table=Markup(table_html),
+        current_user_rank=current_user_rank,
+        window=window,
+        window_xp=window_xp,
+    )
+
+
+@app.route("/dashboard")
+@login_required
+def dashboard():
+    # The same HTML for every user, so the browser can keep it (but not a
+    # shared cache, which would hand it to signed-out visitors too);
+    # dashboard.js fills it in from /api/dashboard
+    html, etag = get_dashboard_shell()
+    response = Response(html, mimetype="text/html")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"private, max-age={DASHBOARD_SHELL_MAX_AGE}"
+    response.vary.add("Cookie")
+    return response.make_conditional(request)
+
+
+@app.route("/api/dashboard")
+@login_required
+def dashboard_state():
+    state = get_dashboard_state(current_user)
+    # Messages flashed by the login redirect, shown as toasts by the shell
+    state["messages"] = get_flashed_messages(with_categories=True)
+    response = jsonify(state)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@app.route("/shop")
+@login_required
+def shop():
+    owned_dict = get_owned_birds_map(current_user)
+
+    # Ensure current equipped bird is shown as owned (the row itself is
+    # restored by `flask check-ownership --fix`, not on a read)
+    if current_user.current_bird_id and current_user.current_bird_id not in owned_dict:
+        owned_dict[current_user.current_bird_id] = {
+            "normal": not current_user.current_bird_shiny,
+            "shiny": current_user.current_bird_shiny,
         }
+
+    # Resolve per-bird state here rather than through current_user in the loop
+    equipped_id = current_user.current_bird_id
+    seeds = current_user.seeds
+    birds_with_prices = []
+    for bird in AVAILABLE_BIRDS:
+        bird_copy = bird.copy()
+        bird_copy["price"] = RARITY_PRICES[bird["rarity"]]
+        bird_copy["owned"] = owned_dict.get(
+            bird["id"], {"normal": False, "shiny": False}
+        )
+        bird_copy["is_owned"] = (
+            bird_copy["owned"]["normal"] or bird_copy["owned"]["shiny"]
+        )
+        bird_copy["equipped"] = bird["id"] == equipped_id
+        bird_copy["affordable"] = seeds >= bird_copy["price"]
+        birds_with_prices.append(bird_copy)
+
+    return render_template(
+        "shop.html",
+        birds=birds_with_prices,
+        equipped_shiny=current_user.current_bird_shiny,
+        rarity_multipliers=RARITY_MULTIPLIERS,
     )
 
 
+@app.route("/api/complete-habit", methods=["POST"])
+@login_required
+def complete_habit():
+    data = request.get_json()
+    habit_id, is_custom = data.get("habit_id"), data.get("is_custom", False)
+    if group_committers is not None:
+        user_id = current_user.id
+        # Hand this request's pooled connection back while it waits: with
+        # many threads waiting, the batch would otherwise starve the pool
+        db.session.close()
+        return jsonify(
+            group_committers[shard_of(user_id)].run(
+                _complete_habit_job,
+                user_id,
+                habit_id,
+                is_custom,
+                timeout=GROUP_COMMIT_TIMEOUT,
+            )
+        )
+    return jsonify(complete_habit_for(db.session, current_user, habit_id, is_custom))
+
+
 @app.route("/api/add-habit", methods=["POST"])
 @login_required
 def add_habit():
@@ -591,6 +2626,7 @@ def add_habit():
     habit = CustomHabit(user_id=current_user.id, name=name, xp=xp, category=category)
     db.session.add(habit)
     db.session.commit()
+    cache.bump("habits", current_user.id)
 
     return jsonify(
         {
@@ -623,12 +2659,12 @@ def delete_habit():
         ).first()
 
         if habit:
-            # Delete all completion records for this habit
-            CompletedHabit.query.filter_by(
-                user_id=current_user.id, habit_id=actual_id, is_custom=True
-            ).delete()
-            db.session.delete(habit)
-            db.session.commit()
+            # Mark it deleted; the purger removes its completion records
+            if habit.deleted_at is None:
+                habit.deleted_at = datetime.utcnow()
+                db.session.commit()
+                cache.bump("habits", current_user.id)
+                purger.wake()
             return jsonify({"success": True})
 
         return jsonify({"success": False, "message": "Habit not found"})
@@ -647,13 +2683,13 @@ def delete_habit():
         if existing:
             return jsonify({"success": True})  # Already hidden
 
-        # Hide the habit and delete completion records
-        CompletedHabit.query.filter_by(
-            user_id=current_user.id, habit_id=builtin_id, is_custom=False
-        ).delete()
+        # Hide the habit; the purger removes its completion records
         hidden = HiddenHabit(user_id=current_user.id, habit_id=builtin_id)
         db.session.add(hidden)
         db.session.commit()
+        cache.bump("hidden", current_user.id)
+        cache.bump("habits", current_user.id)
+        purger.wake()
         return jsonify({"success": True})
     except ValueError:
         return jsonify({"success": False, "message": "Invalid habit ID"})
@@ -663,142 +2699,629 @@ def delete_habit():
 @login_required
 def buy_bird():
     data = request.get_json()
-    bird_id = data.get("bird_id")
+    return jsonify(buy_bird_for(db.session, current_user, data.get("bird_id")))
 
-    bird = get_bird_by_id(bird_id)
-    if not bird:
-        return jsonify({"success": False, "message": "Bird not found"})
 
-    price = RARITY_PRICES[bird["rarity"]]
+@app.route("/api/equip-bird", methods=["POST"])
+@login_required
+def equip_bird():
+    data = request.get_json()
+    return jsonify(
+        equip_bird_for(
+            db.session, current_user, data.get("bird_id"), data.get("shiny", False)
+        )
+    )
 
-    if current_user.seeds < price:
-        return jsonify({"success": False, "message": "Not enough seeds!"})
 
-    # Check if already owned
-    existing = OwnedBird.query.filter_by(
-        user_id=current_user.id, bird_id=bird_id
-    ).first()
-    if existing and not existing.is_shiny:
-        # Already have normal, try for shiny - deduct seeds and roll
-        current_user.seeds -= price
-        is_shiny = random.random() < SHINY_CHANCE
-        if is_shiny:
-            existing.is_shiny = True
-            db.session.commit()
-            return jsonify(
-                {
-                    "success": True,
-                    "is_shiny": True,
-                    "message": "✨ WOW! You got a SHINY version!",
-                    "seeds": current_user.seeds,
-                }
-            )
-        else:
-            db.session.commit()
-            return jsonify(
+@app.route("/api/stats")
+@login_required
+def get_stats():
+    return jsonify(get_stats_for(db.session, current_user))
+
+
+@app.route("/api/collection-stats")
+def collection_stats():
+    stats = dict(get_collection_stats())
+    if current_user.is_authenticated:
+        stats["you"] = get_collection_score(current_user)
+    return jsonify(stats)
+
+
+@app.route("/api/groups")
+@login_required
+def list_groups():
+    # Two queries, not a join: sharded, memberships and groups are in
+    # different databases
+    group_ids = user_group_ids(db.session, current_user.id)
+    groups = (
+        Group.query.filter(Group.id.in_(group_ids)).order_by(Group.name)
+        if group_ids
+        else []
+    )
+    return jsonify(
+        {
+            "success": True,
+            "groups": [
                 {
-                    "success": True,
-                    "is_shiny": False,
-                    "message": f"No shiny this time... Try again! (1% chance)",
-                    "seeds": current_user.seeds,
+                    "id": group.id,
+                    "name": group.name,
+                    "join_code": group.join_code,
+                    "is_owner": group.owner_id == current_user.id,
                 }
-            )
-    elif existing and existing.is_shiny:
-        return jsonify(
-            {"success": False, "message": "You already own the shiny version!"}
-        )
+                for group in groups
+            ],
+        }
+    )
 
-    # Roll for shiny
-    is_shiny = random.random() < SHINY_CHANCE
 
-    current_user.seeds -= price
-    new_bird = OwnedBird(user_id=current_user.id, bird_id=bird_id, is_shiny=is_shiny)
-    db.session.add(new_bird)
-    db.session.commit()
+@app.route("/api/create-group", methods=["POST"])
+@login_required
+def create_group():
+    data = request.get_json()
+    name = (data.get("name") or "").strip()
 
-    if is_shiny:
-        return jsonify(
-            {
-                "success": True,
-                "is_shiny": True,
-                "message": "✨ WOW! You got a SHINY version!",
-                "seeds": current_user.seeds,
-            }
-        )
+    if not name:
+        return jsonify({"success": False, "message": "Group name is required"})
+
+    group = Group(name=name[:100], join_code=new_join_code(), owner_id=current_user.id)
+    db.session.add(group)
+    db.session.flush()
+    db.session.add(GroupMember(group_id=group.id, user_id=current_user.id))
+    db.session.commit()
 
     return jsonify(
         {
             "success": True,
-            "is_shiny": False,
-            "message": f"You got a {bird['name']}!",
-            "seeds": current_user.seeds,
+            "group": {"id": group.id, "name": group.name, "join_code": group.join_code},
         }
     )
 
 
-@app.route("/api/equip-bird", methods=["POST"])
+@app.route("/api/join-group", methods=["POST"])
 @login_required
-def equip_bird():
+def join_group():
     data = request.get_json()
-    bird_id = data.get("bird_id")
-    use_shiny = data.get("shiny", False)
+    code = (data.get("join_code") or "").strip().upper()
 
-    # Check if user owns this bird
-    owned = OwnedBird.query.filter_by(user_id=current_user.id, bird_id=bird_id).first()
-    if not owned:
-        return jsonify({"success": False, "message": "You do not own this bird!"})
+    group = Group.query.filter_by(join_code=code).first() if code else None
+    if not group:
+        return jsonify({"success": False, "message": "No group with that code"})
 
-    if use_shiny and not owned.is_shiny:
-        return jsonify(
-            {"success": False, "message": "You do not have the shiny version!"}
-        )
+    if db.session.get(GroupMember, (group.id, current_user.id)):
+        return jsonify({"success": True, "group_id": group.id})  # Already a member
+
+    with all_shards():
+        members = count_rows(GroupMember.query.filter_by(group_id=group.id))
+    if members >= GROUP_MAX_MEMBERS:
+        return jsonify({"success": False, "message": "This group is full"})
 
-    current_user.current_bird_id = bird_id
-    current_user.current_bird_shiny = use_shiny
+    db.session.add(GroupMember(group_id=group.id, user_id=current_user.id))
     db.session.commit()
+    cache.bump("group_board", group.id)
+    return jsonify({"success": True, "group_id": group.id})
 
-    bird = get_bird_by_id(bird_id)
+
+@app.route("/api/leave-group", methods=["POST"])
+@login_required
+def leave_group():
+    data = request.get_json()
+    group_id = data.get("group_id")
+
+    member = db.session.get(GroupMember, (group_id, current_user.id))
+    if not member:
+        return jsonify({"success": False, "message": "Group not found"})
+
+    db.session.delete(member)
+    db.session.flush()
+    # The last one out closes the group
+    with all_shards():
+        remaining = GroupMember.query.filter_by(group_id=group_id).first()
+    if not remaining:
+        db.session.query(Group).filter_by(id=group_id).delete()
+    db.session.commit()
+    cache.bump("group_board", group_id)
+    return jsonify({"success": True})
+
+
+@app.route("/api/group-leaderboard")
+@login_required
+def group_leaderboard():
+    group_id = request.args.get("group_id", type=int)
+    window = request.args.get("window")
+    if window not in LEADERBOARD_WINDOWS:
+        window = None
+
+    group = db.session.get(Group, group_id) if group_id else None
+    if not group or not db.session.get(GroupMember, (group.id, current_user.id)):
+        return jsonify({"success": False, "message": "Group not found"})
+
+    board = get_group_board(group.id, window)
     return jsonify(
         {
             "success": True,
-            "message": f"{bird['name']} is now your active bird!",
-            "multiplier": get_user_multiplier(current_user),
+            "group": {"id": group.id, "name": group.name},
+            "window": window or "all",
+            "members": board["members"],
+            "leaderboard": board["top"],
+            "rank": get_group_rank(group.id, current_user, window),
         }
     )
 
 
-@app.route("/api/stats")
+@app.route("/api/export")
 @login_required
-def get_stats():
-    today = datetime.utcnow().date()
-    week_ago = today - timedelta(days=7)
+def export_data():
+    """Download the user's habits, completions and birds (?format=csv|ndjson)."""
+    records = export_user_records(db.session, current_user)
+    name = f"birdquest-{current_user.username}"
+    if request.args.get("format") == "csv":
+        return export_response(
+            csv_lines(records, USER_EXPORT_FIELDS), f"{name}.csv", "text/csv"
+        )
+    return export_response(
+        ndjson_lines(records), f"{name}.ndjson", "application/x-ndjson"
+    )
+
 
-    # Get completions for the past week
-    completions = CompletedHabit.query.filter(
-        CompletedHabit.user_id == current_user.id, CompletedHabit.date >= week_ago
-    ).all()
+@app.route("/api/events")
+@login_required
+def live_events():
+    """Stream state changes for the current user as Server-Sent Events."""
+    if not app.config["LIVE_UPDATES"]:
+        # 204 tells EventSource clients to stop reconnecting
+        return Response(status=204)
+
+    # Everything the stream needs is captured now; the request context and
+    # database session are released before the first event is sent.
+    subscription = broker.subscribe([f"user:{current_user.id}", "leaderboard"])
+    initial_state = get_user_state(current_user)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            yield format_sse("state", initial_state)
+            # Bounded so a connection can't pin a worker thread forever;
+            # the browser reconnects transparently.
+            deadline = time.monotonic() + LIVE_STREAM_MAX_SECONDS
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                message = subscription.get(
+                    timeout=min(LIVE_KEEPALIVE_SECONDS, remaining)
+                )
+                if message is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield format_sse(*message)
+        finally:
+            subscription.close()
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    # Group by date
-    daily_counts = {}
-    for c in completions:
-        date_str = c.date.strftime("%Y-%m-%d")
-        daily_counts[date_str] = daily_counts.get(date_str, 0) + 1
 
-    # Count owned birds
-    owned_birds_count = OwnedBird.query.filter_by(user_id=current_user.id).count()
+def check_deployment(workers, worker_class="sync", nodes=1):
+    """Refuse to start a multi-process deployment that can't share state.
 
+    Called by gunicorn.conf.py with the final worker settings; raises
+    RuntimeError describing every problem found.
+    """
+    problems = []
+    if workers > 1 or nodes > 1:
+        if shared_secret_key is None:
+            problems.append(
+                "SECRET_KEY/SECRET_KEY_FILE is required, otherwise each worker "
+                "signs sessions with its own random key"
+            )
+        if not cache.is_shared:
+            problems.append(
+                "CACHE_URL must point at a shared cache, otherwise invalidations "
+                "in one worker leave stale data in the others"
+            )
+        if app.config["LIVE_UPDATES"] and broker.__class__ is Broker:
+            problems.append(
+                "LIVE_BROKER_URL is required with LIVE_UPDATES, otherwise events "
+                "only reach browsers connected to the same worker"
+            )
+    if nodes > 1 and db.engine.dialect.name == "sqlite":
+        problems.append("SQLite can't be shared between nodes; set DATABASE_URL")
+    if app.config["LIVE_UPDATES"] and worker_class == "sync":
+        problems.append(
+            "LIVE_UPDATES needs a threaded or async worker class; each event "
+            "stream would otherwise occupy a whole sync worker"
+        )
+    if problems:
+        raise RuntimeError(
+            "Inconsistent deployment configuration:\n- " + "\n- ".join(problems)
+        )
+
+
+def admin_required(f):
+    """Allow the request only with the X-Admin-Token matching ADMIN_TOKEN."""
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = app.config.get("ADMIN_TOKEN")
+        if not token or not hmac.compare_digest(
+            request.headers.get("X-Admin-Token", ""), token
+        ):
+            abort(404)
+        return f(*args, **kwargs)
+
+    return decorated
+
+
+def group_commit_metrics():
+    """The committer's metrics, or each shard's when sharded."""
+    if group_committers is None:
+        return None
+    if not SHARDS:
+        return group_committers[None].metrics()
+    return {shard: c.metrics() for shard, c in group_committers.items()}
+
+
+@app.route("/metrics")
+@admin_required
+def metrics():
     return jsonify(
         {
-            "streak": current_user.streak,
-            "level": current_user.level,
-            "total_xp": current_user.xp + (current_user.level - 1) * XP_PER_LEVEL,
-            "seeds": current_user.seeds,
-            "birds": owned_birds_count,
-            "daily_completions": daily_counts,
+            "cache": cache.metrics(),
+            "admission": admission.metrics() if ADMISSION_CONTROL else None,
+            "compression": compression_stats.metrics(),
+            "group_commit": group_commit_metrics(),
+            "live": {"connections": broker.connection_count()},
+            "purge": purger.metrics(),
         }
     )
 
 
+@app.route("/admin/export")
+@admin_required
+def export_database():
+    """The whole database (bar password hashes) as NDJSON, one row per line."""
+    return export_response(
+        ndjson_lines(export_database_records(db.session)),
+        f"birdquest-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson",
+        "application/x-ndjson",
+    )
+
+
+def add_missing_columns():
+    """Add model columns missing from existing tables.
+
+    db.create_all() only creates whole tables, so columns added to an
+    existing model (always nullable) are added here, in every database.
+    Returns (table, column) pairs that were added.
+    """
+    added = []
+    for shard, engine, tables in databases():
+        inspector = db.inspect(engine)
+        preparer = engine.dialect.identifier_preparer
+        for table in tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                with use_shard(shard):
+                    db.session.execute(
+                        db.text(
+                            f"ALTER TABLE {preparer.quote(table.name)} "
+                            f"ADD COLUMN {preparer.quote(column.name)} {column_type}"
+                        )
+                    )
+                added.append((table.name, column.name))
+    db.session.commit()
+    return added
+
+
+def add_missing_indexes():
+    """Create model indexes missing from existing tables; returns their names.
+
+    Like columns, indexes declared on an existing model are not created by
+    db.create_all().
+    """
+    added = []
+    for _, engine, tables in databases():
+        inspector = db.inspect(engine)
+        for table in tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(engine)
+                    added.append(index.name)
+    return added
+
+
+def backfill_ledger():
+    """Record existing balances as opening entries for users without a ledger."""
+    users = User.query.filter(User.ledger_seq.is_(None)).all()
+    for user in users:
+        open_ledger(db.session, user)
+    db.session.commit()
+    return len(users)
+
+
+def backfill_habit_streaks():
+    """Add streaks for habits with history but no HabitStreak row yet."""
+    for model in (CompletedHabit, CompletionArchive):
+        without_streak = model.query.filter(
+            ~db.exists().where(
+                HabitStreak.user_id == model.user_id,
+                HabitStreak.habit_id == model.habit_id,
+                HabitStreak.is_custom == model.is_custom,
+            )
+        )
+        if without_streak.first():
+            return sum(rebuild_habit_streaks(db.session, missing_only=True))
+    return 0
+
+
+def backfill_xp_buckets():
+    """Fill the current periods' XP buckets from the ledger the first time."""
+    if XpBucket.query.first():
+        return 0
+    today = datetime.utcnow().date()
+    filled = 0
+    for window in LEADERBOARD_WINDOWS:
+        start = period_start(window, today)
+        earned = (
+            db.session.query(LedgerEntry.user_id, db.func.sum(LedgerEntry.xp_delta))
+            .filter(
+                LedgerEntry.kind == "habit",
+                LedgerEntry.created_at >= datetime.combine(start, datetime.min.time()),
+            )
+            .group_by(LedgerEntry.user_id)
+        )
+        for user_id, xp in earned:
+            db.session.add(
+                XpBucket(user_id=user_id, period=window, period_start=start, xp=xp)
+            )
+            filled += 1
+    db.session.commit()
+    return filled
+
+
+def backfill_ownership_bitmaps():
+    """Build the ownership bitmap for users that don't have one yet."""
+    users = User.query.filter(User.owned_birds_bitmap.is_(None)).all()
+    for user in users:
+        user.owned_bits = ownership_bits_for(db.session, user)
+    db.session.commit()
+    return len(users)
+
+
+@app.cli.command("backfill")
+def backfill_command():
+    """Fill in derived data that existing rows predate (run after upgrading).
+
+    Each step only touches rows it hasn't filled yet, so running it again
+    (say, on every deploy) does nothing once everything is filled.
+    """
+    for shard in each_shard():
+        with use_shard(shard):
+            backfilled = backfill_ownership_bitmaps()
+            if backfilled:
+                print(f"🐦 Built ownership bitmaps for {backfilled} users")
+            seed_ownership_counts()
+            backfilled = backfill_ledger()
+            if backfilled:
+                print(f"📒 Opened ledgers for {backfilled} users")
+            backfilled = backfill_habit_streaks()
+            if backfilled:
+                print(f"🔥 Built streaks for {backfilled} habits")
+            backfilled = backfill_xp_buckets()
+            if backfilled:
+                print(f"🏆 Filled {backfilled} weekly/monthly XP buckets")
+    cache.bump("collection")
+    print("✅ Backfill complete")
+
+
+@app.cli.command("check-ownership")
+@click.option("--fix", is_flag=True, help="Repair what doesn't match.")
+def check_ownership(fix):
+    """Compare ownership bitmaps with the OwnedBird rows."""
+    mismatched = 0
+    for shard in each_shard():
+        with use_shard(shard):
+            for user in User.query.order_by(User.id):
+                # The equipped bird always counts as owned
+                if user.current_bird_id and not (
+                    OwnedBird.query.filter_by(
+                        user_id=user.id, bird_id=user.current_bird_id
+                    ).first()
+                ):
+                    print(
+                        f"⚠️ {user.username}: equipped bird {user.current_bird_id} not owned"
+                    )
+                    mismatched += 1
+                    if fix:
+                        db.session.add(
+                            OwnedBird(
+                                user_id=user.id,
+                                bird_id=user.current_bird_id,
+                                is_shiny=user.current_bird_shiny,
+                            )
+                        )
+                        db.session.flush()
+
+                expected = ownership_bits_for(db.session, user)
+                if user.owned_bits != expected:
+                    print(
+                        f"⚠️ {user.username}: bitmap {user.owned_birds_bitmap} != {expected:x}"
+                    )
+                    mismatched += 1
+                    if fix:
+                        user.owned_bits = expected
+
+    if fix:
+        db.session.commit()
+        print(f"✅ Fixed {mismatched} mismatches")
+    elif mismatched:
+        print(f"❌ {mismatched} mismatches (run with --fix to repair)")
+    else:
+        print("✅ Ownership bitmaps match")
+
+
+@app.cli.command("verify-ledger")
+@click.option("--chunk-size", default=500, show_default=True)
+@click.option("--full", is_flag=True, help="Sum every entry, ignoring snapshots.")
+def verify_ledger(chunk_size, full):
+    """Check every user's balance against the ledger, in chunks of users."""
+    checked = mismatched = 0
+    for shard in each_shard():
+        with use_shard(shard):
+            last_id = 0
+            while True:
+                users = (
+                    db.session.query(
+                        User.id, User.username, User.xp, User.level, User.seeds
+                    )
+                    .filter(User.id > last_id)
+                    .order_by(User.id)
+                    .limit(chunk_size)
+                    .all()
+                )
+                if not users:
+                    break
+                balances = ledger_balances(
+                    db.session, [u.id for u in users], use_snapshots=not full
+                )
+                for user in users:
+                    expected = balances[user.id]
+                    if (user.xp, user.level, user.seeds) != expected:
+                        print(
+                            f"⚠️ {user.username}: xp/level/seeds "
+                            f"{user.xp}/{user.level}/{user.seeds}, ledger "
+                            f"{expected[0]}/{expected[1]}/{expected[2]}"
+                        )
+                        mismatched += 1
+                checked += len(users)
+                last_id = users[-1].id
+                db.session.rollback()  # Release the read transaction between chunks
+
+    if mismatched:
+        print(f"❌ {mismatched} of {checked} users don't match the ledger")
+        raise SystemExit(1)
+    print(f"✅ {checked} users match the ledger")
+
+
+@app.cli.command("reconcile-collection-stats")
+@click.option("--dry-run", is_flag=True, help="Only report the drift.")
+def reconcile_collection_stats(dry_run):
+    """Recount BirdOwnershipCount from OwnedBird (run periodically)."""
+    drifted = 0
+    for shard in each_shard():
+        with use_shard(shard):
+            seed_ownership_counts()
+            # Lock the counters so purchases wait rather than update a stale row
+            rows = BirdOwnershipCount.query.with_for_update().all()
+            counts = count_owners_by_bird(db.session)
+            for row in rows:
+                expected = counts.get((row.bird_id, row.is_shiny), 0)
+                if row.owners != expected:
+                    variant = "shiny" if row.is_shiny else "normal"
+                    print(
+                        f"⚠️ bird {row.bird_id} ({variant}): {row.owners} != {expected}"
+                    )
+                    drifted += 1
+                    row.owners = expected
+
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+                cache.bump("collection")
+    print(f"✅ {drifted} counters {'drifted' if dry_run else 'corrected'}")
+
+
+@app.cli.command("compact-completions")
+@click.option(
+    "--days",
+    default=ARCHIVE_AFTER_DAYS,
+    show_default=True,
+    help="Keep completions from the last N days as rows.",
+)
+@click.option("--batch-size", default=1000, show_default=True)
+def compact_completions_command(days, batch_size):
+    """Compact old completions into per-habit yearly day bitmaps."""
+    if days < 1:
+        raise click.BadParameter("today's completions must stay rows", "--days")
+    before = datetime.utcnow().date() - timedelta(days=days)
+    moved = 0
+    for shard in each_shard():
+        with use_shard(shard):
+            for count in compact_completions(db.session, before, batch_size):
+                moved += count
+                print(f"📦 {moved} completions archived...")
+    print(f"✅ Archived {moved} completions from before {before}")
+
+
+@app.cli.command("purge-deleted-habits")
+@click.option("--chunk-size", default=PURGE_CHUNK_SIZE, show_default=True)
+@click.option("--pause-ms", default=PURGE_PAUSE_MS, show_default=True)
+def purge_deleted_habits_command(chunk_size, pause_ms):
+    """Remove the history of deleted habits now, reporting progress."""
+    totals = {"rows": 0, "habits": 0}
+
+    def progress(rows, habit_done=False):
+        totals["rows"] += rows
+        totals["habits"] += habit_done
+        print(f"🧹 {totals['habits']} habits, {totals['rows']} completions purged...")
+
+    for shard in each_shard():
+        with use_shard(shard):
+            purge_deleted_habits(db.session, progress, chunk_size, pause_ms / 1000)
+    print(f"✅ Purged {totals['rows']} completions of {totals['habits']} habits")
+
+
+@app.cli.command("rebuild-habit-streaks")
+@click.option("--batch-size", default=1000, show_default=True)
+def rebuild_habit_streaks_command(batch_size):
+    """Recompute every per-habit streak from the completion history."""
+    written = 0
+    for shard in each_shard():
+        with use_shard(shard):
+            for count in rebuild_habit_streaks(db.session, batch_size):
+                written += count
+                print(f"🔥 {written} habit streaks rebuilt...")
+    print(f"✅ Rebuilt {written} habit streaks")
+
+
+@app.cli.command("prune-xp-buckets")
+@click.option(
+    "--days",
+    default=400,
+    show_default=True,
+    help="Keep buckets of periods that started in the last N days.",
+)
+def prune_xp_buckets(days):
+    """Delete weekly/monthly XP buckets of long-finished periods."""
+    before = datetime.utcnow().date() - timedelta(days=days)
+    deleted = 0
+    for shard in each_shard():
+        with use_shard(shard):
+            deleted += XpBucket.query.filter(XpBucket.period_start < before).delete(
+                synchronize_session=False
+            )
+            db.session.commit()
+    print(f"✅ Deleted {deleted} XP buckets from before {before}")
+
+
+def create_tables():
+    """db.create_all(), with each table in its own database when sharded."""
+    for _, engine, tables in databases():
+        db.metadata.create_all(engine, tables=tables)
+
+
 # Initialize database
 def init_db():
     with app.app_context():
@@ -819,9 +3342,14 @@ def init_db():
             print(f"📁 Database not found at {db_path}. Creating new database...")
 
         # Create all tables if they don't exist
-        db.create_all()
-
-        # Verify tables were created by checking if we can query them
+        create_tables()
+        for table, column in add_missing_columns():
+            print(f"🧱 Added column {table}.{column}")
+        for index in add_missing_indexes():
+            print(f"🧱 Added index {index}")
+
+        # Verify tables were created by checking if we can query them. Never
+        # recreate them on failure: that would throw away every user's data
         try:
             User.query.first()
             OwnedBird.query.first()
@@ -833,15 +3361,20 @@ def init_db():
             else:
                 print("✅ Database tables verified!")
         except Exception as e:
-            print(f"⚠️ Error verifying tables: {e}")
-            # Force recreate tables
-            db.drop_all()
-            db.create_all()
-            print("✅ Database tables recreated!")
+            print(f"❌ Error verifying tables: {e}")
+            raise
+
+
+def warm_templates():
+    """Compile every template up front, from the bytecode cache when possible."""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
 
 
 # Initialize database on import (needed for Railway)
 init_db()
+# With gunicorn's preload_app this runs once and the workers inherit the result
+warm_templates()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,264 @@
+"""
+BirdQuest - ASGI entry point
+Serves the hot JSON API routes as async views on an async SQLAlchemy
+engine, and hands every other request to the Flask app unchanged.
+
+    pip install -r requirements-async.txt
+    uvicorn asgi:application --host 0.0.0.0 --port $PORT --workers 4
+
+The async views run the same service functions as the Flask routes, on a
+sync session bridged onto the async engine, so both modes behave alike.
+They go through the app's admission control and response compression
+too (its before/after request hooks don't run for them, so both are
+applied here). Login state is only read: the app sets no remember-me
+cookie and its session isn't permanent, so there is no cookie to refresh.
+"""
+
+import json
+import os
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import request
+from itsdangerous import BadSignature
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.http import parse_accept_header
+
+from admission import parse_request_start
+from app import (
+    ADMISSION_CONTROL,
+    ADMISSION_EXEMPT,
+    ADMISSION_UNTIMED,
+    COMPRESS_MIN_SIZE,
+    COMPRESS_RESPONSES,
+    SHARDS,
+    User,
+    admission,
+    app,
+    buy_bird_for,
+    complete_habit_for,
+    compression_stats,
+    db,
+    equip_bird_for,
+    get_stats_for,
+    route_class,
+)
+from compression import ENCODINGS, compress
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+if SHARDS:
+    # The async engine would see the global database only
+    raise RuntimeError("asgi.py runs on a single database; unset SHARDS")
+
+
+def async_database_url():
+    """The app's database URL with the matching async driver."""
+    with app.app_context():
+        # Flask-SQLAlchemy has already resolved relative SQLite paths
+        url = db.engine.url
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"No async driver configured for {backend} databases")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+engine = create_async_engine(async_database_url())
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+session_serializer = app.session_interface.get_signing_serializer(app)
+
+# Requests this worker runs at once, for admission control: the event loop
+# takes any number, so this counts what the database pool serves at once
+admission.capacity = int(os.environ.get("ASGI_ADMISSION_CAPACITY", 10))
+
+
+def header(scope, name):
+    """The value of a request header (lowercase bytes name), or None."""
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def get_user_id(scope):
+    """Read the Flask-Login user id from the signed session cookie."""
+    cookie_name = app.config["SESSION_COOKIE_NAME"]
+    for name, value in scope["headers"]:
+        if name != b"cookie":
+            continue
+        for part in value.decode("latin-1").split(";"):
+            key, _, cookie = part.strip().partition("=")
+            if key != cookie_name:
+                continue
+            try:
+                data = session_serializer.loads(
+                    cookie,
+                    max_age=int(app.permanent_session_lifetime.total_seconds()),
+                )
+            except BadSignature:
+                return None
+            user_id = data.get("_user_id")
+            return int(user_id) if user_id is not None else None
+    return None
+
+
+def _run_for_user(session, user_id, service, *args):
+    user = session.get(User, user_id)
+    if user is None:
+        return None
+    return service(session, user, *args)
+
+
+def complete_habit_args(data):
+    return data.get("habit_id"), data.get("is_custom", False)
+
+
+def buy_bird_args(data):
+    return (data.get("bird_id"),)
+
+
+def equip_bird_args(data):
+    return data.get("bird_id"), data.get("shiny", False)
+
+
+# (method, path) -> (service, function extracting its arguments from JSON)
+ASYNC_ROUTES = {
+    ("POST", "/api/complete-habit"): (complete_habit_for, complete_habit_args),
+    ("POST", "/api/buy-bird"): (buy_bird_for, buy_bird_args),
+    ("POST", "/api/equip-bird"): (equip_bird_for, equip_bird_args),
+    ("GET", "/api/stats"): (get_stats_for, None),
+}
+
+
+def flask_route(method, path):
+    """(endpoint, admission class) of the Flask route a view stands in for."""
+    with app.test_request_context(path, method=method):
+        return request.endpoint, route_class(request)
+
+
+FLASK_ROUTES = {key: flask_route(*key) for key in ASYNC_ROUTES}
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def send_json(scope, send, status, payload, headers=()):
+    """Send a JSON response, compressed the way compress_response does."""
+    body = json.dumps(payload).encode()
+    rendered = len(body)
+    headers = [(b"content-type", b"application/json"), *headers]
+
+    encoding = None
+    if COMPRESS_RESPONSES:
+        headers.append((b"vary", b"Accept-Encoding"))
+        if rendered >= COMPRESS_MIN_SIZE:
+            accepted = parse_accept_header(header(scope, b"accept-encoding"))
+            encoding = next((e for e in ENCODINGS if accepted[e]), None)
+    if encoding is not None:
+        body = compress(body, encoding)
+        headers.append((b"content-encoding", encoding.encode()))
+    headers.append((b"content-length", str(len(body)).encode()))
+
+    endpoint, _ = FLASK_ROUTES[scope["method"], scope["path"]]
+    compression_stats.record(endpoint, rendered, rendered, len(body), encoding)
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def handle_admitted(scope, receive, send, service, parse_args):
+    """handle_api behind admission control, as admit_request does it."""
+    if not ADMISSION_CONTROL:
+        await handle_api(scope, receive, send, service, parse_args)
+        return
+
+    endpoint, route = FLASK_ROUTES[scope["method"], scope["path"]]
+    queue_wait = parse_request_start(header(scope, b"x-request-start"))
+    if not admission.admit(route, queue_wait, exempt=endpoint in ADMISSION_EXEMPT):
+        await send_json(
+            scope,
+            send,
+            503,
+            {"success": False, "message": "Server busy, try again shortly"},
+            headers=[(b"retry-after", str(admission.retry_after).encode())],
+        )
+        return
+    started = time.perf_counter()
+    try:
+        await handle_api(scope, receive, send, service, parse_args)
+    finally:
+        admission.release(
+            route,
+            time.perf_counter() - started,
+            timed=endpoint not in ADMISSION_UNTIMED,
+        )
+
+
+async def handle_api(scope, receive, send, service, parse_args):
+    user_id = get_user_id(scope)
+    if user_id is None:
+        await send_json(
+            scope, send, 401, {"success": False, "message": "Login required"}
+        )
+        return
+
+    args = ()
+    if parse_args is not None:
+        try:
+            data = json.loads(await read_body(receive))
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            await send_json(
+                scope, send, 400, {"success": False, "message": "Invalid JSON"}
+            )
+            return
+        args = parse_args(data)
+
+    async with Session() as session:
+        payload = await session.run_sync(_run_for_user, user_id, service, *args)
+
+    if payload is None:
+        await send_json(
+            scope, send, 401, {"success": False, "message": "Login required"}
+        )
+        return
+    await send_json(scope, send, 200, payload)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await engine.dispose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+flask_application = WsgiToAsgi(app)
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    if scope["type"] == "http":
+        route = ASYNC_ROUTES.get((scope["method"], scope["path"]))
+        if route is not None:
+            await handle_admitted(scope, receive, send, *route)
+            return
+
+    await flask_application(scope, receive, send)
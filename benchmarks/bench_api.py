@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+BirdQuest - API benchmark
+Compares the JSON API served by the sync gunicorn setup with the ASGI mode
+(asgi.py on uvicorn), one worker process each.
+
+    python benchmarks/bench_api.py --concurrency 64 --requests 3000
+
+Each server gets a fresh SQLite database and a set of logged-in users, then
+a mixed workload of /api/stats reads and /api/complete-habit writes.
+"""
+
+import argparse
+import http.client
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    "sync": [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+    "async": [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "asgi:application",
+        "--host",
+        "127.0.0.1",
+        "--log-level",
+        "warning",
+    ],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+def start_server(mode, port, db_path):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        SECRET_KEY="benchmark",
+        DEPLOY_PROFILE="single",
+        PORT=str(port),
+    )
+    cmd = SERVERS[mode]
+    if mode == "async":
+        cmd = cmd + ["--port", str(port)]
+    else:
+        env["GUNICORN_CMD_ARGS"] = f"--bind 127.0.0.1:{port}"
+    server = subprocess.Popen(
+        cmd,
+        cwd=PROJECT_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    wait_for_port(port)
+    return server
+
+
+def form_post(port, path, fields, cookie=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    if cookie:
+        headers["Cookie"] = cookie
+    conn.request("POST", path, urllib.parse.urlencode(fields), headers)
+    response = conn.getresponse()
+    response.read()
+    set_cookie = response.getheader("Set-Cookie")
+    conn.close()
+    return set_cookie.split(";", 1)[0] if set_cookie else cookie
+
+
+def create_users(port, count):
+    cookies = []
+    for i in range(count):
+        name = f"bench{i}"
+        form_post(
+            port,
+            "/register",
+            {
+                "username": name,
+                "email": f"{name}@example.com",
+                "password": "benchmark",
+                "confirm_password": "benchmark",
+            },
+        )
+        cookies.append(
+            form_post(port, "/login", {"username": name, "password": "benchmark"})
+        )
+    return cookies
+
+
+def run_workload(port, cookies, total, concurrency, write_ratio):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one_request(i):
+        nonlocal errors
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection(
+                "127.0.0.1", port, timeout=60
+            )
+        cookie = cookies[i % len(cookies)]
+        start = time.perf_counter()
+        try:
+            if random.random() < write_ratio:
+                body = '{"habit_id": %d}' % random.randint(1, 15)
+                conn.request(
+                    "POST",
+                    "/api/complete-habit",
+                    body,
+                    {"Content-Type": "application/json", "Cookie": cookie},
+                )
+            else:
+                conn.request("GET", "/api/stats", headers={"Cookie": cookie})
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            local.conn = None
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, range(total)))
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": total / duration,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--modes", nargs="+", default=["sync", "async"])
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 64])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"{'mode':<6} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} errors")
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            port = free_port()
+            server = start_server(mode, port, os.path.join(tmp, "bench.db"))
+            try:
+                cookies = create_users(port, args.users)
+                for concurrency in args.concurrency:
+                    result = run_workload(
+                        port, cookies, args.requests, concurrency, args.write_ratio
+                    )
+                    print(
+                        f"{mode:<6} {concurrency:>5} {result['rps']:>9.1f} "
+                        f"{result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                        f"{result['errors']}"
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == "__main__":
+    main()
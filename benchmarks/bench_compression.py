@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+BirdQuest - Response size benchmark
+Reports the bytes each page costs as rendered, after HTML minification, and
+after gzip and Brotli, plus the time compression adds per response.
+
+    python benchmarks/bench_compression.py --users 50
+
+Runs the app in-process with the Flask test client on a fresh SQLite
+database. MINIFY_HTML is switched on for the run.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROUTES = ["/", "/dashboard", "/shop", "/leaderboard", "/api/stats"]
+
+
+def load_app(db_path):
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{db_path}",
+        SECRET_KEY="benchmark",
+        DEPLOY_PROFILE="single",
+        COMPRESS_RESPONSES="1",
+        MINIFY_HTML="1",
+    )
+    sys.path.insert(0, PROJECT_DIR)
+    import app
+
+    return app
+
+
+def create_users(client, count):
+    for i in range(count):
+        name = f"bench{i}"
+        client.post(
+            "/register",
+            data={
+                "username": name,
+                "email": f"{name}@example.com",
+                "password": "benchmark",
+                "confirm_password": "benchmark",
+            },
+        )
+        client.post("/login", data={"username": name, "password": "benchmark"})
+        for habit_id in range(1, 1 + i % 10):
+            client.post("/api/complete-habit", json={"habit_id": habit_id})
+        client.get("/logout")
+    # Stay logged in as the last user for the authenticated pages
+    client.post("/login", data={"username": name, "password": "benchmark"})
+
+
+def measure(client, route, encoding, repeat):
+    headers = {"Accept-Encoding": encoding} if encoding else {}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        response = client.get(route, headers=headers)
+    elapsed = (time.perf_counter() - start) / repeat
+    return len(response.data), elapsed * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = load_app(os.path.join(tmp, "bench.db"))
+        client = app.app.test_client()
+        create_users(client, args.users)
+        encodings = ["gzip"] + (["br"] if "br" in app.ENCODINGS else [])
+
+        print(
+            f"{'route':<14} {'rendered':>9} {'minified':>9} "
+            + " ".join(f"{e:>9}" for e in encodings)
+            + " "
+            + " ".join(f"{e + ' +ms':>9}" for e in encodings)
+        )
+        for route in ROUTES:
+            client.get(route)  # Warm up template and query caches
+            app.compression_stats = app.CompressionStats()
+            minified, identity_ms = measure(client, route, None, args.repeat)
+            rendered = app.compression_stats.metrics().popitem()[1]
+            rendered = rendered["bytes_rendered"] // rendered["responses"]
+            sizes, overheads = [], []
+            for encoding in encodings:
+                size, ms = measure(client, route, encoding, args.repeat)
+                sizes.append(f"{size:>9,}")
+                overheads.append(f"{ms - identity_ms:>9.2f}")
+            print(
+                f"{route:<14} {rendered:>9,} {minified:>9,} "
+                + " ".join(sizes)
+                + " "
+                + " ".join(overheads)
+            )
+
+
+if __name__ == "__main__":
+    main()
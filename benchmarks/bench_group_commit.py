@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""
+BirdQuest - Group commit benchmark
+Drives /api/complete-habit at increasing concurrency against one threaded
+gunicorn worker, with GROUP_COMMIT off and on, and reports requests and
+database commits per second.
+
+    python benchmarks/bench_group_commit.py --requests 600 --concurrency 1 8 32 64
+
+Every request completes a habit nobody has completed yet today, so each
+one is a real write. Without group commit that is one commit per request;
+with it, commits are counted from /metrics.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_api import create_users, free_port, wait_for_port
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HABITS_PER_USER = 15
+ADMIN_TOKEN = "benchmark"
+
+
+def start_server(group_commit, port, db_path, threads):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        SECRET_KEY="benchmark",
+        DEPLOY_PROFILE="single",
+        ADMIN_TOKEN=ADMIN_TOKEN,
+        GROUP_COMMIT="1" if group_commit else "0",
+        GUNICORN_CMD_ARGS=(
+            f"--bind 127.0.0.1:{port} --workers 1 --worker-class gthread "
+            f"--threads {threads} --max-requests 0"
+        ),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        cwd=PROJECT_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    wait_for_port(port)
+    return server
+
+
+def committed_batches(port):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.request("GET", "/metrics", headers={"X-Admin-Token": ADMIN_TOKEN})
+    metrics = json.loads(conn.getresponse().read())
+    conn.close()
+    stats = metrics["group_commit"]
+    return stats["batches"] if stats else None
+
+
+def run_level(port, pairs, total, concurrency):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one_request(_):
+        nonlocal errors
+        with lock:
+            cookie, habit_id = next(pairs)
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection(
+                "127.0.0.1", port, timeout=60
+            )
+        start = time.perf_counter()
+        try:
+            conn.request(
+                "POST",
+                "/api/complete-habit",
+                json.dumps({"habit_id": habit_id}),
+                {"Content-Type": "application/json", "Cookie": cookie},
+            )
+            response = conn.getresponse()
+            ok = response.status == 200 and json.loads(response.read())["success"]
+        except (OSError, http.client.HTTPException, ValueError):
+            local.conn = None
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, range(total)))
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "duration": duration,
+        "ok": total - errors,
+        "errors": errors,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--threads", type=int, default=64)
+    args = parser.parse_args()
+
+    total_writes = args.requests * len(args.concurrency)
+    users = -(-total_writes // HABITS_PER_USER)
+
+    print(
+        f"{'group':<6} {'conc':>5} {'req/s':>9} {'commits/s':>10} {'batch':>6} "
+        f"{'p50 ms':>8} {'p99 ms':>8} errors"
+    )
+    for group_commit in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            port = free_port()
+            server = start_server(
+                group_commit, port, os.path.join(tmp, "bench.db"), args.threads
+            )
+            try:
+                cookies = create_users(port, users)
+                pairs = iter(
+                    [
+                        (cookie, habit_id)
+                        for habit_id in range(1, HABITS_PER_USER + 1)
+                        for cookie in cookies
+                    ]
+                )
+                for concurrency in args.concurrency:
+                    before = committed_batches(port)
+                    result = run_level(port, pairs, args.requests, concurrency)
+                    after = committed_batches(port)
+                    commits = after - before if group_commit else result["ok"]
+                    print(
+                        f"{'on' if group_commit else 'off':<6} {concurrency:>5} "
+                        f"{args.requests / result['duration']:>9.1f} "
+                        f"{commits / result['duration']:>10.1f} "
+                        f"{result['ok'] / max(commits, 1):>6.1f} "
+                        f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+                        f"{result['errors']}"
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+BirdQuest - Sharding benchmark
+Drives /api/complete-habit at a fixed concurrency against gunicorn with the
+per-user tables in 0 (one database), 1, 2, 4 and 8 SQLite shards, and
+reports requests per second for each.
+
+    python benchmarks/bench_shards.py --requests 1200 --concurrency 32 --shards 0 1 2 4 8
+
+Every request completes a habit nobody has completed yet today, so each
+one is a real write. With one database every write waits for the same
+SQLite write lock; sharded, writes for users in different shards don't.
+More than one worker (--workers) needs CACHE_URL pointing at Redis.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench_api import create_users, free_port, wait_for_port
+from bench_group_commit import HABITS_PER_USER, run_level
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(shards, port, tmp, workers, threads):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        SHARDS=str(shards),
+        SHARD_URL_TEMPLATE=f"sqlite:///{os.path.join(tmp, 'bench-{shard}.db')}",
+        SECRET_KEY="benchmark",
+        DEPLOY_PROFILE="single",
+        GUNICORN_CMD_ARGS=(
+            f"--bind 127.0.0.1:{port} --workers {workers} --worker-class gthread "
+            f"--threads {threads} --max-requests 0"
+        ),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        cwd=PROJECT_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    wait_for_port(port)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--requests", type=int, default=1200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--shards", type=int, nargs="+", default=[0, 1, 2, 4, 8])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+
+    # Enough users that no habit is completed twice
+    users = max(args.users, -(-args.requests // HABITS_PER_USER))
+
+    print(f"{'shards':>6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} errors")
+    for shards in args.shards:
+        with tempfile.TemporaryDirectory() as tmp:
+            port = free_port()
+            server = start_server(shards, port, tmp, args.workers, args.threads)
+            try:
+                cookies = create_users(port, users)
+                pairs = iter(
+                    [
+                        (cookie, habit_id)
+                        for habit_id in range(1, HABITS_PER_USER + 1)
+                        for cookie in cookies
+                    ]
+                )
+                result = run_level(port, pairs, args.requests, args.concurrency)
+                print(
+                    f"{shards:>6} {args.requests / result['duration']:>9.1f} "
+                    f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+                    f"{result['errors']}"
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+BirdQuest - Template benchmark
+Per template: time to compile from source, time to load from the bytecode
+cache, and mean render time while serving the real pages.
+
+    python benchmarks/bench_templates.py --repeat 50
+
+Runs the app in-process with the Flask test client on a fresh SQLite
+database.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGES = ["/", "/dashboard", "/shop", "/leaderboard"]
+
+
+def load_app(tmp):
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        TEMPLATE_CACHE_DIR=os.path.join(tmp, "jinja_cache"),
+        SECRET_KEY="benchmark",
+        DEPLOY_PROFILE="single",
+    )
+    sys.path.insert(0, PROJECT_DIR)
+    import app
+
+    return app
+
+
+def time_loads(env, names, repeat):
+    """Mean ms per get_template() for each name, with no in-memory cache."""
+    results = {}
+    for name in names:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            env.get_template(name)
+        results[name] = (time.perf_counter() - start) / repeat * 1000
+    return results
+
+
+def time_renders(app, client, repeat):
+    """Mean ms spent rendering each template while serving PAGES."""
+    from flask import before_render_template, template_rendered
+
+    started = {}
+    timings = defaultdict(list)
+
+    def before(sender, template, context, **extra):
+        started[template.name] = time.perf_counter()
+
+    def after(sender, template, context, **extra):
+        timings[template.name].append(time.perf_counter() - started[template.name])
+
+    before_render_template.connect(before, app)
+    template_rendered.connect(after, app)
+    try:
+        for _ in range(repeat):
+            for page in PAGES:
+                client.get(page)
+    finally:
+        before_render_template.disconnect(before, app)
+        template_rendered.disconnect(after, app)
+    return {name: statistics.mean(t) * 1000 for name, t in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        module = load_app(tmp)
+        app = module.app
+        names = app.jinja_env.list_templates()
+
+        # cache_size=0 makes every get_template() go back to the loader
+        compile_ms = time_loads(
+            app.jinja_env.overlay(bytecode_cache=None, cache_size=0),
+            names,
+            args.repeat,
+        )
+        bytecode_ms = time_loads(
+            app.jinja_env.overlay(cache_size=0), names, args.repeat
+        )
+
+        client = app.test_client()
+        for i in range(args.users):
+            name = f"bench{i}"
+            client.post(
+                "/register",
+                data={
+                    "username": name,
+                    "email": f"{name}@example.com",
+                    "password": "benchmark",
+                    "confirm_password": "benchmark",
+                },
+            )
+        client.post("/login", data={"username": name, "password": "benchmark"})
+        for habit_id in range(1, 6):
+            client.post("/api/complete-habit", json={"habit_id": habit_id})
+        render_ms = time_renders(app, client, args.repeat)
+
+    print(f"{'template':<24} {'compile ms':>11} {'bytecode ms':>12} {'render ms':>10}")
+    for name in names:
+        render = render_ms.get(name)
+        print(
+            f"{name:<24} {compile_ms[name]:>11.2f} {bytecode_ms[name]:>12.2f} "
+            + (f"{render:>10.2f}" if render is not None else f"{'-':>10}")
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+BirdQuest - Static Asset Build Script
+Copies everything under static/ to static/dist/ with a content hash in the
+filename, precompresses text assets (.gz, and .br when Brotli is
+installed), and writes the manifest app.py uses to rewrite
+url_for('static', ...) to the fingerprinted files.
+
+    python build_images.py   # first, so the derived images are included
+    python build_assets.py
+
+static/dist/ is rebuilt from scratch on each run and is not committed.
+Without a manifest the app serves the original files as before.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(PROJECT_DIR, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+
+# Images are already compressed; only text assets get .gz/.br variants
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt"}
+
+
+def fingerprint(source, relative):
+    """css/style.css -> css/style.<first 12 hex of sha256>.css"""
+    with open(source, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    stem, ext = os.path.splitext(relative)
+    return f"{stem}.{digest}{ext}"
+
+
+def precompress(path):
+    """Write .gz/.br next to path when they are smaller; returns bytes saved."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(data, quality=11)
+
+    best = len(data)
+    for suffix, compressed in variants.items():
+        if len(compressed) >= len(data):
+            continue
+        with open(path + suffix, "wb") as f:
+            f.write(compressed)
+        best = min(best, len(compressed))
+    return len(data) - best
+
+
+def main():
+    if brotli is None:
+        print("⚠️ Brotli is not installed; writing .gz variants only")
+
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+
+    manifest = {}
+    saved = 0
+    for root, dirs, files in os.walk(STATIC_DIR):
+        if root == STATIC_DIR and "dist" in dirs:
+            dirs.remove("dist")
+        dirs.sort()
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, STATIC_DIR).replace(os.sep, "/")
+            hashed = fingerprint(source, relative)
+
+            target = os.path.join(DIST_DIR, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+            manifest[relative] = "dist/" + hashed
+
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE:
+                saved += precompress(target)
+
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    print(f"📦 Fingerprinted {len(manifest)} static files into static/dist/")
+    print(f"   Precompression saves {saved / 1024:,.0f} KB on text assets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+BirdQuest - Image Build Script
+Generates resized WebP/AVIF copies of the PNGs in static/images, plus a
+manifest the templates use to emit srcset. Requires Pillow.
+
+    python build_images.py [--force]
+
+Derived files are written to static/images/derived/ and are not committed;
+run this as part of the deploy build. Pages fall back to the original PNG
+for any image that has no derivatives.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+try:
+    from PIL import Image, features
+except ImportError:
+    sys.exit("build_images.py needs Pillow: pip install Pillow")
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGES_DIR = os.path.join(PROJECT_DIR, "static", "images")
+DERIVED_DIR = os.path.join(IMAGES_DIR, "derived")
+MANIFEST_PATH = os.path.join(DERIVED_DIR, "manifest.json")
+
+# Enough for 30px leaderboard avatars and 130-150px cards, at 1x and 2x
+WIDTHS = [64, 160, 320]
+
+# Format -> Pillow save options
+FORMATS = {
+    "avif": {"quality": 55},
+    "webp": {"quality": 80, "method": 6},
+}
+
+
+def derived_name(image, width, fmt):
+    stem = os.path.splitext(image)[0]
+    return f"{stem}-{width}.{fmt}"
+
+
+def build_image(image, formats, force=False):
+    """Write every variant of one image; returns its manifest entry."""
+    source = os.path.join(IMAGES_DIR, image)
+    source_mtime = os.path.getmtime(source)
+
+    with Image.open(source) as original:
+        original.load()
+        width, height = original.size
+        entry = {"width": width, "height": height, "variants": {}}
+
+        for fmt in formats:
+            widths = []
+            for target_width in WIDTHS:
+                if target_width > width:
+                    continue
+                widths.append(target_width)
+                path = os.path.join(DERIVED_DIR, derived_name(image, target_width, fmt))
+                if (
+                    not force
+                    and os.path.exists(path)
+                    and os.path.getmtime(path) >= source_mtime
+                ):
+                    continue
+                target_height = round(height * target_width / width)
+                resized = original.resize(
+                    (target_width, target_height), Image.Resampling.LANCZOS
+                )
+                resized.save(path, fmt.upper(), **FORMATS[fmt])
+            if widths:
+                entry["variants"][fmt] = widths
+
+    return entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build resized bird images")
+    parser.add_argument(
+        "--force", action="store_true", help="rebuild even if up to date"
+    )
+    args = parser.parse_args()
+
+    formats = [fmt for fmt in FORMATS if features.check(fmt)]
+    skipped = sorted(set(FORMATS) - set(formats))
+    if skipped:
+        print(f"⚠️ Pillow has no support for {', '.join(skipped)}; skipping")
+
+    os.makedirs(DERIVED_DIR, exist_ok=True)
+
+    manifest = {}
+    original_bytes = 0
+    derived_bytes = 0
+    for image in sorted(os.listdir(IMAGES_DIR)):
+        if not image.lower().endswith(".png"):
+            continue
+        entry = build_image(image, formats, force=args.force)
+        manifest[image] = entry
+
+        original_bytes += os.path.getsize(os.path.join(IMAGES_DIR, image))
+        for fmt, widths in entry["variants"].items():
+            for width in widths:
+                derived_bytes += os.path.getsize(
+                    os.path.join(DERIVED_DIR, derived_name(image, width, fmt))
+                )
+
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    print(f"🖼️ Built {len(manifest)} images in {', '.join(formats)}")
+    print(f"   Originals: {original_bytes / 1024:,.0f} KB")
+    print(f"   Derived:   {derived_bytes / 1024:,.0f} KB (all widths and formats)")
+
+
+if __name__ == "__main__":
+    main()
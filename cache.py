@@ -0,0 +1,250 @@
+"""
+BirdQuest - Cache
+Small caching layer shared by the app's read paths.
+
+Values live under namespaced keys that embed a version stamp, so a write
+route invalidates everything cached for a user (or globally) by bumping one
+version instead of hunting down individual keys.
+"""
+
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# How long a recompute may hold the single-flight lock before others give up
+LOCK_TTL = 10
+LOCK_POLL_INTERVAL = 0.01
+
+
+class MemoryBackend:
+    """In-process LRU cache with per-key expiry. Each worker has its own."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None, only_if_missing=False):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if only_if_missing:
+                item = self._data.get(key)
+                if item is not None and (item[1] is None or item[1] > time.monotonic()):
+                    return False
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisBackend:
+    """Backend for anything that speaks the Redis protocol (redis-py client)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(
+                "CACHE_URL points at Redis but the 'redis' package is not installed"
+            ) from e
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl=None, only_if_missing=False):
+        return bool(self.client.set(key, value, ex=ttl, nx=only_if_missing))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+class LocalRedis:
+    """In-memory stand-in for a redis-py client, for tests and local runs.
+
+    Only implements the handful of commands RedisBackend uses.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            item = self._data.get(name)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name, value, ex=None, nx=False):
+        with self._lock:
+            item = self._data.get(name)
+            if nx and item is not None:
+                if item[1] is None or item[1] > time.monotonic():
+                    return None
+            if isinstance(value, str):
+                value = value.encode()
+            self._data[name] = (value, time.monotonic() + ex if ex else None)
+            return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+
+class Cache:
+    """Namespaced, version-stamped cache with single-flight recompute."""
+
+    def __init__(self, backend, prefix="birdquest"):
+        self.backend = backend
+        self.prefix = prefix
+        self._key_locks = {}
+        self._key_locks_lock = threading.Lock()
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url=None, **kwargs):
+        """Build a cache from CACHE_URL (memory://, local://, redis://...)."""
+        if not url or url.startswith("memory://"):
+            return cls(MemoryBackend(), **kwargs)
+        if url.startswith("local://"):
+            return cls(RedisBackend(LocalRedis()), **kwargs)
+        if url.startswith(("redis://", "rediss://", "unix://")):
+            return cls(RedisBackend.from_url(url), **kwargs)
+        raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+    @property
+    def is_shared(self):
+        """True when all workers see the same entries."""
+        if isinstance(self.backend, MemoryBackend):
+            return False
+        return not isinstance(getattr(self.backend, "client", None), LocalRedis)
+
+    # Versions
+    def _version_key(self, namespace, scope):
+        return f"{self.prefix}:version:{namespace}:{scope}"
+
+    def _version(self, namespace, scope):
+        key = self._version_key(namespace, scope)
+        version = self.backend.get(key)
+        if version is None:
+            # A missing stamp (never set, or evicted) must not revive old
+            # entries, so start from a fresh unique value.
+            self.backend.set(key, uuid.uuid4().hex.encode(), only_if_missing=True)
+            version = self.backend.get(key)
+        return version.decode() if isinstance(version, bytes) else version
+
+    def bump(self, namespace, scope=""):
+        """Invalidate every entry in ``namespace`` for ``scope``."""
+        self.backend.set(self._version_key(namespace, scope), uuid.uuid4().hex.encode())
+
+    def _key(self, namespace, key, scope):
+        version = self._version(namespace, scope)
+        return f"{self.prefix}:{namespace}:{scope}:{version}:{key}"
+
+    # Reads
+    def peek(self, namespace, key, scope=""):
+        """Return the cached value or None, without counting or computing."""
+        raw = self.backend.get(self._key(namespace, key, scope))
+        return pickle.loads(raw) if raw is not None else None
+
+    def get_or_compute(self, namespace, key, compute, ttl=60, scope=""):
+        """Return the cached value, computing it at most once at a time."""
+        full_key = self._key(namespace, key, scope)
+        raw = self.backend.get(full_key)
+        if raw is not None:
+            self._count(namespace, "hits")
+            return pickle.loads(raw)
+
+        self._count(namespace, "misses")
+        with self._key_lock(full_key):
+            # Another thread in this worker may have filled it meanwhile
+            raw = self.backend.get(full_key)
+            if raw is not None:
+                self._count(namespace, "waits")
+                return pickle.loads(raw)
+
+            # Another worker may be computing it; wait for that result
+            lock_key = full_key + ":lock"
+            owns_lock = self.backend.set(lock_key, b"1", LOCK_TTL, only_if_missing=True)
+            if not owns_lock:
+                deadline = time.monotonic() + LOCK_TTL
+                while time.monotonic() < deadline:
+                    time.sleep(LOCK_POLL_INTERVAL)
+                    raw = self.backend.get(full_key)
+                    if raw is not None:
+                        self._count(namespace, "waits")
+                        return pickle.loads(raw)
+
+            try:
+                value = compute()
+                self._count(namespace, "computes")
+                self.backend.set(full_key, pickle.dumps(value), ttl)
+            finally:
+                if owns_lock:
+                    self.backend.delete(lock_key)
+            return value
+
+    def _key_lock(self, full_key):
+        with self._key_locks_lock:
+            lock = self._key_locks.get(full_key)
+            if lock is None:
+                if len(self._key_locks) > 1000:
+                    # Only locks nobody is holding can be forgotten safely
+                    self._key_locks = {
+                        k: v for k, v in self._key_locks.items() if v.locked()
+                    }
+                lock = self._key_locks[full_key] = threading.Lock()
+            return lock
+
+    # Metrics
+    def _count(self, namespace, name):
+        with self._stats_lock:
+            counters = self._stats.setdefault(
+                namespace, {"hits": 0, "misses": 0, "waits": 0, "computes": 0}
+            )
+            counters[name] += 1
+
+    def metrics(self):
+        """Per-namespace counters with hit ratios, for this worker."""
+        with self._stats_lock:
+            snapshot = {ns: dict(c) for ns, c in self._stats.items()}
+        for counters in snapshot.values():
+            lookups = counters["hits"] + counters["misses"]
+            counters["hit_ratio"] = (
+                round((counters["hits"] + counters["waits"]) / lookups, 4)
+                if lookups
+                else None
+            )
+        return {
+            "backend": type(self.backend).__name__,
+            "namespaces": snapshot,
+        }
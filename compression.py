@@ -0,0 +1,92 @@
+"""
+BirdQuest - Response compression
+gzip/Brotli encoding and optional whitespace minification for the HTML and
+JSON the app renders, plus per-route byte counters for /metrics.
+
+Static files are not touched here: build_assets.py precompresses them and
+the static view serves the .br/.gz variants directly.
+"""
+
+import gzip
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content-Encoding tokens in order of preference
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+# Blocks whose whitespace is significant (or not worth the risk)
+_PROTECTED = re.compile(
+    r"(<(pre|textarea|script)\b.*?</\2\s*>)", re.IGNORECASE | re.DOTALL
+)
+# Plain comments only; conditional comments (<!--[if ...]>) are kept
+_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+_NEWLINE_RUN = re.compile(r"[ \t\r\f\v]*\n\s*")
+
+
+def compress(data, encoding, level=None):
+    """Encode bytes as gzip or br. level defaults to a fast on-the-fly setting."""
+    if encoding == "br":
+        return brotli.compress(data, quality=5 if level is None else level)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=6 if level is None else level)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def minify_html(html):
+    """Collapse indentation and blank lines and drop comments.
+
+    Every whitespace run that contains a newline becomes a single newline, so
+    inline spacing renders exactly as before. <pre>, <textarea> and <script>
+    contents are left as they are.
+    """
+    parts = _PROTECTED.split(html)
+    out = []
+    # split() yields text, then the two capture groups, for each match
+    for i in range(0, len(parts), 3):
+        text = _COMMENT.sub("", parts[i])
+        out.append(_NEWLINE_RUN.sub("\n", text))
+        if i + 1 < len(parts):
+            out.append(parts[i + 1])
+    return "".join(out)
+
+
+class CompressionStats:
+    """Per-route byte counters: as rendered, after minifying, as sent."""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, rendered, minified, sent, encoding=None):
+        with self._lock:
+            counters = self._routes.setdefault(
+                route,
+                {
+                    "responses": 0,
+                    "compressed": 0,
+                    "bytes_rendered": 0,
+                    "bytes_minified": 0,
+                    "bytes_sent": 0,
+                },
+            )
+            counters["responses"] += 1
+            counters["compressed"] += encoding is not None
+            counters["bytes_rendered"] += rendered
+            counters["bytes_minified"] += minified
+            counters["bytes_sent"] += sent
+
+    def metrics(self):
+        """Counters per route with the share of bytes saved, for this worker."""
+        with self._lock:
+            snapshot = {route: dict(c) for route, c in self._routes.items()}
+        for counters in snapshot.values():
+            rendered = counters["bytes_rendered"]
+            counters["saved_ratio"] = (
+                round(1 - counters["bytes_sent"] / rendered, 4) if rendered else None
+            )
+        return snapshot
@@ -0,0 +1,62 @@
+"""
+BirdQuest - Streaming exports
+Encodes a stream of records (dicts) as NDJSON or CSV one line at a time, so
+an export's memory use doesn't depend on how much history it covers. The
+records come from generators over server-side cursors in app.py.
+"""
+
+import csv
+import io
+import json
+
+# Rows fetched from the database per round trip while exporting
+EXPORT_BATCH_SIZE = 1000
+
+
+def _json_default(value):
+    # dates and datetimes
+    return value.isoformat()
+
+
+def ndjson_lines(records):
+    """One JSON document per line."""
+    for record in records:
+        yield json.dumps(record, default=_json_default, separators=(",", ":")) + "\n"
+
+
+def csv_lines(records, fields):
+    """A header row, then one row per record; fields a record lacks are empty."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fields, restval="", extrasaction="ignore")
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writeheader()
+    yield flush()
+    for record in records:
+        writer.writerow(
+            {
+                key: value.isoformat() if hasattr(value, "isoformat") else value
+                for key, value in record.items()
+            }
+        )
+        yield flush()
+
+
+def buffered(lines, size=64 * 1024):
+    """Join lines into chunks of about `size` characters (fewer, larger writes)."""
+    chunk = []
+    length = 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield "".join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield "".join(chunk)
@@ -0,0 +1,122 @@
+"""
+BirdQuest - Group commit
+Queues writes from concurrent requests in a worker and runs them in shared
+transactions, so a burst of N requests costs a handful of commits (and
+fsyncs) instead of N.
+
+A job is a callable job(session, *args) -> (result, after_commit) that
+writes through the session without committing. after_commit (or None)
+runs once the batch is committed, before the caller gets its result.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class GroupCommitter:
+    """Runs submitted jobs in batches on a background thread.
+
+    A batch is flushed when it holds max_batch jobs or max_delay seconds
+    after its first job arrived, whichever comes first.
+    """
+
+    def __init__(self, session_scope, max_batch=64, max_delay=0.005):
+        # session_scope() is a context manager yielding a fresh session
+        self.session_scope = session_scope
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"jobs": 0, "batches": 0, "retried_batches": 0}
+        self._largest_batch = 0
+
+    def submit(self, job, *args):
+        """Queue a job; returns a Future for its result."""
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((future, job, args))
+        return future
+
+    def run(self, job, *args, timeout=None):
+        return self.submit(job, *args).result(timeout=timeout)
+
+    def _ensure_thread(self):
+        # Started lazily so it runs in the worker, not a preloading master
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._loop, name="group-commit", daemon=True
+            )
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch):
+        try:
+            self._run_batch(batch)
+        except Exception:
+            # One bad job must not fail the others: fall back to running
+            # each job in a transaction of its own
+            with self._lock:
+                self._stats["retried_batches"] += 1
+            for item in batch:
+                try:
+                    self._run_batch([item])
+                except Exception as e:
+                    item[0].set_exception(e)
+
+    def _run_batch(self, batch):
+        with self.session_scope() as session:
+            try:
+                done = []
+                for future, job, args in batch:
+                    result, after_commit = job(session, *args)
+                    done.append((future, result, after_commit))
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+            with self._lock:
+                self._stats["jobs"] += len(batch)
+                self._stats["batches"] += 1
+                self._largest_batch = max(self._largest_batch, len(batch))
+
+            # Still inside the scope: after_commit may read through the session
+            for future, result, after_commit in done:
+                try:
+                    if after_commit is not None:
+                        after_commit()
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+
+    def metrics(self):
+        """Jobs, committed batches and batch sizes, for this worker."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["largest_batch"] = self._largest_batch
+        stats["average_batch"] = (
+            round(stats["jobs"] / stats["batches"], 2) if stats["batches"] else None
+        )
+        stats["queued"] = self._queue.qsize()
+        return stats
@@ -0,0 +1,102 @@
+"""
+BirdQuest - Gunicorn configuration
+Worker settings are picked by DEPLOY_PROFILE:
+
+    single  one sync worker (the default, matches the original setup)
+    scale   several threaded workers per node, app preloaded in the master
+    live    like scale, with more threads for open live-update streams
+
+WEB_CONCURRENCY and GUNICORN_THREADS override the numbers of the scale and
+live profiles (single refuses them), and DEPLOY_NODES is the number of
+replicas running behind the load balancer.
+"""
+
+import multiprocessing
+import os
+
+profile = os.environ.get("DEPLOY_PROFILE", "single")
+cpu_count = multiprocessing.cpu_count()
+
+PROFILES = {
+    "single": {
+        "workers": 1,
+        "worker_class": "sync",
+        "threads": 1,
+        "preload_app": False,
+        "tunable": False,
+    },
+    "scale": {
+        "workers": cpu_count * 2 + 1,
+        "worker_class": "gthread",
+        "threads": 4,
+        "preload_app": True,
+        "tunable": True,
+    },
+    "live": {
+        "workers": cpu_count + 1,
+        "worker_class": "gthread",
+        "threads": 32,
+        "preload_app": True,
+        "tunable": True,
+    },
+}
+
+if profile not in PROFILES:
+    raise RuntimeError(
+        f"Unknown DEPLOY_PROFILE {profile!r}; expected one of {', '.join(PROFILES)}"
+    )
+settings = PROFILES[profile]
+
+
+def tuned(variable, key):
+    """The profile's setting, or the environment's override of it."""
+    value = os.environ.get(variable)
+    if value is None:
+        return settings[key]
+    if not settings["tunable"]:
+        raise RuntimeError(
+            f"{variable} is set, but DEPLOY_PROFILE {profile!r} has a fixed "
+            f"{key} count of {settings[key]}; unset {variable} or use "
+            "DEPLOY_PROFILE=scale or live"
+        )
+    return int(value)
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = tuned("WEB_CONCURRENCY", "workers")
+worker_class = settings["worker_class"]
+threads = tuned("GUNICORN_THREADS", "threads")
+preload_app = settings["preload_app"]
+
+# Keep connections from the Railway proxy open between requests
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
+
+# Recycle workers now and then so slow leaks can't accumulate; the jitter
+# stops them all restarting at the same moment
+max_requests = 1000
+max_requests_jitter = 100
+
+
+def on_starting(server):
+    from app import check_deployment
+
+    check_deployment(
+        workers=server.cfg.workers,
+        worker_class=server.cfg.worker_class_str,
+        nodes=int(os.environ.get("DEPLOY_NODES", 1)),
+    )
+
+
+def post_fork(server, worker):
+    # Connections opened by the preloading master must not be shared
+    # with the forked workers
+    from app import admission, app, db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+    # Requests this worker runs at once, for admission control
+    if server.cfg.worker_class_str == "gthread":
+        admission.capacity = server.cfg.threads
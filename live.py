@@ -0,0 +1,187 @@
+"""
+BirdQuest - Live updates
+Minimal pub/sub feeding the Server-Sent Events stream at /api/events.
+
+Channels are plain strings ("user:<id>", "leaderboard"). The in-process
+Broker only reaches browsers connected to the same worker; RedisBroker
+relays through Redis pub/sub so every worker sees every message, and keeps
+a short-lived presence key per channel so publishers can tell whether a
+browser anywhere is listening.
+"""
+
+import json
+import queue
+import threading
+import time
+
+
+class Subscription:
+    """A subscriber's view of one or more channels."""
+
+    def __init__(self, broker, channels, max_queue):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self._queue = queue.Queue(maxsize=max_queue)
+
+    def deliver(self, event, data):
+        try:
+            self._queue.put_nowait((event, data))
+        except queue.Full:
+            # A stalled client loses its oldest message rather than
+            # holding up the publisher
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait((event, data))
+
+    def get(self, timeout=None):
+        """Next (event, data) pair, or None if nothing arrived in time."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """In-process pub/sub. Publishing never blocks on slow subscribers."""
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels, self.max_queue)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def has_subscribers(self, channel):
+        return bool(self._subscribers.get(channel))
+
+    def publish(self, channel, event, data):
+        self._deliver(channel, event, data)
+
+    def _deliver(self, channel, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(event, data)
+
+    def connection_count(self):
+        with self._lock:
+            return len({s for subs in self._subscribers.values() for s in subs})
+
+
+class RedisBroker(Broker):
+    """Broker that relays messages between workers through Redis pub/sub."""
+
+    # A worker refreshes the presence keys of its channels every third of
+    # this, so a channel counts as listened to until PRESENCE_TTL seconds
+    # after its last subscriber anywhere left
+    PRESENCE_TTL = 30
+
+    def __init__(self, client, prefix="birdquest:live:", **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.prefix = prefix
+        self._listener = None
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(
+                "LIVE_BROKER_URL points at Redis but the 'redis' package is not "
+                "installed"
+            ) from e
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _presence_key(self, channel):
+        return f"{self.prefix}presence:{channel}"
+
+    def _mark_present(self, channels):
+        if not channels:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for channel in channels:
+            pipe.set(self._presence_key(channel), 1, ex=self.PRESENCE_TTL)
+        pipe.execute()
+
+    def has_subscribers(self, channel):
+        # Subscribers may be connected to any worker
+        if super().has_subscribers(channel):
+            return True
+        return bool(self.client.exists(self._presence_key(channel)))
+
+    def publish(self, channel, event, data):
+        payload = json.dumps({"event": event, "data": data})
+        self.client.publish(self.prefix + channel, payload)
+
+    def subscribe(self, channels):
+        self._ensure_listener()
+        subscription = super().subscribe(channels)
+        self._mark_present(subscription.channels)
+        return subscription
+
+    def _ensure_listener(self):
+        # Started lazily so it runs in the worker, not a preloading master
+        if self._listener is not None and self._listener.is_alive():
+            return
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(
+                target=self._listen, name="live-broker", daemon=True
+            )
+            self._listener.start()
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self.prefix + "*")
+        refreshed = time.monotonic()
+        while True:
+            message = pubsub.get_message(timeout=1.0)
+            if time.monotonic() - refreshed >= self.PRESENCE_TTL / 3:
+                with self._lock:
+                    channels = list(self._subscribers)
+                self._mark_present(channels)
+                refreshed = time.monotonic()
+            if message is None or message["type"] != "pmessage":
+                continue
+            channel = message["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            payload = json.loads(message["data"])
+            self._deliver(
+                channel[len(self.prefix) :], payload["event"], payload["data"]
+            )
+
+
+def create_broker(url=None):
+    """Build a broker from LIVE_BROKER_URL (unset/memory:// or redis://)."""
+    if not url or url.startswith("memory://"):
+        return Broker()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker.from_url(url)
+    raise ValueError(f"Unsupported LIVE_BROKER_URL: {url}")
+
+
+def format_sse(event, data):
+    """Encode one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
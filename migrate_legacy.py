@@ -0,0 +1,526 @@
+#!/usr/bin/env python
+"""
+BirdQuest - Legacy data migration
+Copies a database in the models.py schema (users, tasks, task_logs, birds,
+user_birds) into the schema app.py runs on:
+
+    users       -> User (plus an opening LedgerEntry for the balance)
+    tasks       -> CustomHabit
+    task_logs   -> CompletedHabit
+    user_birds  -> OwnedBird (species matched by name, then rarity)
+
+    python migrate_legacy.py sqlite:///legacy.db --batch-size 5000
+
+The target is app.py's DATABASE_URL. Source rows are streamed in id order
+and each batch is written in one transaction together with a checkpoint,
+so an interrupted run picks up where it stopped when started again. At
+the end each migrated user's xp, level and seeds are compared with the
+source row and with their ledger (as `flask verify-ledger` does). The
+checkpoint and legacy-to-new id map live in the legacy_migration and
+legacy_id_map tables of the target; drop them once you are done.
+
+Users whose username or email already exist in the target are skipped,
+together with everything they own.
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    insert,
+    select,
+)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_DIR)
+
+from app import (  # noqa: E402
+    AVAILABLE_BIRDS,
+    SHARDS,
+    BirdOwnershipCount,
+    CompletedHabit,
+    CustomHabit,
+    LedgerEntry,
+    OwnedBird,
+    User,
+    app,
+    count_owners_by_bird,
+    db,
+    ledger_balances,
+    ownership_bit,
+    seed_ownership_counts,
+)
+
+LEGACY_TABLES = ["users", "birds", "user_birds", "tasks", "task_logs"]
+
+state = MetaData()
+checkpoints = Table(
+    "legacy_migration",
+    state,
+    Column("step", String(20), primary_key=True),
+    Column("last_id", Integer, nullable=False),
+    Column("copied", Integer, nullable=False),
+    Column("skipped", Integer, nullable=False),
+)
+id_map = Table(
+    "legacy_id_map",
+    state,
+    Column("kind", String(10), primary_key=True),
+    Column("legacy_id", Integer, primary_key=True),
+    Column("new_id", Integer, nullable=False),
+)
+
+
+def match_bird(name, rarity):
+    """The app bird id for a legacy species: same name, same last word
+    ("Owl" -> "Snowy Owl"), else the first bird of the same rarity."""
+    name = (name or "").strip().lower()
+    for bird in AVAILABLE_BIRDS:
+        if bird["name"].lower() == name:
+            return bird["id"]
+    last_word = name.split()[-1] if name else None
+    for bird in AVAILABLE_BIRDS:
+        if bird["name"].lower().split()[-1] == last_word:
+            return bird["id"]
+    for bird in AVAILABLE_BIRDS:
+        if bird["rarity"] == rarity:
+            return bird["id"]
+    return AVAILABLE_BIRDS[0]["id"]
+
+
+def mapped_ids(session, kind, legacy_ids):
+    """{legacy id: new id} for the given legacy ids that were migrated."""
+    rows = session.execute(
+        select(id_map.c.legacy_id, id_map.c.new_id).where(
+            id_map.c.kind == kind, id_map.c.legacy_id.in_(set(legacy_ids))
+        )
+    )
+    return dict(rows.all())
+
+
+def remember_ids(session, kind, legacy_ids, new_ids):
+    session.execute(
+        insert(id_map),
+        [
+            {"kind": kind, "legacy_id": legacy, "new_id": new}
+            for legacy, new in zip(legacy_ids, new_ids)
+        ],
+    )
+
+
+# Each copy_* function writes one batch of source rows without committing,
+# returns how many it copied and adds the reason for every row it didn't
+# to `skipped`.
+
+
+def copy_users(session, rows, skipped):
+    names = {row.username for row in rows}
+    emails = {row.email for row in rows}
+    taken = set(
+        session.scalars(select(User.username).where(User.username.in_(names)))
+    ) | set(session.scalars(select(User.email).where(User.email.in_(emails))))
+    fresh = [r for r in rows if r.username not in taken and r.email not in taken]
+    skipped["username or email taken"] += len(rows) - len(fresh)
+    if not fresh:
+        return 0
+
+    values = [
+        {
+            "username": row.username,
+            "email": row.email,
+            "password_hash": row.password_hash,
+            "xp": row.xp or 0,
+            "level": row.level or 1,
+            "seeds": row.seeds or 0,
+            "streak": row.current_streak or 0,
+            "last_streak_date": row.last_activity_date,
+            "created_at": row.created_at or datetime.utcnow(),
+        }
+        for row in fresh
+    ]
+    for value in values:
+        # The balance is recorded as the user's first ledger entry below
+        opening = value["xp"] or value["seeds"] or value["level"] != 1
+        value["ledger_seq"] = 1 if opening else 0
+    new_ids = session.scalars(
+        insert(User).returning(User.id, sort_by_parameter_order=True), values
+    ).all()
+    remember_ids(session, "user", [row.id for row in fresh], new_ids)
+
+    entries = [
+        {
+            "user_id": user_id,
+            "seq": 1,
+            "kind": "opening_balance",
+            "xp_delta": value["xp"],
+            "level_delta": value["level"] - 1,
+            "seeds_delta": value["seeds"],
+            "ref": "legacy",
+        }
+        for user_id, value in zip(new_ids, values)
+        if value["ledger_seq"]
+    ]
+    if entries:
+        session.execute(insert(LedgerEntry), entries)
+    return len(fresh)
+
+
+def copy_tasks(session, rows, skipped):
+    users = mapped_ids(session, "user", [row.user_id for row in rows])
+    fresh = [row for row in rows if row.user_id in users]
+    skipped["owner not migrated"] += len(rows) - len(fresh)
+    if not fresh:
+        return 0
+
+    new_ids = session.scalars(
+        insert(CustomHabit).returning(CustomHabit.id, sort_by_parameter_order=True),
+        [
+            {
+                "user_id": users[row.user_id],
+                "name": row.name[:100],
+                "xp": row.xp_reward or 10,
+                "category": row.category or "custom",
+                "created_at": row.created_at or datetime.utcnow(),
+            }
+            for row in fresh
+        ],
+    ).all()
+    remember_ids(session, "task", [row.id for row in fresh], new_ids)
+    return len(fresh)
+
+
+def copy_task_logs(session, rows, skipped):
+    habits = mapped_ids(session, "task", [row.task_id for row in rows])
+    users = mapped_ids(session, "user", [row.user_id for row in rows])
+
+    # One completion per habit and day, as the app records them
+    candidates = {}
+    for row in rows:
+        if row.task_id not in habits or row.user_id not in users:
+            skipped["task or owner not migrated"] += 1
+        elif row.completed_at is None:
+            skipped["no completion time"] += 1
+        else:
+            key = (users[row.user_id], habits[row.task_id], row.completed_at.date())
+            if key in candidates:
+                skipped["habit already done that day"] += 1
+            else:
+                candidates[key] = row.completed_at
+    if not candidates:
+        return 0
+
+    days = [day for _, _, day in candidates]
+    existing = set(
+        session.execute(
+            select(
+                CompletedHabit.user_id, CompletedHabit.habit_id, CompletedHabit.date
+            ).where(
+                CompletedHabit.user_id.in_({user_id for user_id, _, _ in candidates}),
+                CompletedHabit.habit_id.in_(
+                    {habit_id for _, habit_id, _ in candidates}
+                ),
+                CompletedHabit.is_custom.is_(True),
+                CompletedHabit.date.between(min(days), max(days)),
+            )
+        ).all()
+    )
+    values = [
+        {
+            "user_id": user_id,
+            "habit_id": habit_id,
+            "is_custom": True,
+            "date": day,
+            "completed_at": completed_at,
+        }
+        for (user_id, habit_id, day), completed_at in candidates.items()
+        if (user_id, habit_id, day) not in existing
+    ]
+    skipped["habit already done that day"] += len(candidates) - len(values)
+    if values:
+        session.execute(insert(CompletedHabit), values)
+    return len(values)
+
+
+def copy_user_birds(session, rows, skipped, species):
+    users = mapped_ids(session, "user", [row.user_id for row in rows])
+    mapped = [row for row in rows if row.user_id in users]
+    skipped["owner not migrated"] += len(rows) - len(mapped)
+
+    # One OwnedBird per species; any shiny copy makes it shiny
+    wanted = {}
+    for row in mapped:
+        key = (users[row.user_id], species.get(row.bird_id, AVAILABLE_BIRDS[0]["id"]))
+        wanted[key] = wanted.get(key, False) or bool(row.is_shiny)
+    owned = {
+        (bird.user_id, bird.bird_id): bird
+        for bird in session.query(OwnedBird).filter(
+            OwnedBird.user_id.in_({user_id for user_id, _ in wanted})
+        )
+    }
+    copied = 0
+    for (user_id, bird_id), is_shiny in wanted.items():
+        existing = owned.get((user_id, bird_id))
+        if existing is None:
+            session.add(OwnedBird(user_id=user_id, bird_id=bird_id, is_shiny=is_shiny))
+            copied += 1
+        elif is_shiny:
+            existing.is_shiny = True
+    skipped["same species owned twice"] += len(mapped) - copied
+    return copied
+
+
+def finish_users(session, users, equipped, species):
+    """Equip each migrated user's bird and build their ownership bitmap.
+
+    users maps legacy to new ids; equipped maps legacy user ids to their
+    equipped (legacy bird id, is_shiny), if any.
+    """
+    owned = {}
+    for bird in session.query(OwnedBird).filter(OwnedBird.user_id.in_(users.values())):
+        owned.setdefault(bird.user_id, {})[bird.bird_id] = bird
+
+    legacy_ids = {new: legacy for legacy, new in users.items()}
+    for user in User.query.filter(User.id.in_(users.values())):
+        birds = owned.setdefault(user.id, {})
+        legacy_bird, legacy_shiny = equipped.get(legacy_ids[user.id], (None, False))
+        bird_id = species.get(legacy_bird, AVAILABLE_BIRDS[0]["id"])
+        if bird_id not in birds:
+            # Like registration: everyone owns the bird they have equipped
+            birds[bird_id] = OwnedBird(user_id=user.id, bird_id=bird_id, is_shiny=False)
+            session.add(birds[bird_id])
+        user.current_bird_id = bird_id
+        user.current_bird_shiny = bool(legacy_shiny) and birds[bird_id].is_shiny
+        bits = 0
+        for bird in birds.values():
+            bits |= ownership_bit(bird.bird_id, bird.is_shiny)
+        user.owned_bits = bits
+
+
+def load_checkpoint(session, step):
+    checkpoint = session.execute(
+        select(checkpoints).where(checkpoints.c.step == step)
+    ).first()
+    if checkpoint is None:
+        session.execute(
+            insert(checkpoints), {"step": step, "last_id": 0, "copied": 0, "skipped": 0}
+        )
+        session.commit()
+        return 0, 0, 0
+    return checkpoint.last_id, checkpoint.copied, checkpoint.skipped
+
+
+def save_checkpoint(session, step, last_id, copied, skipped):
+    session.execute(
+        checkpoints.update()
+        .where(checkpoints.c.step == step)
+        .values(last_id=last_id, copied=copied, skipped=skipped)
+    )
+
+
+def run_step(session, source, step, table, copy, batch_size):
+    """Stream `table` from the checkpoint on, one transaction per batch.
+
+    Returns (copied, skipped) over all runs and this run's skip reasons.
+    """
+    last_id, copied_total, skipped_total = load_checkpoint(session, step)
+    query = (
+        select(table)
+        .where(table.c.id > last_id)
+        .order_by(table.c.id)
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    reasons = Counter()
+    started = time.perf_counter()
+    processed = 0
+    for rows in source.execute(query).partitions(batch_size):
+        copied = copy(session, rows, reasons)
+        copied_total += copied
+        skipped_total += len(rows) - copied
+        last_id = rows[-1].id
+        save_checkpoint(session, step, last_id, copied_total, skipped_total)
+        session.commit()
+        processed += len(rows)
+        rate = processed / (time.perf_counter() - started)
+        print(
+            f"  {step}: {copied_total} copied, {skipped_total} skipped "
+            f"(up to id {last_id}, {rate:,.0f} rows/s)"
+        )
+    return copied_total, skipped_total, reasons
+
+
+def run_finish_users(session, source, legacy, species, batch_size):
+    last_id, finished, _ = load_checkpoint(session, "finish_users")
+    users_table, birds_table = legacy.tables["users"], legacy.tables["user_birds"]
+    started = time.perf_counter()
+    while True:
+        rows = session.execute(
+            select(id_map.c.legacy_id, id_map.c.new_id)
+            .where(id_map.c.kind == "user", id_map.c.legacy_id > last_id)
+            .order_by(id_map.c.legacy_id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        users = dict(rows)
+        equipped = {
+            user_id: (bird_id, is_shiny)
+            for user_id, bird_id, is_shiny in source.execute(
+                select(users_table.c.id, birds_table.c.bird_id, birds_table.c.is_shiny)
+                .join(birds_table, users_table.c.current_bird_id == birds_table.c.id)
+                .where(users_table.c.id.in_(list(users)))
+            )
+        }
+        finish_users(session, users, equipped, species)
+        finished += len(rows)
+        last_id = rows[-1].legacy_id
+        save_checkpoint(session, "finish_users", last_id, finished, 0)
+        session.commit()
+        rate = finished / (time.perf_counter() - started)
+        print(f"  finish_users: {finished} users ({rate:,.0f} rows/s)")
+
+
+def reconcile_counters(session):
+    """Recount owners per bird now that OwnedBird has grown."""
+    seed_ownership_counts()
+    counts = count_owners_by_bird(session)
+    for row in BirdOwnershipCount.query.with_for_update():
+        row.owners = counts.get((row.bird_id, row.is_shiny), 0)
+    session.commit()
+
+
+def check_balances(session, source, legacy, batch_size):
+    """Compare every migrated user's balance with the source and the ledger.
+
+    Returns (users checked, users whose xp/level/seeds differ).
+    """
+    users_table = legacy.tables["users"]
+    checked = mismatched = 0
+    last_id = 0
+    while True:
+        rows = session.execute(
+            select(id_map.c.legacy_id, id_map.c.new_id)
+            .where(id_map.c.kind == "user", id_map.c.legacy_id > last_id)
+            .order_by(id_map.c.legacy_id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return checked, mismatched
+        users = dict(rows)
+        expected = {
+            users[row.id]: (row.xp or 0, row.level or 1, row.seeds or 0)
+            for row in source.execute(
+                select(
+                    users_table.c.id,
+                    users_table.c.xp,
+                    users_table.c.level,
+                    users_table.c.seeds,
+                ).where(users_table.c.id.in_(list(users)))
+            )
+        }
+        ledger = ledger_balances(session, list(users.values()))
+        for user in session.query(
+            User.id, User.username, User.xp, User.level, User.seeds
+        ).filter(User.id.in_(list(users.values()))):
+            balance = (user.xp, user.level, user.seeds)
+            if balance != expected[user.id] or balance != ledger[user.id]:
+                mismatched += 1
+                print(
+                    f"  ⚠️ {user.username}: xp/level/seeds {balance}, source "
+                    f"{expected[user.id]}, ledger {ledger[user.id]}"
+                )
+        checked += len(rows)
+        last_id = rows[-1].legacy_id
+        session.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("source", help="SQLAlchemy URL of the models.py database")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    if SHARDS:
+        raise SystemExit(
+            "❌ Migrate into a single database (SHARDS=0), then split it with "
+            "reshard.py"
+        )
+
+    source_engine = create_engine(args.source)
+    legacy = MetaData()
+    legacy.reflect(source_engine, only=LEGACY_TABLES)
+
+    with app.app_context(), source_engine.connect() as source:
+        session = db.session
+        state.create_all(db.engine)
+        species = {
+            row.id: match_bird(row.name, row.rarity)
+            for row in source.execute(select(legacy.tables["birds"]))
+        }
+        source_counts = {
+            name: source.execute(
+                select(db.func.count()).select_from(legacy.tables[name])
+            ).scalar()
+            for name in LEGACY_TABLES
+        }
+
+        steps = [
+            ("users", copy_users),
+            ("tasks", copy_tasks),
+            ("task_logs", copy_task_logs),
+            (
+                "user_birds",
+                lambda s, rows, skipped: copy_user_birds(s, rows, skipped, species),
+            ),
+        ]
+        report = {}
+        for step, copy in steps:
+            print(f"➡️  {step}")
+            report[step] = run_step(
+                session, source, step, legacy.tables[step], copy, args.batch_size
+            )
+        print("➡️  equipped birds and ownership bitmaps")
+        run_finish_users(session, source, legacy, species, args.batch_size)
+        reconcile_counters(session)
+
+        print("\nValidation (skip reasons are for this run)")
+        print(f"  {'table':<12} {'source':>9} {'copied':>9} {'skipped':>9}")
+        ok = True
+        for step, (copied, skipped, reasons) in report.items():
+            accounted = copied + skipped == source_counts[step]
+            ok &= accounted
+            print(
+                f"  {step:<12} {source_counts[step]:>9} {copied:>9} {skipped:>9}"
+                + ("" if accounted else "  ⚠️ rows unaccounted for")
+            )
+            for reason, count in reasons.items():
+                print(f"  {'':<32} {count:>9}  {reason}")
+        for kind, step in (("user", "users"), ("task", "tasks")):
+            mapped = session.execute(
+                select(db.func.count()).where(id_map.c.kind == kind)
+            ).scalar()
+            if mapped != report[step][0]:
+                ok = False
+                print(
+                    f"  ⚠️ {mapped} {kind}s in legacy_id_map, {report[step][0]} copied"
+                )
+        checked, mismatched = check_balances(session, source, legacy, args.batch_size)
+        ok &= not mismatched
+        print(f"  balances: {checked} users checked, {mismatched} mismatched")
+
+    if not ok:
+        print("❌ Migration finished with discrepancies")
+        raise SystemExit(1)
+    print("✅ Migration complete")
+
+
+if __name__ == "__main__":
+    main()
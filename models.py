@@ -5,6 +5,8 @@ from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from streaks import streaks
+
 db = SQLAlchemy()
 
 # Bird rarities with their multipliers and costs
@@ -50,6 +52,10 @@ class User(UserMixin, db.Model):
     current_bird_id = db.Column(
         db.Integer, db.ForeignKey("user_birds.id"), nullable=True
     )
+    # Its rarity key ("epic_shiny") and seed multiplier, kept by equip() so
+    # XP grants need no lookup; check_equipped_birds() verifies them
+    bird_rarity_key = db.Column(db.String(30), nullable=True)
+    seed_multiplier = db.Column(db.Float, nullable=True)
 
     # Streak tracking
     current_streak = db.Column(db.Integer, default=0)
@@ -110,14 +116,22 @@ class User(UserMixin, db.Model):
 
     def get_seed_multiplier(self):
         """Get the seed multiplier from equipped bird"""
-        if self.current_bird_id:
-            equipped = UserBird.query.get(self.current_bird_id)
-            if equipped:
-                rarity_key = equipped.rarity
-                if equipped.is_shiny:
-                    rarity_key += "_shiny"
-                return RARITIES.get(rarity_key, {}).get("multiplier", 1.0)
-        return 1.0
+        if self.seed_multiplier is not None:
+            return self.seed_multiplier
+        # Not filled in yet (see check_equipped_birds)
+        equipped = self.get_equipped_bird()
+        return equipped.get_multiplier() if equipped else 1.0
+
+    def get_rarity_color(self):
+        """Background tint for the equipped bird's rarity"""
+        rarity = (self.bird_rarity_key or "common").removesuffix("_shiny")
+        return RARITIES.get(rarity, {}).get("color", "#ffffff")
+
+    def equip(self, user_bird):
+        """Equip one of the user's birds (None to unequip)"""
+        self.current_bird_id = user_bird.id if user_bird else None
+        self.bird_rarity_key = user_bird.rarity_key if user_bird else None
+        self.seed_multiplier = user_bird.get_multiplier() if user_bird else 1.0
 
     def update_streak(self):
         """Update streak based on activity"""
@@ -205,16 +219,18 @@ class UserBird(db.Model):
         # If this is the user's first bird, equip it
         if not user.current_bird_id:
             db.session.flush()  # Get the ID
-            user.current_bird_id = user_bird.id
+            user.equip(user_bird)
 
         return user_bird, "Shiny!" if is_shiny else "Success!"
 
+    @property
+    def rarity_key(self):
+        """Key into RARITIES, e.g. rare or rare_shiny"""
+        return self.rarity + "_shiny" if self.is_shiny else self.rarity
+
     def get_multiplier(self):
         """Get seed multiplier for this bird"""
-        rarity_key = self.rarity
-        if self.is_shiny:
-            rarity_key += "_shiny"
-        return RARITIES.get(rarity_key, {}).get("multiplier", 1.0)
+        return RARITIES.get(self.rarity_key, {}).get("multiplier", 1.0)
 
     def get_display_name(self):
         """Get display name with shiny prefix if applicable"""
@@ -255,35 +271,36 @@ class Task(db.Model):
         today = date.today()
         return (
             TaskLog.query.filter(
-                TaskLog.task_id == self.id, db.func.date(TaskLog.completed_at) == today
+                TaskLog.task_id == self.id, TaskLog.completed_on == today
             ).first()
             is not None
         )
 
     def get_streak(self):
         """Get current streak for this task"""
-        logs = (
-            TaskLog.query.filter_by(task_id=self.id)
-            .order_by(TaskLog.completed_at.desc())
-            .all()
+        days = (
+            db.select(TaskLog.task_id, TaskLog.completed_on.label("day"))
+            .where(TaskLog.task_id == self.id)
+            .distinct()
         )
+        current, _ = streaks(db.session, days).get(self.id, (0, 0))
+        return current
 
-        if not logs:
-            return 0
-
-        streak = 0
-        current_date = date.today()
-
-        for log in logs:
-            log_date = log.completed_at.date()
+    @staticmethod
+    def get_streaks(user_id):
+        """{task_id: (current, longest)} for all of a user's tasks in one query"""
+        days = (
+            db.select(TaskLog.task_id, TaskLog.completed_on.label("day"))
+            .where(TaskLog.user_id == user_id)
+            .distinct()
+        )
+        return streaks(db.session, days)
 
-            if log_date == current_date or (current_date - log_date).days == 1:
-                streak += 1
-                current_date = log_date
-            elif log_date < current_date:
-                break
 
-        return streak
+def _completion_day(context):
+    """Day part of completed_at, so streaks can be computed on an indexed date"""
+    completed_at = context.get_current_parameters().get("completed_at")
+    return (completed_at or datetime.utcnow()).date()
 
 
 class TaskLog(db.Model):
@@ -295,6 +312,7 @@ class TaskLog(db.Model):
 
     # When completed
     completed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_on = db.Column(db.Date, default=_completion_day)
 
     # XP earned (stored for history)
     xp_earned = db.Column(db.Integer, default=0)
@@ -302,6 +320,11 @@ class TaskLog(db.Model):
     # Optional notes
     notes = db.Column(db.Text, nullable=True)
 
+    __table_args__ = (
+        db.Index("ix_task_logs_task_day", "task_id", "completed_on"),
+        db.Index("ix_task_logs_user_task_day", "user_id", "task_id", "completed_on"),
+    )
+
 
 # Predefined student-relevant task categories
 TASK_CATEGORIES = [
@@ -466,7 +489,85 @@ def give_starter_bird(user):
         )
         db.session.add(user_bird)
         db.session.flush()
-        user.current_bird_id = user_bird.id
+        user.equip(user_bird)
         db.session.commit()
         return user_bird
     return None
+
+
+def add_missing_columns():
+    """Add nullable model columns missing from existing tables"""
+    inspector = db.inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    added = []
+    # Not sorted_tables: users and user_birds refer to each other
+    for table in db.metadata.tables.values():
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(
+                db.text(
+                    f"ALTER TABLE {preparer.quote(table.name)} "
+                    f"ADD COLUMN {preparer.quote(column.name)} {column_type}"
+                )
+            )
+            added.append((table.name, column.name))
+    db.session.commit()
+    return added
+
+
+def backfill_completion_days():
+    """Add TaskLog.completed_on to an existing database and fill it in"""
+    add_missing_columns()
+    inspector = db.inspect(db.engine)
+    indexes = {index["name"] for index in inspector.get_indexes("task_logs")}
+    for index in TaskLog.__table__.indexes:
+        if index.name not in indexes:
+            index.create(db.engine)
+    TaskLog.query.filter(TaskLog.completed_on.is_(None)).update(
+        {TaskLog.completed_on: db.func.date(TaskLog.completed_at)},
+        synchronize_session=False,
+    )
+    db.session.commit()
+
+
+def check_equipped_birds(fix=False):
+    """Users whose cached bird_rarity_key/seed_multiplier don't match the
+    bird they have equipped; with fix=True they are corrected (this also
+    fills them in for users from before the columns existed)"""
+    rows = (
+        db.session.query(
+            User.id,
+            User.bird_rarity_key,
+            User.seed_multiplier,
+            UserBird.rarity,
+            UserBird.is_shiny,
+        )
+        .outerjoin(
+            UserBird,
+            db.and_(User.current_bird_id == UserBird.id, UserBird.user_id == User.id),
+        )
+        .yield_per(1000)
+    )
+    mismatched = []
+    for user_id, rarity_key, multiplier, rarity, is_shiny in rows:
+        expected_key = None
+        if rarity is not None:
+            expected_key = rarity + "_shiny" if is_shiny else rarity
+        expected = RARITIES.get(expected_key, {}).get("multiplier", 1.0)
+        if rarity_key != expected_key or multiplier != expected:
+            mismatched.append(
+                {
+                    "id": user_id,
+                    "bird_rarity_key": expected_key,
+                    "seed_multiplier": expected,
+                }
+            )
+    if fix and mismatched:
+        db.session.execute(db.update(User), mismatched)
+        db.session.commit()
+    return mismatched
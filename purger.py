@@ -0,0 +1,91 @@
+"""
+BirdQuest - Background purger
+Deleting a habit only marks it deleted; its completion history is removed
+here, off the request path, in small chunks with a pause between them so
+no single delete holds write locks for long.
+
+A pass runs when a delete wakes the thread, once when the worker starts
+and every `interval` seconds, so deletes whose worker was recycled or
+restarted before it got to them are still swept up.
+"""
+
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class Purger:
+    """Runs purge passes on a background thread when woken or every interval.
+
+    run_pass(progress) purges everything pending and calls progress(rows)
+    after each chunk it deletes and progress(0, habit_done=True) after each
+    habit it finishes.
+    """
+
+    def __init__(self, run_pass, interval=None):
+        self.run_pass = run_pass
+        self.interval = interval
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "passes": 0,
+            "rows_deleted": 0,
+            "habits_purged": 0,
+            "errors": 0,
+            "running": False,
+            "last_pass_at": None,
+        }
+
+    def wake(self):
+        """Ask for a pass soon (several wake-ups before it runs make one pass)."""
+        self._ensure_thread()
+        self._wake.set()
+
+    def start(self):
+        """Start the thread if it isn't running, with a pass straight away."""
+        if self._ensure_thread():
+            self._wake.set()
+
+    def _ensure_thread(self):
+        # Started lazily so it runs in the worker, not a preloading master.
+        # Returns True if this call started it
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(
+                target=self._loop, name="purger", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def _loop(self):
+        while True:
+            self._wake.wait(timeout=self.interval)
+            self._wake.clear()
+            with self._lock:
+                self._stats["running"] = True
+            try:
+                self.run_pass(self._progress)
+            except Exception:
+                log.exception("Purge pass failed")
+                with self._lock:
+                    self._stats["errors"] += 1
+            with self._lock:
+                self._stats["running"] = False
+                self._stats["passes"] += 1
+                self._stats["last_pass_at"] = time.time()
+
+    def _progress(self, rows, habit_done=False):
+        with self._lock:
+            self._stats["rows_deleted"] += rows
+            self._stats["habits_purged"] += habit_done
+
+    def metrics(self):
+        """Passes, rows deleted and habits finished by this worker."""
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+"""
+BirdQuest - Resharding
+Copies every user's rows from the app's current layout (DATABASE_URL, and
+SHARDS / SHARD_URL_TEMPLATE if set) into a new number of shards:
+
+    python reshard.py --shards 4
+    SHARDS=4 python reshard.py --shards 8 --url-template "sqlite:///v2-{shard}.db"
+
+Run it with the app stopped and the environment the app runs with, then
+start the app with SHARDS and SHARD_URL_TEMPLATE set to the new values.
+--shards 0 merges every shard back into DATABASE_URL.
+
+Rows are streamed in primary key order and written batch by batch to
+their user's new shard. Row ids are renumbered (each old shard numbered its
+own from 1) and references to custom habit ids rewritten to match. The
+global tables stay in DATABASE_URL; leaving a single database fills the
+user directory from its users. BirdOwnershipCount isn't copied: run
+`flask --app app backfill` with the new settings to recount it.
+
+The new databases must be empty. The old rows are left where they are;
+drop them once the app runs on the new layout.
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+from sqlalchemy import create_engine, insert, make_url, select
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_DIR)
+
+from app import (  # noqa: E402
+    GLOBAL,
+    GLOBAL_TABLES,
+    SHARDS,
+    BirdOwnershipCount,
+    CustomHabit,
+    LedgerEntry,
+    User,
+    UserDirectory,
+    app,
+    databases,
+    db,
+)
+from sharding import shard_for, shard_names  # noqa: E402
+
+# The user table first, then custom habits, whose new ids the rest refer to
+FIRST_TABLES = [User.__table__, CustomHabit.__table__]
+
+
+def copied_tables():
+    """Per-user tables in copy order."""
+    skipped = set(FIRST_TABLES) | GLOBAL_TABLES | {BirdOwnershipCount.__table__}
+    return FIRST_TABLES + [t for t in db.metadata.sorted_tables if t not in skipped]
+
+
+def engine_for(url):
+    # Relative SQLite paths are in the instance folder, as Flask-SQLAlchemy
+    # has them
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database not in (None, ":memory:"):
+        if not os.path.isabs(url.database):
+            url = url.set(database=os.path.join(app.instance_path, url.database))
+    return create_engine(url)
+
+
+def new_layout(count, template):
+    """{shard: engine} of the new layout ({None: DATABASE_URL} for none)."""
+    if not count:
+        return {None: db.engine}
+    return {
+        shard: engine_for(template.format(shard=shard)) for shard in shard_names(count)
+    }
+
+
+def renumbered(table):
+    """Tables whose id is a row number rather than a user id."""
+    columns = [column.name for column in table.primary_key]
+    return table is not User.__table__ and columns == ["id"]
+
+
+def prepare_targets(targets, tables):
+    """Create the tables in each new database and check they are empty."""
+    for shard, engine in targets.items():
+        db.metadata.create_all(engine, tables=tables)
+        with engine.connect() as connection:
+            for table in tables:
+                rows = connection.execute(
+                    select(db.func.count()).select_from(table)
+                ).scalar()
+                if rows:
+                    raise SystemExit(
+                        f"❌ {shard or 'DATABASE_URL'} already has {rows} "
+                        f"{table.name} rows; reshard into empty databases"
+                    )
+
+
+def rewrite(table, row, source, habit_ids):
+    """The row as values for its new shard, or None if it must be dropped."""
+    values = dict(row._mapping)
+    if renumbered(table):
+        del values["id"]
+    if "is_custom" in values and values["is_custom"]:
+        new_id = habit_ids.get((source, values["habit_id"]))
+        if new_id is None:
+            return None
+        values["habit_id"] = new_id
+    if table is LedgerEntry.__table__ and (values["ref"] or "").startswith("custom_"):
+        old_id = int(values["ref"].removeprefix("custom_"))
+        if (source, old_id) in habit_ids:
+            values["ref"] = f"custom_{habit_ids[source, old_id]}"
+    return values
+
+
+def copy_table(source, connection, table, targets, route, habit_ids, batch_size):
+    """Stream one table of one old shard into the new ones.
+
+    Returns (rows read, rows dropped).
+    """
+    user_column = "id" if table is User.__table__ else "user_id"
+    query = (
+        select(table)
+        .order_by(*table.primary_key.columns)
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    read = dropped = 0
+    started = time.perf_counter()
+    for rows in connection.execute(query).partitions(batch_size):
+        batches = {}
+        for row in rows:
+            values = rewrite(table, row, source, habit_ids)
+            if values is None:
+                dropped += 1
+                continue
+            shard = route(values[user_column])
+            batches.setdefault(shard, ([], []))
+            batches[shard][0].append(values)
+            batches[shard][1].append(row)
+        for shard, (values, old_rows) in batches.items():
+            with targets[shard].begin() as target:
+                if table is CustomHabit.__table__:
+                    new_ids = target.scalars(
+                        insert(table).returning(
+                            table.c.id, sort_by_parameter_order=True
+                        ),
+                        values,
+                    ).all()
+                    for old_row, new_id in zip(old_rows, new_ids):
+                        habit_ids[source, old_row.id] = new_id
+                else:
+                    target.execute(insert(table), values)
+        read += len(rows)
+        rate = read / (time.perf_counter() - started)
+        print(
+            f"  {source or 'database'} {table.name}: {read} rows ({rate:,.0f} rows/s)"
+        )
+    return read, dropped
+
+
+def fill_directory():
+    """Register every user of a single database in the user directory."""
+    with db.engine.begin() as connection:
+        users = connection.execute(
+            select(User.id, User.username, User.email).order_by(User.id)
+        ).all()
+        if users:
+            connection.execute(
+                insert(UserDirectory.__table__), [row._asdict() for row in users]
+            )
+    return len(users)
+
+
+def count_rows(engine, table):
+    with engine.connect() as connection:
+        return connection.execute(select(db.func.count()).select_from(table)).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument(
+        "--shards", type=int, required=True, help="Shards to split into (0: none)"
+    )
+    parser.add_argument(
+        "--url-template",
+        default=os.environ.get("SHARD_URL_TEMPLATE", "sqlite:///birdquest-{shard}.db"),
+        help="URL of each new shard, with {shard} for its name",
+    )
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    if args.shards < 0 or args.shards == SHARDS == 0:
+        parser.error("--shards must be positive when the app isn't sharded")
+
+    def route(user_id):
+        return shard_for(user_id, args.shards) if args.shards else None
+
+    with app.app_context():
+        tables = copied_tables()
+        targets = new_layout(args.shards, args.url_template)
+        sources = [
+            (shard, engine) for shard, engine, _ in databases() if shard != GLOBAL
+        ]
+        print(
+            f"➡️  {len(sources)} database(s) -> "
+            f"{args.shards or 'a single database'} shard(s)"
+        )
+        prepare_targets(targets, tables)
+        if args.shards and not SHARDS:
+            prepare_targets({GLOBAL: db.engine}, [UserDirectory.__table__])
+
+        habit_ids = {}  # (old shard, old custom habit id) -> new id
+        read, dropped = Counter(), Counter()
+        for table in tables:
+            for source, engine in sources:
+                with engine.connect() as connection:
+                    rows, lost = copy_table(
+                        source,
+                        connection,
+                        table,
+                        targets,
+                        route,
+                        habit_ids,
+                        args.batch_size,
+                    )
+                read[table.name] += rows
+                dropped[table.name] += lost
+        if args.shards and not SHARDS:
+            print(f"➡️  user directory: {fill_directory()} users")
+
+        print("\nValidation")
+        print(f"  {'table':<20} {'old':>9} {'new':>9} {'dropped':>9}")
+        ok = True
+        for table in tables:
+            written = sum(count_rows(engine, table) for engine in targets.values())
+            accounted = written + dropped[table.name] == read[table.name]
+            ok &= accounted
+            print(
+                f"  {table.name:<20} {read[table.name]:>9} {written:>9} "
+                f"{dropped[table.name]:>9}"
+                + ("" if accounted else "  ⚠️ rows unaccounted for")
+            )
+        if any(dropped.values()):
+            print("  (dropped: completions of custom habits that no longer exist)")
+
+    if not ok:
+        print("❌ Resharding finished with discrepancies")
+        raise SystemExit(1)
+    settings = (
+        f"SHARDS={args.shards} SHARD_URL_TEMPLATE={args.url_template}"
+        if args.shards
+        else "SHARDS=0"
+    )
+    print(f"✅ Resharding complete; start the app with {settings}")
+    print(f"   and run {settings} flask --app app backfill to recount birds")
+
+
+if __name__ == "__main__":
+    main()
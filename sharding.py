@@ -0,0 +1,134 @@
+"""
+BirdQuest - Sharded storage
+Spreads the per-user tables over several databases (SQLite files) by a
+hash of the user id, so writers for different users take different write
+locks. A small global database keeps what isn't anyone's in particular
+(groups, and the directory of usernames that allocates user ids).
+
+Every query runs through one session that routes it:
+
+    global model (__sharded__ = False)      the global database
+    row with a user id (or User.id)         shard_for(user_id)
+    anything else                           the active shard (use_shard)
+    no active shard                         SELECTs go to every shard and
+                                            their rows are concatenated
+
+A request's active shard is its user's, so per-user code runs unchanged.
+Views over every user (leaderboards, counts) read with no active shard and
+merge the results themselves: rows come back per shard, not in one order,
+and each shard returns its own count(*).
+"""
+
+import contextvars
+import zlib
+from contextlib import contextmanager
+
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+
+GLOBAL = "global"
+
+_active = contextvars.ContextVar("active_shard", default=None)
+
+
+def shard_names(count):
+    return [f"shard{i}" for i in range(count)]
+
+
+def shard_for(user_id, count):
+    """The shard holding a user's rows: crc32 of the id, modulo the count.
+
+    crc32 rather than hash(), which differs between processes.
+    """
+    return f"shard{zlib.crc32(str(int(user_id)).encode()) % count}"
+
+
+def active_shard():
+    return _active.get()
+
+
+def activate(shard):
+    """Make `shard` active until the next activate() (None: no shard)."""
+    _active.set(shard)
+
+
+@contextmanager
+def use_shard(shard):
+    """Run the block with `shard` active (None: read every shard)."""
+    token = _active.set(shard)
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+def all_shards():
+    """Run the block reading every shard, whatever shard is active."""
+    return use_shard(None)
+
+
+def is_global(mapper):
+    return not getattr(mapper.class_, "__sharded__", True)
+
+
+def shard_key(mapper):
+    """The attribute holding the user id: user_id, or __shard_key__."""
+    return getattr(mapper.class_, "__shard_key__", "user_id")
+
+
+class RoutingSession(ShardedSession):
+    """A session over the global database and every shard.
+
+    Flask-SQLAlchemy creates it with db=, like its own Session; the engines
+    are db.engines: the default one is global, and each bind is a shard.
+    """
+
+    def __init__(self, db, **kwargs):
+        engines = db.engines
+        self.shard_ids = sorted(key for key in engines if key is not None)
+        super().__init__(
+            shard_chooser=self._shard_for_instance,
+            identity_chooser=self._shards_for_identity,
+            execute_chooser=self._shards_for_statement,
+            shards={GLOBAL: engines[None], **{k: engines[k] for k in self.shard_ids}},
+            **kwargs,
+        )
+
+    def _user_shard(self, user_id):
+        return shard_for(user_id, len(self.shard_ids))
+
+    def _shard_for_instance(self, mapper, instance, clause=None, **kw):
+        if mapper is None:
+            return active_shard() or GLOBAL
+        if is_global(mapper):
+            return GLOBAL
+        user_id = getattr(instance, shard_key(mapper), None)
+        if user_id is not None:
+            return self._user_shard(user_id)
+        shard = active_shard()
+        if shard is None:
+            raise RuntimeError(
+                f"No shard for {mapper.class_.__name__}: write it inside use_shard()"
+            )
+        return shard
+
+    def _shards_for_identity(self, mapper, primary_key, **kw):
+        if is_global(mapper):
+            return [GLOBAL]
+        key = shard_key(mapper)
+        for column, value in zip(mapper.primary_key, primary_key):
+            if column.key == key and value is not None:
+                return [self._user_shard(value)]
+        shard = active_shard()
+        return [shard] if shard else self.shard_ids
+
+    def _shards_for_statement(self, orm_context):
+        mapper = orm_context.bind_mapper
+        if mapper is not None and is_global(mapper):
+            return [GLOBAL]
+        shard = active_shard()
+        if shard is not None:
+            return [shard]
+        if not orm_context.is_select:
+            # Writing to every shard is never what a caller means
+            raise RuntimeError("No shard for this write: run it inside use_shard()")
+        return self.shard_ids
@@ -4,6 +4,7 @@
 // Global State
 // ===================================
 let currentFilter = "all";
+let weeklyCompletions = null;
 
 // ===================================
 // Toast Notifications
@@ -21,7 +22,7 @@ function showToast(message, type = "success") {
 
   toast.innerHTML = `
         <span class="toast-icon">${icons[type] || icons.info}</span>
-        <span class="toast-message">${message}</span>
+        <span class="toast-message">${escapeHTML(message)}</span>
     `;
 
   container.appendChild(toast);
@@ -61,16 +62,11 @@ async function completeHabit(habitId, isCustom = false) {
 
     if (data.success) {
       // Update UI
-      habitItem.classList.add("completed");
-      checkBtn.classList.add("checked");
-      checkBtn.disabled = true;
+      markHabitCompleted(habitId, data.habit_streak);
 
       // Update XP display
       updateXPDisplay(data.current_xp, data.xp_needed);
 
-      // Update completed count
-      updateCompletedCount();
-
       // Show XP toast
       showToast(`+${data.xp_earned} XP earned!`, "success");
 
@@ -98,6 +94,40 @@ async function completeHabit(habitId, isCustom = false) {
   }
 }
 
+function markHabitCompleted(habitId, streak) {
+  const habitItem = document.querySelector(`[data-habit-id="${habitId}"]`);
+  const checkBtn = habitItem?.querySelector(".check-btn");
+
+  if (streak !== undefined) updateHabitStreak(habitItem, streak);
+  if (!habitItem || habitItem.classList.contains("completed")) return;
+
+  habitItem.classList.add("completed");
+  if (checkBtn) {
+    checkBtn.classList.add("checked");
+    checkBtn.disabled = true;
+  }
+
+  if (weeklyCompletions) {
+    const today = new Date().toISOString().split("T")[0];
+    weeklyCompletions[today] = (weeklyCompletions[today] || 0) + 1;
+  }
+
+  updateCompletedCount();
+}
+
+function habitStreakHTML(streak) {
+  if (!streak) return "";
+  return `<span class="habit-streak" title="${escapeHTML(streak)} days in a row">🔥 ${escapeHTML(streak)}</span>`;
+}
+
+function updateHabitStreak(habitItem, streak) {
+  const meta = habitItem?.querySelector(".habit-meta");
+  if (!meta) return;
+
+  meta.querySelector(".habit-streak")?.remove();
+  meta.insertAdjacentHTML("beforeend", habitStreakHTML(streak));
+}
+
 // ===================================
 // XP Display Update
 // ===================================
@@ -121,6 +151,10 @@ function updateXPDisplay(currentXP, xpNeeded) {
 function updateStatsDisplay(level, seeds) {
   const levelDisplay = document.getElementById("level-display");
   const seedsCount = document.getElementById("seeds-count");
+  const statsLevel = document.getElementById("stats-level");
+  const statsSeeds = document.getElementById("stats-seeds");
+  const navLevel = document.getElementById("nav-level");
+  const navSeeds = document.getElementById("nav-seeds");
 
   if (levelDisplay) {
     levelDisplay.textContent = level;
@@ -129,6 +163,11 @@ function updateStatsDisplay(level, seeds) {
   if (seedsCount) {
     seedsCount.textContent = seeds;
   }
+
+  if (statsLevel) statsLevel.textContent = level;
+  if (statsSeeds) statsSeeds.textContent = seeds;
+  if (navLevel) navLevel.textContent = `Lv. ${level}`;
+  if (navSeeds) navSeeds.textContent = seeds;
 }
 
 // ===================================
@@ -191,9 +230,6 @@ function showLevelUp(level, seedsEarned) {
 function closeLevelUp() {
   const notification = document.getElementById("level-up-notification");
   notification?.classList.remove("active");
-
-  // Refresh the page to update all stats
-  location.reload();
 }
 
 // ===================================
@@ -261,33 +297,45 @@ async function addHabit(event) {
   }
 }
 
-function addHabitToList(habit) {
-  const habitsList = document.getElementById("habits-list");
+function habitItemHTML(habit) {
+  const isCustom = Boolean(habit.is_custom);
+  const id = escapeHTML(habit.id);
+  const done = habit.completed;
 
-  const habitHTML = `
-        <div class="habit-item"
-             data-habit-id="${habit.id}"
-             data-category="${habit.category}"
-             data-custom="true">
+  return `
+        <div class="habit-item ${done ? "completed" : ""}"
+             data-habit-id="${id}"
+             data-category="${escapeHTML(habit.category)}"
+             data-custom="${isCustom}">
             <div class="habit-check">
-                <button class="check-btn" onclick="completeHabit('${habit.id}', true)">
+                <button class="check-btn ${done ? "checked" : ""}"
+                        onclick="completeHabit('${id}', ${isCustom})"
+                        ${done ? "disabled" : ""}>
                     <span class="check-icon">✓</span>
                 </button>
             </div>
             <div class="habit-content">
-                <h3 class="habit-name">${habit.name}</h3>
+                <h3 class="habit-name">${escapeHTML(habit.name)}</h3>
                 <div class="habit-meta">
-                    <span class="habit-xp">+${habit.xp} XP</span>
-                    <span class="habit-category">${capitalizeFirst(habit.category)}</span>
+                    <span class="habit-xp">+${escapeHTML(habit.xp)} XP</span>
+                    <span class="habit-category">${escapeHTML(capitalizeFirst(habit.category))}</span>
+                    ${habitStreakHTML(habit.streak)}
                 </div>
             </div>
-            <button class="habit-delete" onclick="deleteHabit('${habit.id}')" title="Delete habit">
+            <button class="habit-delete" onclick="deleteHabit('${id}')" title="Delete habit">
                 🗑️
             </button>
         </div>
     `;
+}
 
-  habitsList.insertAdjacentHTML("beforeend", habitHTML);
+function addHabitToList(habit) {
+  const habitsList = document.getElementById("habits-list");
+
+  habitsList.insertAdjacentHTML(
+    "beforeend",
+    habitItemHTML({ ...habit, is_custom: true, completed: false }),
+  );
 
   // Apply current filter
   applyFilter(currentFilter);
@@ -295,10 +343,10 @@ function addHabitToList(habit) {
 
 function updateTotalHabitsCount() {
   const totalItems = document.querySelectorAll(".habit-item").length;
-  const summaryValues = document.querySelectorAll(".summary-value");
+  const totalCount = document.getElementById("total-count");
 
-  if (summaryValues.length > 1) {
-    summaryValues[1].textContent = totalItems;
+  if (totalCount) {
+    totalCount.textContent = totalItems;
   }
 }
 
@@ -394,6 +442,13 @@ function closeStatsModal() {
 }
 
 async function fetchStats() {
+  // Streak, level and seeds are kept current on the page; the weekly
+  // chart is fetched once and then updated as habits are completed.
+  if (weeklyCompletions) {
+    renderActivityChart(weeklyCompletions);
+    return;
+  }
+
   try {
     const response = await fetch("/api/stats");
     const data = await response.json();
@@ -405,7 +460,8 @@ async function fetchStats() {
     document.getElementById("stats-birds").textContent = data.birds || 0;
 
     // Render activity chart
-    renderActivityChart(data.daily_completions);
+    weeklyCompletions = data.daily_completions;
+    renderActivityChart(weeklyCompletions);
   } catch (error) {
     console.error("Error fetching stats:", error);
   }
@@ -449,6 +505,124 @@ function renderActivityChart(dailyCompletions) {
     .join("");
 }
 
+// ===================================
+// Dashboard State
+// ===================================
+// The page itself is the same for every user; everything specific to the
+// signed-in user comes from /api/dashboard.
+async function loadDashboard() {
+  let state;
+  try {
+    const response = await fetch("/api/dashboard");
+    if (response.status === 401) {
+      window.location.href = "/login?next=/dashboard";
+      return;
+    }
+    state = await response.json();
+  } catch (error) {
+    console.error("Error loading dashboard:", error);
+    showToast("Failed to load your dashboard. Please refresh.", "error");
+    return;
+  }
+
+  renderDashboard(state);
+  state.messages.forEach(([category, message]) => showToast(message, category));
+}
+
+function renderDashboard(state) {
+  updateXPDisplay(state.xp, state.xp_needed);
+  updateStatsDisplay(state.level, state.seeds);
+
+  document.getElementById("streak-count").textContent = state.streak;
+  document.getElementById("stats-streak").textContent = state.streak;
+  document.getElementById("multiplier-display").textContent =
+    `${state.multiplier.toFixed(1)}x`;
+
+  renderBird(state.bird);
+
+  document.getElementById("habits-list").innerHTML = state.habits
+    .map(habitItemHTML)
+    .join("");
+  applyFilter(currentFilter);
+  updateCompletedCount();
+  updateTotalHabitsCount();
+}
+
+function renderBird(bird) {
+  const display = document.getElementById("bird-display");
+  const background = document.getElementById("bird-background");
+  const shinyLabel = bird.shiny ? " Shiny" : "";
+
+  display.className = `bird-display ${bird.rarity}${bird.shiny ? " shiny" : ""}`;
+
+  background.querySelectorAll(".sparkles, .shiny-ring").forEach((el) => el.remove());
+  if (bird.shiny) {
+    background.insertAdjacentHTML(
+      "afterbegin",
+      `<div class="sparkles">${'<span class="sparkle"></span>'.repeat(6)}</div>
+       <div class="shiny-ring"></div>`,
+    );
+  }
+
+  document.getElementById("bird-image").innerHTML = pictureHTML(
+    bird.image,
+    bird.name,
+    "(max-width: 768px) 120px, 150px",
+  );
+  document.getElementById("bird-name").textContent =
+    `${bird.shiny ? "✨ " : ""}${bird.name}`;
+
+  const rarity = document.getElementById("bird-rarity");
+  rarity.className = `bird-rarity ${bird.rarity}`;
+  rarity.textContent = `${capitalizeFirst(bird.rarity)}${shinyLabel}`;
+
+  document.getElementById("bird-description").textContent = bird.description;
+}
+
+// Same markup as the bird_image() template helper
+function pictureHTML(image, alt, sizes) {
+  const size = image.width
+    ? ` width="${image.width}" height="${image.height}"`
+    : "";
+  const img = `<img src="${escapeHTML(image.src)}" alt="${escapeHTML(alt)}" decoding="async"${size}>`;
+  if (!image.sources.length) return img;
+
+  const sources = image.sources
+    .map(
+      (source) =>
+        `<source type="${source.type}" srcset="${escapeHTML(source.srcset)}" sizes="${sizes}">`,
+    )
+    .join("");
+  return `<picture>${sources}${img}</picture>`;
+}
+
+// ===================================
+// Live Updates
+// ===================================
+function initLiveUpdates() {
+  if (typeof BirdQuestLive === "undefined") return;
+
+  // Changes made in other tabs or devices
+  BirdQuestLive.on("state", (state) => {
+    updateXPDisplay(state.xp, state.xp_needed);
+    updateStatsDisplay(state.level, state.seeds);
+    document.getElementById("multiplier-display").textContent =
+      `${state.multiplier.toFixed(1)}x`;
+
+    const streakCount = document.getElementById("streak-count");
+    if (streakCount && streakCount.textContent !== String(state.streak)) {
+      updateStreakDisplay(state.streak);
+    }
+  });
+
+  BirdQuestLive.on("habit", (habit) => {
+    const habitId = habit.is_custom
+      ? `custom_${String(habit.habit_id).replace("custom_", "")}`
+      : habit.habit_id;
+    markHabitCompleted(habitId, habit.streak);
+  });
+}
+
 // ===================================
 // Utility Functions
 // ===================================
@@ -456,6 +630,15 @@ function capitalizeFirst(string) {
   return string.charAt(0).toUpperCase() + string.slice(1);
 }
 
+function escapeHTML(value) {
+  return String(value)
+    .replace(/&/g, "&amp;")
+    .replace(/</g, "&lt;")
+    .replace(/>/g, "&gt;")
+    .replace(/"/g, "&quot;")
+    .replace(/'/g, "&#39;");
+}
+
 // Close modals on escape key
 document.addEventListener("keydown", (e) => {
   if (e.key === "Escape") {
@@ -486,5 +669,6 @@ document.head.appendChild(style);
 // ===================================
 document.addEventListener("DOMContentLoaded", () => {
   initCategoryFilters();
-  updateCompletedCount();
+  initLiveUpdates();
+  loadDashboard();
 });
@@ -0,0 +1,50 @@
+/**
+ * BirdQuest - Live Updates
+ * Listens to the /api/events stream and hands pushed changes to page code
+ */
+
+const BirdQuestLive = (function() {
+    const EVENTS = ['state', 'habit', 'rank', 'leaderboard'];
+    const handlers = {};
+
+    /**
+     * Register a handler for one of the pushed event types
+     */
+    function on(event, handler) {
+        (handlers[event] = handlers[event] || []).push(handler);
+    }
+
+    function dispatch(event, data) {
+        (handlers[event] || []).forEach(function(handler) {
+            handler(data);
+        });
+    }
+
+    function connect() {
+        if (!window.EventSource) return;
+
+        // The browser reconnects on its own when the server ends the stream
+        const source = new EventSource('/api/events');
+
+        EVENTS.forEach(function(event) {
+            source.addEventListener(event, function(e) {
+                dispatch(event, JSON.parse(e.data));
+            });
+        });
+    }
+
+    /**
+     * Keep the seeds and level in the navigation bar current on every page
+     */
+    on('state', function(state) {
+        const navSeeds = document.getElementById('nav-seeds');
+        const navLevel = document.getElementById('nav-level');
+
+        if (navSeeds) navSeeds.textContent = state.seeds;
+        if (navLevel) navLevel.textContent = `Lv. ${state.level}`;
+    });
+
+    document.addEventListener('DOMContentLoaded', connect);
+
+    return { on: on };
+})();
@@ -0,0 +1,94 @@
+"""
+BirdQuest - Streaks in SQL
+Current and longest streaks computed by the database with one
+gaps-and-islands query, instead of loading every completion into Python.
+
+Consecutive days minus their row number within a habit are constant, so
+each run of days ("island") is one group:
+
+    day        2024-03-01  2024-03-02  2024-03-03  2024-03-07
+    row            1           2           3           4
+    day - row    02-29       02-29       02-29       03-03
+
+The input is any selectable with a "day" column (a Date, one row per
+distinct day) and one or more key columns; the streaks come back per key.
+It runs on SQLite and Postgres.
+"""
+
+from datetime import date, timedelta
+
+from sqlalchemy import Integer, case, func, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+
+class day_number(FunctionElement):
+    """A Date as a whole number of days, for day arithmetic in SQL."""
+
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(day_number)
+def _day_number_default(element, compiler, **kw):
+    # Postgres: date - date is an integer number of days
+    return "(%s - DATE '1970-01-01')" % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_number, "sqlite")
+def _day_number_sqlite(element, compiler, **kw):
+    # Julian day numbers of plain dates all end in .5
+    return "CAST(julianday(%s) AS INTEGER)" % compiler.process(element.clauses, **kw)
+
+
+def streak_query(days, today=None):
+    """SELECT keys..., current, longest over the distinct days in `days`.
+
+    A current streak still counts if its last day was yesterday.
+    """
+    today = today or date.today()
+    days = days.subquery() if hasattr(days, "subquery") else days
+    keys = [column for column in days.c if column.key != "day"]
+
+    numbered = select(
+        *keys,
+        days.c.day,
+        (
+            day_number(days.c.day)
+            - func.row_number().over(partition_by=keys, order_by=days.c.day)
+        ).label("island"),
+    ).subquery()
+    island_keys = [numbered.c[column.key] for column in keys]
+
+    islands = (
+        select(
+            *island_keys,
+            func.count().label("length"),
+            func.max(numbered.c.day).label("last_day"),
+        )
+        .group_by(*island_keys, numbered.c.island)
+        .subquery()
+    )
+    result_keys = [islands.c[column.key] for column in keys]
+
+    current = case(
+        (islands.c.last_day >= today - timedelta(days=1), islands.c.length),
+        else_=0,
+    )
+    return select(
+        *result_keys,
+        func.max(current).label("current"),
+        func.max(islands.c.length).label("longest"),
+    ).group_by(*result_keys)
+
+
+def streaks(session, days, today=None):
+    """{key: (current, longest)} for each key with at least one day.
+
+    With several key columns the dict is keyed by tuples.
+    """
+    result = {}
+    for row in session.execute(streak_query(days, today)):
+        *key, current, longest = row
+        result[key[0] if len(key) == 1 else tuple(key)] = (current, longest)
+    return result
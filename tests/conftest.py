@@ -0,0 +1,64 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.py sets itself up on import, so point it at a throwaway database first
+_tmp = tempfile.mkdtemp(prefix="birdquest-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ.setdefault("SECRET_KEY", "tests")
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+os.environ.setdefault("GROUP_COMMIT", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db, find_user  # noqa: E402
+
+_names = itertools.count(1)
+
+
+def register(client, username, password="password"):
+    client.post(
+        "/register",
+        data={
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": password,
+            "confirm_password": password,
+        },
+    )
+    client.post("/login", data={"username": username, "password": password})
+
+
+@pytest.fixture
+def client():
+    """A test client logged in as a new user."""
+    client = app.test_client()
+    client.username = f"user{next(_names)}"
+    register(client, client.username)
+    return client
+
+
+@pytest.fixture
+def user(client):
+    """The User row of the client's user, read fresh on each call."""
+
+    def load():
+        with app.app_context():
+            found = find_user(username=client.username)
+            db.session.expunge(found)
+            return found
+
+    return load
+
+
+@pytest.fixture
+def set_seeds(client):
+    def set_seeds(seeds):
+        with app.app_context():
+            found = find_user(username=client.username)
+            found.seeds = seeds
+            db.session.commit()
+
+    return set_seeds
@@ -0,0 +1,36 @@
+import pytest
+
+from flask import request
+
+from admission import AdmissionController
+from app import app, route_class
+
+
+@pytest.mark.parametrize(
+    "method, path, expected",
+    [
+        ("POST", "/login", "write"),
+        ("POST", "/register", "write"),
+        ("POST", "/api/complete-habit", "write"),
+        ("GET", "/login", "page"),
+        ("GET", "/register", "page"),
+        ("GET", "/", "page"),
+        ("GET", "/dashboard", "page"),
+        ("GET", "/leaderboard", "optional_page"),
+        ("GET", "/api/stats", "api_read"),
+        ("GET", "/static/css/style.css", "static"),
+    ],
+)
+def test_route_class(method, path, expected):
+    with app.test_request_context(path, method=method):
+        assert route_class(request) == expected
+
+
+def test_saturated_worker_sheds_only_optional_requests():
+    controller = AdmissionController(capacity=1, max_wait=0.5)
+    assert controller.admit("write")  # now fully in flight
+
+    assert controller.admit("write")
+    assert controller.admit("page")
+    assert not controller.admit("optional_page")
+    assert not controller.admit("api_read")
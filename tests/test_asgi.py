@@ -0,0 +1,123 @@
+import asyncio
+import gzip
+import json
+import time
+
+import pytest
+
+pytest.importorskip("asgiref")
+pytest.importorskip("aiosqlite")
+
+from app import app  # noqa: E402
+import asgi  # noqa: E402
+from asgi import application  # noqa: E402
+
+
+def call(client, method, path, payload=None, headers=(), raw=False):
+    """One request through the ASGI app with the client's session cookie.
+
+    raw=True returns the status, response headers and undecoded body.
+    """
+    cookie = client.get_cookie(app.config["SESSION_COOKIE_NAME"])
+    body = b"" if payload is None else json.dumps(payload).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"localhost"),
+            (b"content-type", b"application/json"),
+            (b"cookie", f"{cookie.key}={cookie.value}".encode()),
+            *headers,
+        ],
+        "client": ("127.0.0.1", 1234),
+        "server": ("localhost", 80),
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    status = sent[0]["status"]
+    body = b"".join(m.get("body", b"") for m in sent[1:])
+    if raw:
+        return status, dict(sent[0]["headers"]), body
+    return status, json.loads(body)
+
+
+def test_equip_bird(client, user):
+    # Cached boards make the equip check the user's score against each one
+    for window in ("", "?window=week", "?window=month"):
+        client.get(f"/leaderboard{window}")
+
+    status, result = call(client, "POST", "/api/equip-bird", {"bird_id": 1})
+
+    assert status == 200
+    assert result["success"], result
+    assert user().current_bird_id == 1
+
+
+def test_buy_and_equip_bird(client, user, set_seeds):
+    set_seeds(1000)
+
+    status, bought = call(client, "POST", "/api/buy-bird", {"bird_id": 2})
+    assert (status, bought["success"]) == (200, True), bought
+
+    status, equipped = call(
+        client,
+        "POST",
+        "/api/equip-bird",
+        {"bird_id": 2, "shiny": bought["is_shiny"]},
+    )
+    assert (status, equipped["success"]) == (200, True), equipped
+    assert user().current_bird_id == 2
+
+
+def test_complete_habit_and_stats(client, user):
+    status, result = call(client, "POST", "/api/complete-habit", {"habit_id": 1})
+    assert (status, result["success"]) == (200, True), result
+
+    status, stats = call(client, "GET", "/api/stats")
+    assert status == 200
+    assert sum(stats["daily_completions"].values()) == 1
+
+
+def test_responses_are_compressed(client, monkeypatch):
+    monkeypatch.setattr(asgi, "COMPRESS_MIN_SIZE", 0)
+
+    status, headers, body = call(
+        client, "GET", "/api/stats", headers=[(b"accept-encoding", b"gzip")], raw=True
+    )
+
+    assert status == 200
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(body)
+    assert "total_xp" in json.loads(gzip.decompress(body))
+
+
+def test_admission_sheds_reads_but_not_writes(client, monkeypatch):
+    monkeypatch.setattr(asgi, "ADMISSION_CONTROL", True)
+    # Queued far longer than max_wait
+    waited = [(b"x-request-start", f"t={time.time() - 60:.3f}".encode())]
+
+    status, headers, body = call(client, "GET", "/api/stats", headers=waited, raw=True)
+    assert status == 503
+    assert headers[b"retry-after"] == str(asgi.admission.retry_after).encode()
+    assert json.loads(body)["success"] is False
+
+    status, result = call(
+        client, "POST", "/api/complete-habit", {"habit_id": 1}, headers=waited
+    )
+    assert (status, result["success"]) == (200, True), result
+    assert asgi.admission.metrics()["classes"]["write"]["in_flight"] == 0
@@ -0,0 +1,87 @@
+import CreateLegendaryAccount
+
+from app import (
+    BirdOwnershipCount,
+    HabitStreak,
+    User,
+    app,
+    db,
+    find_user,
+    ledger_balances,
+    ownership_bit,
+)
+
+
+def run_backfill():
+    result = app.test_cli_runner().invoke(args=["backfill"])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_backfill_fills_rows_that_predate_it(client, user):
+    with app.app_context():
+        found = find_user(username=client.username)
+        found.owned_birds_bitmap = None
+        found.ledger_seq = None
+        found.seeds = 40
+        BirdOwnershipCount.query.delete()
+        db.session.commit()
+
+    output = run_backfill()
+
+    assert "Built ownership bitmaps" in output
+    assert "Opened ledgers" in output
+    backfilled = user()
+    assert backfilled.owned_bits == ownership_bit(1, False)
+    assert backfilled.ledger_seq == 1
+    with app.app_context():
+        assert (
+            db.session.get(BirdOwnershipCount, (1, False)).owners == User.query.count()
+        )
+
+
+def test_backfill_runs_once(client):
+    run_backfill()
+
+    output = run_backfill()
+
+    assert output.strip().splitlines() == ["✅ Backfill complete"]
+
+
+def test_backfill_only_adds_missing_streaks(client, user):
+    for habit_id in (1, 2):
+        client.post("/api/complete-habit", json={"habit_id": habit_id})
+    user_id = user().id
+    with app.app_context():
+        db.session.get(HabitStreak, (user_id, 1, False)).longest = 7
+        db.session.delete(db.session.get(HabitStreak, (user_id, 2, False)))
+        db.session.commit()
+
+    output = run_backfill()
+
+    assert "Built streaks for 1 habits" in output
+    with app.app_context():
+        assert db.session.get(HabitStreak, (user_id, 1, False)).longest == 7
+        rebuilt = db.session.get(HabitStreak, (user_id, 2, False))
+        assert (rebuilt.current, rebuilt.longest) == (1, 1)
+
+
+def test_legendary_grant_opens_ledger_first(client, monkeypatch):
+    with app.app_context():
+        found = find_user(username=client.username)
+        found.ledger_seq = None
+        found.xp, found.level, found.seeds = 30, 2, 40
+        db.session.commit()
+        user_id = found.id
+
+    monkeypatch.setattr(CreateLegendaryAccount, "USERNAME", client.username)
+    CreateLegendaryAccount.create_god_account()
+
+    with app.app_context():
+        granted = db.session.get(User, user_id)
+        assert granted.ledger_seq == 2
+        assert ledger_balances(db.session, [user_id])[user_id] == (
+            granted.xp,
+            granted.level,
+            granted.seeds,
+        )
@@ -0,0 +1,64 @@
+import pytest
+
+from app import (
+    AVAILABLE_BIRDS,
+    RARITY_PRICES,
+    BirdOwnershipCount,
+    OwnedBird,
+    app,
+    find_user,
+)
+
+BAD_IDS = [-1, 0, 10**6, 2**70, "3", 3.0, True, None, [3]]
+
+
+def owned_birds(username):
+    with app.app_context():
+        user = find_user(username=username)
+        return sorted(
+            (row.bird_id, row.is_shiny)
+            for row in OwnedBird.query.filter_by(user_id=user.id)
+        )
+
+
+def ownership_counts():
+    with app.app_context():
+        return {
+            (row.bird_id, row.is_shiny): row.owners for row in BirdOwnershipCount.query
+        }
+
+
+@pytest.mark.parametrize("bird_id", BAD_IDS)
+def test_buy_rejects_unknown_bird_ids(client, user, set_seeds, bird_id):
+    set_seeds(1000)
+    before = user()
+    counts = ownership_counts()
+
+    result = client.post("/api/buy-bird", json={"bird_id": bird_id}).get_json()
+
+    assert result == {"success": False, "message": "Bird not found"}
+    after = user()
+    assert after.seeds == 1000
+    assert after.owned_bits == before.owned_bits
+    assert after.ledger_seq == before.ledger_seq
+    assert owned_birds(client.username) == [(1, False)]
+    assert ownership_counts() == counts
+
+
+@pytest.mark.parametrize("bird_id", BAD_IDS)
+def test_equip_rejects_unknown_bird_ids(client, user, bird_id):
+    result = client.post("/api/equip-bird", json={"bird_id": bird_id}).get_json()
+
+    assert result == {"success": False, "message": "Bird not found"}
+    assert user().current_bird_id == 1
+
+
+def test_buy_known_bird(client, user, set_seeds):
+    bird = next(b for b in AVAILABLE_BIRDS if b["id"] == 2)
+    set_seeds(RARITY_PRICES[bird["rarity"]])
+
+    result = client.post("/api/buy-bird", json={"bird_id": 2}).get_json()
+
+    assert result["success"]
+    assert user().seeds == 0
+    assert (2, result["is_shiny"]) in owned_birds(client.username)
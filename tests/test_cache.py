@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from cache import Cache, LocalRedis, MemoryBackend, RedisBackend
+
+
+def backends():
+    return [MemoryBackend(), RedisBackend(LocalRedis())]
+
+
+def test_write_route_makes_next_read_fresh(client):
+    # Cached by the first read...
+    habits = client.get("/api/dashboard").get_json()["habits"]
+    assert "Stretch" not in [habit["name"] for habit in habits]
+
+    # ...and bumped by the write
+    client.post("/api/add-habit", json={"name": "Stretch", "xp": 20})
+
+    habits = client.get("/api/dashboard").get_json()["habits"]
+    assert "Stretch" in [habit["name"] for habit in habits]
+
+
+@pytest.mark.parametrize("backend", backends())
+def test_bump_invalidates_only_its_scope(backend):
+    cache = Cache(backend)
+    cache.get_or_compute("habits", "list", lambda: "a1", scope=1)
+    cache.get_or_compute("habits", "list", lambda: "b1", scope=2)
+
+    cache.bump("habits", 1)
+
+    assert cache.get_or_compute("habits", "list", lambda: "a2", scope=1) == "a2"
+    assert cache.get_or_compute("habits", "list", lambda: "b2", scope=2) == "b1"
+
+
+@pytest.mark.parametrize("backend", backends())
+def test_missing_version_stamp_does_not_revive_old_entries(backend):
+    cache = Cache(backend)
+    assert cache.get_or_compute("habits", "list", lambda: "old", scope=1) == "old"
+
+    # The stamp is evicted while the entry it versioned is still there
+    backend.delete(cache._version_key("habits", 1))
+
+    assert cache.peek("habits", "list", scope=1) is None
+    assert cache.get_or_compute("habits", "list", lambda: "new", scope=1) == "new"
+
+
+def run_concurrently(caches, compute, threads=8):
+    results = []
+    start = threading.Barrier(threads)
+
+    def read(cache):
+        start.wait()
+        results.append(cache.get_or_compute("board", "top", compute))
+
+    workers = [
+        threading.Thread(target=read, args=(caches[i % len(caches)],))
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+@pytest.mark.parametrize("backend", backends())
+def test_concurrent_misses_compute_once(backend):
+    cache = Cache(backend)
+    computes = []
+
+    def compute():
+        computes.append(1)
+        time.sleep(0.1)
+        return "board"
+
+    results = run_concurrently([cache], compute)
+
+    assert results == ["board"] * 8
+    assert len(computes) == 1
+    counters = cache.metrics()["namespaces"]["board"]
+    assert counters["computes"] == 1
+    assert counters["waits"] == 7
+
+
+def test_concurrent_misses_across_workers_compute_once():
+    # Two workers' caches over one shared Redis
+    shared = LocalRedis()
+    caches = [Cache(RedisBackend(shared)), Cache(RedisBackend(shared))]
+    computes = []
+
+    def compute():
+        computes.append(1)
+        time.sleep(0.1)
+        return "board"
+
+    results = run_concurrently(caches, compute)
+
+    assert results == ["board"] * 8
+    assert len(computes) == 1
@@ -0,0 +1,29 @@
+from app import app
+
+
+def test_dashboard_sends_signed_out_visitors_to_login():
+    response = app.test_client().get("/dashboard")
+
+    assert response.status_code == 302
+    assert "/login" in response.headers["Location"]
+
+
+def test_dashboard_shell_is_private(client):
+    response = client.get("/dashboard")
+
+    assert response.status_code == 200
+    assert "private" in response.headers["Cache-Control"]
+    assert "public" not in response.headers["Cache-Control"]
+    assert "Cookie" in response.headers["Vary"]
+    html = response.get_data(as_text=True)
+    assert "Logout" in html
+    assert client.username not in html
+
+
+def test_signed_out_pages_show_the_signed_out_navigation(client):
+    # Rendering the shell must not leave a signed-in layout behind
+    client.get("/dashboard")
+
+    html = app.test_client().get("/login").get_data(as_text=True)
+
+    assert "Logout" not in html
@@ -0,0 +1,64 @@
+from functools import partial
+
+import pytest
+
+from app import (
+    CompletedHabit,
+    User,
+    _complete_habit_job,
+    apply_habit_completion,
+    app,
+    group_commit_session,
+)
+from group_commit import GroupCommitter
+
+
+def committer():
+    # A long delay so every job submitted below lands in one batch
+    return GroupCommitter(partial(group_commit_session, None), max_delay=0.5)
+
+
+def completions(user_id):
+    with app.app_context():
+        return sorted(
+            row.habit_id for row in CompletedHabit.query.filter_by(user_id=user_id)
+        )
+
+
+def test_concurrent_jobs_share_a_commit(user):
+    user_id = user().id
+    group = committer()
+
+    futures = [group.submit(_complete_habit_job, user_id, h, False) for h in (1, 2, 3)]
+
+    assert all(future.result(timeout=5)["success"] for future in futures)
+    assert completions(user_id) == [1, 2, 3]
+    stats = group.metrics()
+    assert (stats["jobs"], stats["batches"], stats["largest_batch"]) == (3, 1, 3)
+    assert stats["retried_batches"] == 0
+
+
+def failing_job(session, user_id):
+    # Writes, then fails: none of it may reach the database
+    user = session.get(User, user_id)
+    apply_habit_completion(session, user, 4, False)
+    raise RuntimeError("job failed")
+
+
+def test_failing_job_does_not_fail_its_batch(user):
+    user_id = user().id
+    group = committer()
+
+    first = group.submit(_complete_habit_job, user_id, 1, False)
+    failing = group.submit(failing_job, user_id)
+    others = [group.submit(_complete_habit_job, user_id, h, False) for h in (2, 3)]
+
+    assert first.result(timeout=5)["success"]
+    assert all(future.result(timeout=5)["success"] for future in others)
+    with pytest.raises(RuntimeError, match="job failed"):
+        failing.result(timeout=5)
+    assert completions(user_id) == [1, 2, 3]
+    stats = group.metrics()
+    assert stats["retried_batches"] == 1
+    # The three good jobs were committed one at a time after the retry
+    assert (stats["jobs"], stats["batches"]) == (3, 3)
@@ -0,0 +1,51 @@
+from conftest import register
+
+from app import app, db, find_user, group_rank, group_top
+
+
+def set_score(username, level, xp):
+    with app.app_context():
+        found = find_user(username=username)
+        found.level, found.xp = level, xp
+        db.session.commit()
+
+
+def test_group_leaderboard_ranks_ties_and_viewer(client):
+    group = client.post("/api/create-group", json={"name": "Class 4B"}).get_json()
+    code, group_id = group["group"]["join_code"], group["group"]["id"]
+
+    scores = {"ana": (3, 50), "bo": (3, 50), "cy": (2, 90), client.username: (1, 10)}
+    for name in ("ana", "bo", "cy"):
+        other = app.test_client()
+        register(other, f"{name}-{group_id}")
+        assert other.post("/api/join-group", json={"join_code": code}).get_json()[
+            "success"
+        ]
+    for name, (level, xp) in scores.items():
+        set_score(name if name == client.username else f"{name}-{group_id}", level, xp)
+
+    board = client.get(f"/api/group-leaderboard?group_id={group_id}").get_json()
+    assert board["members"] == 4
+    assert [(row["rank"], row["xp"]) for row in board["leaderboard"]] == [
+        (1, 50),
+        (1, 50),
+        (3, 90),
+        (4, 10),
+    ]
+    assert board["rank"] == 4
+
+    with app.app_context():
+        top = group_top(db.session, group_id, limit=2)
+        assert [rank for rank, _ in top] == [1, 1]
+        cy = find_user(username=f"cy-{group_id}")
+        assert group_rank(db.session, group_id, cy) == 3
+
+
+def test_group_leaderboard_needs_membership(client):
+    other = app.test_client()
+    register(other, "outsider")
+    group = other.post("/api/create-group", json={"name": "Closed"}).get_json()
+    board = client.get(
+        f"/api/group-leaderboard?group_id={group['group']['id']}"
+    ).get_json()
+    assert board == {"success": False, "message": "Group not found"}
@@ -0,0 +1,137 @@
+import json
+from datetime import datetime, timedelta
+
+from conftest import register
+
+from app import (
+    CompletedHabit,
+    CompletionArchive,
+    HabitStreak,
+    LedgerEntry,
+    app,
+    compact_completions,
+    completions_by_day,
+    db,
+    rebuild_habit_streaks,
+)
+
+
+def add_habit(client, name="Stretch", xp=25):
+    result = client.post("/api/add-habit", json={"name": name, "xp": xp}).get_json()
+    return result["habit"]["id"]
+
+
+def complete(client, habit_id):
+    return client.post(
+        "/api/complete-habit", json={"habit_id": habit_id, "is_custom": True}
+    ).get_json()
+
+
+def history(user_id):
+    with app.app_context():
+        return (
+            CompletedHabit.query.filter_by(user_id=user_id).count(),
+            HabitStreak.query.filter_by(user_id=user_id).count(),
+            LedgerEntry.query.filter_by(user_id=user_id).count(),
+        )
+
+
+def test_complete_custom_habit(client, user):
+    habit_id = add_habit(client)
+
+    result = complete(client, habit_id)
+
+    assert result["success"]
+    assert result["xp_earned"] == 25
+    assert history(user().id) == (1, 1, 1)
+
+
+def test_deleted_custom_habit_is_not_completed(client, user):
+    habit_id = add_habit(client)
+    client.post("/api/delete-habit", json={"habit_id": habit_id})
+    before = user()
+
+    result = complete(client, habit_id)
+
+    assert result == {"success": False, "message": "Habit not found"}
+    after = user()
+    assert (after.xp, after.level, after.streak) == (
+        before.xp,
+        before.level,
+        before.streak,
+    )
+    assert history(after.id) == (0, 0, 0)
+
+
+def test_missing_custom_habit_is_not_completed(client, user):
+    result = complete(client, "custom_999999")
+
+    assert result == {"success": False, "message": "Habit not found"}
+    assert history(user().id) == (0, 0, 0)
+
+
+def test_someone_elses_custom_habit_is_not_completed(client, user):
+    other = app.test_client()
+    register(other, f"{client.username}_other")
+    habit_id = add_habit(other)
+
+    result = complete(client, habit_id)
+
+    assert result == {"success": False, "message": "Habit not found"}
+    assert history(user().id) == (0, 0, 0)
+
+
+def test_compaction_keeps_history_streaks_and_export(client, user):
+    custom_id = int(add_habit(client).removeprefix("custom_"))
+    user_id = user().id
+    today = datetime.utcnow().date()
+    # A run longer than a year, gaps, and days recent enough to stay rows
+    done = {
+        (1, False): [today - timedelta(days=n) for n in range(120, 380)],
+        (2, False): [today - timedelta(days=n) for n in (400, 399, 200, 10, 1)],
+        (custom_id, True): [today - timedelta(days=n) for n in range(0, 150)],
+    }
+    with app.app_context():
+        for (habit_id, is_custom), days in done.items():
+            for day in days:
+                db.session.add(
+                    CompletedHabit(
+                        user_id=user_id,
+                        habit_id=habit_id,
+                        is_custom=is_custom,
+                        date=day,
+                        completed_at=datetime.combine(day, datetime.min.time()),
+                    )
+                )
+        db.session.commit()
+
+    def snapshot():
+        with app.app_context():
+            by_day = completions_by_day(db.session, user_id)
+            per_habit = {
+                habit: completions_by_day(db.session, user_id, habit=habit)
+                for habit in done
+            }
+            list(rebuild_habit_streaks(db.session))
+            streaks = {
+                (s.habit_id, s.is_custom): (s.current, s.longest, s.last_date)
+                for s in HabitStreak.query.filter_by(user_id=user_id)
+            }
+        lines = client.get("/api/export").get_data(as_text=True).splitlines()
+        exported = sorted(
+            (r["habit_id"], r["is_custom"], r["date"])
+            for r in map(json.loads, lines)
+            if r["type"] == "completion"
+        )
+        return by_day, per_habit, streaks, exported
+
+    before = snapshot()
+    with app.app_context():
+        moved = sum(compact_completions(db.session, today - timedelta(days=90), 50))
+        archives = CompletionArchive.query.filter_by(user_id=user_id).count()
+    after = snapshot()
+
+    assert moved == 260 + 3 + 59
+    assert archives >= 3
+    assert history(user_id)[0] == 2 + 91
+    assert after == before
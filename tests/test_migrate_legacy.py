@@ -0,0 +1,182 @@
+import itertools
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, insert
+
+import migrate_legacy
+import models
+from app import CompletedHabit, CustomHabit, LedgerEntry, OwnedBird, User, app, db
+
+_prefixes = itertools.count(1)
+
+
+@pytest.fixture
+def legacy(tmp_path):
+    """A small models.py database; returns (url, username prefix)."""
+    prefix = f"legacy{next(_prefixes)}_"
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    engine = create_engine(url)
+    models.db.metadata.create_all(engine)
+    tables = models.db.metadata.tables
+    day = datetime(2024, 3, 1, 9)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(tables["birds"]),
+            [
+                {"id": 1, "name": "Pigeon", "image_url": "x", "base_cost": 10},
+                {
+                    "id": 2,
+                    "name": "Owl",
+                    "image_url": "x",
+                    "rarity": "rare",
+                    "base_cost": 60,
+                },
+            ],
+        )
+        connection.execute(
+            insert(tables["users"]),
+            [
+                {
+                    "id": n,
+                    "username": f"{prefix}{n}",
+                    "email": f"{prefix}{n}@x",
+                    "password_hash": "x",
+                    "xp": 10 * n,
+                    "level": n,
+                    "seeds": 5 * n,
+                }
+                for n in range(1, 6)
+            ],
+        )
+        connection.execute(
+            insert(tables["tasks"]),
+            [
+                {"id": n, "user_id": n, "name": f"Task {n}", "xp_reward": 20}
+                for n in range(1, 6)
+            ],
+        )
+        connection.execute(
+            insert(tables["task_logs"]),
+            [
+                {"user_id": n, "task_id": n, "completed_at": day + timedelta(days=d)}
+                for n in range(1, 6)
+                for d in range(3)
+            ],
+        )
+        connection.execute(
+            insert(tables["user_birds"]),
+            [
+                {
+                    "user_id": n,
+                    "bird_id": 1 + n % 2,
+                    "rarity": "common",
+                    "is_shiny": n == 3,
+                }
+                for n in range(1, 6)
+            ],
+        )
+    # Checkpoints and the id map belong to one source; start clean
+    with app.app_context():
+        migrate_legacy.state.drop_all(db.engine)
+    return url, prefix
+
+
+def migrate(url, monkeypatch, batch_size=2):
+    monkeypatch.setattr(
+        sys, "argv", ["migrate_legacy.py", url, "--batch-size", str(batch_size)]
+    )
+    migrate_legacy.main()
+
+
+def migrated(prefix):
+    with app.app_context():
+        users = User.query.filter(User.username.startswith(prefix)).all()
+        ids = [user.id for user in users]
+        return {
+            "users": sorted((u.username, u.xp, u.level, u.seeds) for u in users),
+            "habits": CustomHabit.query.filter(CustomHabit.user_id.in_(ids)).count(),
+            "completions": CompletedHabit.query.filter(
+                CompletedHabit.user_id.in_(ids)
+            ).count(),
+            "birds": OwnedBird.query.filter(OwnedBird.user_id.in_(ids)).count(),
+            "ledger": LedgerEntry.query.filter(LedgerEntry.user_id.in_(ids)).count(),
+        }
+
+
+# Each user also gets the starter bird, as nobody had one equipped
+EXPECTED_COUNTS = {"habits": 5, "completions": 15, "birds": 10, "ledger": 5}
+
+
+def test_migration_copies_and_checks_balances(legacy, monkeypatch, capsys):
+    url, prefix = legacy
+
+    migrate(url, monkeypatch)
+
+    output = capsys.readouterr().out
+    assert "balances: 5 users checked, 0 mismatched" in output
+    assert "✅ Migration complete" in output
+    result = migrated(prefix)
+    assert result["users"] == [(f"{prefix}{n}", 10 * n, n, 5 * n) for n in range(1, 6)]
+    assert {k: result[k] for k in EXPECTED_COUNTS} == EXPECTED_COUNTS
+
+
+def test_balance_mismatch_fails_the_migration(legacy, monkeypatch, capsys):
+    url, prefix = legacy
+    migrate(url, monkeypatch)
+    with app.app_context():
+        user = User.query.filter_by(username=f"{prefix}2").one()
+        user.seeds += 1
+        db.session.commit()
+
+    with pytest.raises(SystemExit):
+        migrate(url, monkeypatch)
+
+    assert "balances: 5 users checked, 1 mismatched" in capsys.readouterr().out
+
+
+def test_rerun_after_completed_migration_is_a_no_op(legacy, monkeypatch, capsys):
+    url, prefix = legacy
+    migrate(url, monkeypatch)
+    before = migrated(prefix)
+    capsys.readouterr()
+
+    migrate(url, monkeypatch)
+
+    assert migrated(prefix) == before
+    output = capsys.readouterr().out
+    # Every step starts past the last checkpoint, so no batch runs
+    assert "copied, " not in output
+    assert "✅ Migration complete" in output
+
+
+def test_interrupted_migration_resumes_from_its_checkpoint(legacy, monkeypatch):
+    url, prefix = legacy
+    copy_task_logs = migrate_legacy.copy_task_logs
+    batches = itertools.count()
+
+    def fail_on_third_batch(session, rows, skipped):
+        if next(batches) == 2:
+            raise RuntimeError("killed")
+        return copy_task_logs(session, rows, skipped)
+
+    monkeypatch.setattr(migrate_legacy, "copy_task_logs", fail_on_third_batch)
+    with pytest.raises(RuntimeError, match="killed"):
+        migrate(url, monkeypatch)
+    with app.app_context():
+        db.session.rollback()
+    # Two committed batches of two task logs made it
+    assert migrated(prefix)["completions"] == 4
+
+    monkeypatch.setattr(migrate_legacy, "copy_task_logs", copy_task_logs)
+    migrate(url, monkeypatch)
+
+    result = migrated(prefix)
+    assert len(result["users"]) == 5
+    assert {k: result[k] for k in EXPECTED_COUNTS} == EXPECTED_COUNTS
+    with app.app_context():
+        mapped = db.session.execute(
+            db.select(db.func.count()).select_from(migrate_legacy.id_map)
+        ).scalar()
+    assert mapped == 10  # 5 users and 5 tasks, each mapped once
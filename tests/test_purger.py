@@ -0,0 +1,75 @@
+import threading
+from datetime import datetime
+
+from app import (
+    CompletedHabit,
+    CustomHabit,
+    _run_purge_pass,
+    app,
+    db,
+)
+from purger import Purger
+
+
+def counting_purger(interval=None):
+    passes = threading.Semaphore(0)
+    return Purger(lambda progress: passes.release(), interval=interval), passes
+
+
+def test_start_runs_a_pass_without_a_wake():
+    purger, passes = counting_purger()
+
+    purger.start()
+
+    assert passes.acquire(timeout=5)
+
+
+def test_start_is_a_no_op_once_running():
+    purger, passes = counting_purger()
+    purger.start()
+    assert passes.acquire(timeout=5)
+
+    purger.start()
+
+    assert not passes.acquire(timeout=0.2)
+
+
+def test_passes_repeat_every_interval():
+    purger, passes = counting_purger(interval=0.05)
+
+    purger.start()
+
+    for _ in range(3):
+        assert passes.acquire(timeout=5)
+
+
+def test_started_purger_sweeps_deletes_from_before_it_started(user):
+    # A delete whose worker went away before purging it
+    user_id = user().id
+    with app.app_context():
+        habit = CustomHabit(
+            user_id=user_id, name="Old", xp=10, deleted_at=datetime.utcnow()
+        )
+        db.session.add(habit)
+        db.session.flush()
+        db.session.add(
+            CompletedHabit(
+                user_id=user_id,
+                habit_id=habit.id,
+                is_custom=True,
+                date=datetime.utcnow().date(),
+            )
+        )
+        db.session.commit()
+        habit_id = habit.id
+
+    done = threading.Event()
+    purger = Purger(lambda progress: (_run_purge_pass(progress), done.set()))
+    purger.start()
+
+    assert done.wait(timeout=5)
+    with app.app_context():
+        assert db.session.get(CustomHabit, habit_id) is None
+        assert not CompletedHabit.query.filter_by(
+            user_id=user_id, habit_id=habit_id, is_custom=True
+        ).count()
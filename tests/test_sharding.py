@@ -0,0 +1,135 @@
+"""Sharded runs. app.py reads SHARDS on import, so each runs in its own
+interpreter with the environment set first."""
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROUND_TRIP = """
+import json
+from app import app, db, find_user, shard_of
+
+def register(client, username):
+    client.post("/register", data={"username": username,
+        "email": f"{username}@example.com", "password": "password",
+        "confirm_password": "password"})
+    client.post("/login", data={"username": username, "password": "password"})
+
+results = {}
+for username in ("ann", "ben", "cat", "dan"):
+    client = app.test_client()
+    register(client, username)
+    habit = client.post("/api/add-habit", json={"name": "Walk", "xp": 25})
+    habit_id = habit.get_json()["habit"]["id"]
+    done = client.post("/api/complete-habit",
+        json={"habit_id": habit_id, "is_custom": True}).get_json()
+    client.get("/logout")
+    again = client.post("/login", data={"username": username,
+        "password": "password"}, follow_redirects=True)
+    stats = client.get("/api/stats").get_json()
+    with app.app_context():
+        shard = shard_of(find_user(username=username).id)
+    results[username] = {"completed": done["success"], "shard": shard,
+        "login": again.status_code, "xp": stats["total_xp"]}
+board = app.test_client().get("/leaderboard").get_data(as_text=True)
+print(json.dumps({"users": results,
+    "on_board": [name for name in results if name in board]}))
+"""
+
+POPULATE = """
+from app import app, db, CustomHabit
+
+for n in range(1, 6):
+    client = app.test_client()
+    client.post("/register", data={"username": f"user{n}",
+        "email": f"user{n}@example.com", "password": "password",
+        "confirm_password": "password"})
+    client.post("/login", data={"username": f"user{n}", "password": "password"})
+    for name in (f"Read {n}", f"Run {n}"):
+        habit_id = client.post("/api/add-habit",
+            json={"name": name, "xp": 10}).get_json()["habit"]["id"]
+        client.post("/api/complete-habit",
+            json={"habit_id": habit_id, "is_custom": True})
+"""
+
+
+def run(args, tmp_path, shards=0):
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{tmp_path / 'global.db'}",
+        "SHARDS": str(shards),
+        "SHARD_URL_TEMPLATE": f"sqlite:///{tmp_path}/{{shard}}.db",
+        "SECRET_KEY": "tests",
+        "ADMISSION_CONTROL": "0",
+        "GROUP_COMMIT": "0",
+    }
+    result = subprocess.run(
+        [sys.executable, *args],
+        cwd=PROJECT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+
+def test_round_trip_across_shards(tmp_path):
+    output = run(["-c", ROUND_TRIP], tmp_path, shards=2)
+    results = json.loads(output.strip().splitlines()[-1])
+
+    users = results["users"]
+    assert {user["shard"] for user in users.values()} == {"shard0", "shard1"}
+    assert all(user["completed"] for user in users.values())
+    assert all(user["login"] == 200 for user in users.values())
+    assert all(user["xp"] == 25 for user in users.values())
+    assert sorted(results["on_board"]) == sorted(users)
+
+
+def custom_completions(path):
+    """(username, habit name) of each completion of a custom habit."""
+    with sqlite3.connect(path) as connection:
+        return connection.execute(
+            "select user.username, custom_habit.name from completed_habit"
+            " join user on user.id = completed_habit.user_id"
+            " join custom_habit on custom_habit.id = completed_habit.habit_id"
+            " and custom_habit.user_id = completed_habit.user_id"
+            " where completed_habit.is_custom"
+        ).fetchall()
+
+
+def count(path, table):
+    with sqlite3.connect(path) as connection:
+        return connection.execute(f"select count(*) from {table}").fetchone()[0]
+
+
+def test_reshard_splits_rows_and_rewrites_habit_ids(tmp_path):
+    run(["-c", POPULATE], tmp_path)
+    source = tmp_path / "global.db"
+    before = sorted(custom_completions(source))
+    assert len(before) == 10
+
+    output = run(
+        [
+            "reshard.py",
+            "--shards",
+            "2",
+            "--url-template",
+            f"sqlite:///{tmp_path}/new-{{shard}}.db",
+        ],
+        tmp_path,
+    )
+
+    assert "Resharding complete" in output
+    shards = [tmp_path / f"new-shard{i}.db" for i in range(2)]
+    for table in ("user", "custom_habit", "completed_habit", "ledger_entry"):
+        assert sum(count(shard, table) for shard in shards) == count(source, table)
+    assert all(count(shard, "user") for shard in shards)
+    # Each shard numbers its custom habits from 1, and completions follow
+    assert sorted(sum((custom_completions(shard) for shard in shards), [])) == before
+    assert count(source, "user_directory") == 5